@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import TranscriptionJob
+
+
+@admin.register(TranscriptionJob)
+class TranscriptionJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "priority", "status", "session_id", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    search_fields = ("id", "session_id")
@@ -0,0 +1,117 @@
+"""Control de admisión de los parciales de Whisper en tiempo real.
+
+Cada parcial decodifica todo el audio aún no confirmado de la sesión, así que
+uno nuevo deja obsoletos a los que siguen esperando. Por sesión solo se ejecuta
+un parcial a la vez y, si llega otro mientras espera, el anterior se descarta
+(*coalesced*) sin decodificar. Además hay un tope global de parciales en curso
+por proceso: si no se consigue lugar en ``QUEUE_TIMEOUT_MS`` la petición se
+descarta (*shed*). En ambos casos el llamador devuelve el último parcial conocido.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+ADMITTED = "admitted"
+COALESCED = "coalesced"
+SHED = "shed"
+
+OUTCOMES = metrics.REGISTRY.register(metrics.Counter(
+    "asr_admission_total", "Parciales admitidos, reemplazados por uno más nuevo (coalesced) o descartados (shed).",
+    labels=("outcome",),
+))
+
+
+def _config():
+    return getattr(settings, "ASR_ADMISSION", {})
+
+
+def enabled():
+    return _config().get("ENABLED", True)
+
+
+class AdmissionController:
+    """Tope global de ejecuciones y una sola ejecución (la más nueva) por sesión."""
+
+    def __init__(self, max_inflight=2, queue_timeout=1.5):
+        self.max_inflight = max(1, max_inflight)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._inflight = 0
+        # session_id -> {"ticket": último pedido, "busy": en ejecución, "waiting": pedidos esperando}
+        self._sessions = {}
+        self._counts = {ADMITTED: 0, COALESCED: 0, SHED: 0}
+
+    def run(self, session_id, func, *args, **kwargs):
+        """Ejecuta ``func`` si se admite. Devuelve ``(resultado o None, outcome)``."""
+        with self._cond:
+            entry = self._sessions.setdefault(session_id, {"ticket": 0, "busy": False, "waiting": 0})
+            entry["ticket"] += 1
+            ticket = entry["ticket"]
+            entry["waiting"] += 1
+            self._cond.notify_all()  # los pedidos anteriores de la sesión quedan obsoletos
+            deadline = time.monotonic() + self.queue_timeout
+            while True:
+                if entry["ticket"] != ticket:
+                    outcome = COALESCED
+                    break
+                if not entry["busy"] and self._inflight < self.max_inflight:
+                    outcome = ADMITTED
+                    entry["busy"] = True
+                    self._inflight += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = SHED
+                    break
+                self._cond.wait(remaining)
+            entry["waiting"] -= 1
+            self._count(outcome)
+            if outcome != ADMITTED:
+                self._forget(session_id, entry)
+                return None, outcome
+
+        try:
+            return func(*args, **kwargs), outcome
+        finally:
+            with self._cond:
+                entry["busy"] = False
+                self._inflight -= 1
+                self._forget(session_id, entry)
+                self._cond.notify_all()
+
+    def _forget(self, session_id, entry):
+        if not entry["busy"] and not entry["waiting"] and self._sessions.get(session_id) is entry:
+            del self._sessions[session_id]
+
+    def _count(self, outcome):
+        self._counts[outcome] += 1
+        OUTCOMES.inc(outcome=outcome)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": self._inflight,
+                "waiting": sum(entry["waiting"] for entry in self._sessions.values()),
+                **self._counts,
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """Controlador del proceso, configurado con ``ASR_ADMISSION``."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            config = _config()
+            _controller = AdmissionController(
+                max_inflight=config.get("MAX_INFLIGHT", 2),
+                queue_timeout=config.get("QUEUE_TIMEOUT_MS", 1500) / 1000,
+            )
+        return _controller
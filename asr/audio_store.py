@@ -0,0 +1,116 @@
+"""Almacen de audio por sesion: un WAV PCM 16 kHz mono de solo anexado.
+
+El archivo es un WAV valido (cabecera de 44 bytes + muestras int16), asi que
+cualquier herramienta puede leerlo, pero se escribe solo agregando muestras al
+final y se lee con ``numpy.memmap`` sin decodificar todo el historial.
+"""
+import os
+import struct
+
+import numpy as np
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+HEADER_SIZE = 44
+_MAX_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+def _header(num_samples, sample_rate=SAMPLE_RATE):
+    data_size = min(num_samples * SAMPLE_WIDTH, _MAX_DATA_SIZE)
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * SAMPLE_WIDTH, SAMPLE_WIDTH, 16,
+        b"data", data_size,
+    )
+
+
+def to_pcm16(samples):
+    """Convierte muestras float32 en [-1, 1] (o int16) a int16."""
+    samples = np.asarray(samples)
+    if samples.dtype == np.int16:
+        return samples
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+def is_session_wav(path):
+    """Indica si ``path`` es un WAV con el formato del almacen (16 kHz, mono, int16)."""
+    try:
+        with open(path, "rb") as handle:
+            head = handle.read(HEADER_SIZE)
+    except OSError:
+        return False
+    if len(head) < HEADER_SIZE:
+        return False
+    expected = _header(0)
+    # Se ignoran los campos de tamaño (bytes 4-8 y 40-44)
+    return head[:4] == expected[:4] and head[8:40] == expected[8:40]
+
+
+def num_samples(path):
+    """Cantidad de muestras guardadas (se deriva del tamaño del archivo, no de la cabecera)."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    return max(0, size - HEADER_SIZE) // SAMPLE_WIDTH
+
+
+def duration_ms(path):
+    return num_samples(path) * 1000 // SAMPLE_RATE
+
+
+def append_samples(path, samples):
+    """Agrega muestras al final del archivo y actualiza la cabecera. Devuelve el total."""
+    pcm = to_pcm16(samples)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with metrics.stage("disk_write"), os.fdopen(fd, "r+b") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            size = handle.seek(0, os.SEEK_END)
+            if size < HEADER_SIZE:
+                handle.seek(0)
+                handle.truncate()
+                handle.write(_header(0))
+            handle.write(pcm.tobytes())
+            total = (handle.tell() - HEADER_SIZE) // SAMPLE_WIDTH
+            handle.seek(0)
+            handle.write(_header(total))
+            handle.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    return total
+
+
+def write_samples(path, samples):
+    """Crea (o reemplaza) un archivo del almacen con las muestras dadas."""
+    if os.path.exists(path):
+        os.remove(path)
+    return append_samples(path, samples)
+
+
+def read_view(path, start=0, stop=None):
+    """Vista int16 (memmap, sin copia) de las muestras ``[start:stop]``."""
+    total = num_samples(path)
+    stop = total if stop is None else min(stop, total)
+    start = max(0, min(start, stop))
+    if stop == start:
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(
+        path, dtype=np.int16, mode="r",
+        offset=HEADER_SIZE + start * SAMPLE_WIDTH, shape=(stop - start,),
+    )
+
+
+def read_float(path, start=0, stop=None):
+    """Copia float32 normalizada solo de la ventana ``[start:stop]``."""
+    return read_view(path, start, stop).astype(np.float32) / 32768.0
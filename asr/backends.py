@@ -0,0 +1,247 @@
+"""Backends de inferencia de Whisper (``ASR_BACKEND`` o ``ASR_MODELS[name]["BACKEND"]``).
+
+* ``eager``: PyTorch tal cual.
+* ``compile``: ``torch.compile`` del encoder y del decoder (formas dinámicas en el
+  decoder, que crece token a token).
+* ``torchscript``: encoder trazado con ``torch.jit.trace``.
+* ``onnx``: encoder exportado a ONNX y ejecutado con ONNX Runtime (opcional,
+  ``pip install onnxruntime``).
+
+En torchscript y onnx solo se reemplaza el encoder: la entrada siempre tiene la
+misma forma (log-mel de 30 s) y es la pasada más cara; el decoder con caché de
+claves/valores sigue en PyTorch. Al cargar se compara la salida del encoder y
+los tokens de una decodificación voraz contra eager; si no coinciden (o el
+backend no se puede construir) se usa eager y se informa en las estadísticas.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "compile", "torchscript", "onnx")
+# Tokens de la decodificación voraz usada para verificar la paridad
+PARITY_MAX_LENGTH = 32
+
+_info = {}
+_threads_configured = False
+_threads_lock = threading.Lock()
+
+
+def _config():
+    return getattr(settings, "ASR_BACKEND", {})
+
+
+def intra_op_threads():
+    """Hilos intra-op: los configurados o los núcleos repartidos entre los workers del proceso web.
+
+    Con servidor de modelo (``ASR_MODEL_SERVER["ADDRESS"]``) los workers web no
+    infieren, así que el servidor usa todos los núcleos.
+    """
+    configured = _config().get("INTRA_OP_THREADS", 0)
+    if configured:
+        return configured
+    cpus = os.cpu_count() or 1
+    serving = bool(getattr(settings, "ASR_MODEL_SERVER", {}).get("ADDRESS"))
+    workers = 1 if serving else max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+    return max(1, cpus // workers)
+
+
+def configure_threads(threads=None):
+    """Fija los hilos de PyTorch una sola vez por proceso, antes de la primera inferencia."""
+    global _threads_configured
+    import torch
+
+    with _threads_lock:
+        if _threads_configured:
+            return
+        _threads_configured = True
+        torch.set_num_threads(threads or intra_op_threads())
+        try:
+            torch.set_num_interop_threads(_config().get("INTER_OP_THREADS", 1))
+        except RuntimeError:
+            pass  # ya hubo trabajo en paralelo en este proceso; queda el valor anterior
+
+
+def backend_name(model_config):
+    name = model_config.get("BACKEND") or _config().get("BACKEND", "eager")
+    if name not in BACKENDS:
+        raise ValueError(f"backend de inferencia no soportado: {name} (opciones: {', '.join(BACKENDS)})")
+    return name
+
+
+def _encoder_wrapper(encoder, run):
+    """Encoder que ejecuta ``run(input_features) -> tensor`` y devuelve ``BaseModelOutput``.
+
+    Conserva ``conv1``/``conv2`` (``generate`` los consulta para calcular el stride)
+    y ``config`` del encoder original.
+    """
+    import torch
+    from transformers.modeling_outputs import BaseModelOutput
+
+    class WrappedEncoder(torch.nn.Module):
+        main_input_name = "input_features"
+
+        def __init__(self):
+            super().__init__()
+            self.config = encoder.config
+            self.conv1 = encoder.conv1
+            self.conv2 = encoder.conv2
+
+        def forward(self, input_features, **kwargs):
+            return BaseModelOutput(last_hidden_state=run(input_features))
+
+    return WrappedEncoder().eval()
+
+
+def _example_features(processor, batch_size=1):
+    """Log-mel de unos segundos de tonos con ruido (la entrada siempre se rellena a 30 s)."""
+    rng = np.random.default_rng(0)
+    t = np.arange(5 * 16000) / 16000
+    samples = [
+        (0.2 * np.sin(2 * np.pi * (150 + 50 * index) * t) + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+        for index in range(batch_size)
+    ]
+    return processor(samples, sampling_rate=16000, return_tensors="pt").input_features
+
+
+def _hidden_only(encoder):
+    import torch
+
+    class HiddenOnly(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_features):
+            return self.encoder(input_features, return_dict=True).last_hidden_state
+
+    return HiddenOnly().eval()
+
+
+def _torchscript_encoder(model, processor):
+    import torch
+
+    example = _example_features(processor).to(model.dtype)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(_hidden_only(model.get_encoder()), (example,)))
+
+    return _encoder_wrapper(model.get_encoder(), traced)
+
+
+def _onnx_encoder(model, processor, name):
+    import torch
+
+    try:
+        import onnxruntime
+    except ImportError as exc:
+        raise RuntimeError("el backend onnx necesita onnxruntime (pip install onnxruntime)") from exc
+
+    directory = _config().get("EXPORT_DIR") or os.path.join(settings.BASE_DIR, "exported")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}-encoder.onnx")
+    if not os.path.exists(path):
+        example = _example_features(processor).to(model.dtype)
+        torch.onnx.export(
+            _hidden_only(model.get_encoder()), (example,), path,
+            input_names=["input_features"], output_names=["last_hidden_state"],
+            dynamic_axes={"input_features": {0: "batch"}, "last_hidden_state": {0: "batch"}},
+            opset_version=17,
+        )
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads()
+    options.inter_op_num_threads = _config().get("INTER_OP_THREADS", 1)
+    session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def run(input_features):
+        features = input_features.detach().cpu().float().numpy()
+        hidden = session.run(["last_hidden_state"], {"input_features": features})[0]
+        return torch.from_numpy(np.ascontiguousarray(hidden)).to(model.dtype)
+
+    return _encoder_wrapper(model.get_encoder(), run)
+
+
+def _build(backend, model, processor, name):
+    """Reemplaza el encoder (y el decoder con ``compile``) del modelo."""
+    import torch
+
+    if backend == "compile":
+        model.model.encoder = torch.compile(model.model.encoder)
+        model.model.decoder = torch.compile(model.model.decoder, dynamic=True)
+    elif backend == "torchscript":
+        model.model.encoder = _torchscript_encoder(model, processor)
+    elif backend == "onnx":
+        model.model.encoder = _onnx_encoder(model, processor, name)
+
+
+def _greedy_ids(model, processor, features):
+    import torch
+
+    with torch.no_grad():
+        return model.generate(
+            features.to(model.dtype), language="spanish", task="transcribe",
+            num_beams=1, do_sample=False, max_length=PARITY_MAX_LENGTH,
+        ).tolist()
+
+
+def _reference(model, processor):
+    """Salida del encoder y tokens de eager para la entrada de prueba."""
+    import torch
+
+    features = _example_features(processor)
+    with torch.no_grad():
+        hidden = model.get_encoder()(features.to(model.dtype)).last_hidden_state.float()
+    return features, hidden, _greedy_ids(model, processor, features)
+
+
+def _parity(model, processor, reference):
+    import torch
+
+    features, hidden, ids = reference
+    with torch.no_grad():
+        candidate = model.get_encoder()(features.to(model.dtype)).last_hidden_state.float()
+    max_diff = float((candidate - hidden).abs().max())
+    return {
+        "encoder_max_abs_diff": round(max_diff, 6),
+        "tokens_match": _greedy_ids(model, processor, features) == ids,
+        "ok": max_diff <= _config().get("PARITY_TOLERANCE", 1e-3),
+    }
+
+
+def apply(model, processor, name, model_config):
+    """Prepara ``model`` con el backend configurado; vuelve a eager si falla la construcción o la paridad."""
+    configure_threads()
+    backend = backend_name(model_config)
+    info = _info[name] = {"backend": backend, "requested": backend, "threads": intra_op_threads()}
+    if backend == "eager":
+        return model
+
+    encoder, decoder = model.model.encoder, model.model.decoder
+    started = time.perf_counter()
+    try:
+        reference = _reference(model, processor) if _config().get("PARITY_CHECK", True) else None
+        _build(backend, model, processor, name)
+        if reference is not None:
+            info["parity"] = parity = _parity(model, processor, reference)
+            if not (parity["ok"] and parity["tokens_match"]):
+                raise RuntimeError(f"la salida no coincide con eager: {parity}")
+    except Exception as exc:
+        logger.warning("Backend %s no disponible para %s, se usa eager: %s", backend, name, exc)
+        model.model.encoder, model.model.decoder = encoder, decoder
+        info.update(backend="eager", error=f"{type(exc).__name__}: {exc}")
+    info["build_seconds"] = round(time.perf_counter() - started, 2)
+    return model
+
+
+def record_warmup(name, seconds):
+    if name in _info:
+        _info[name]["warmup_seconds"] = round(seconds, 2)
+
+
+def info(name):
+    """Backend en uso, hilos, paridad y tiempos de preparación de un modelo cargado."""
+    return dict(_info.get(name, {}))
@@ -0,0 +1,333 @@
+"""Benchmark offline de las etapas del pipeline.
+
+Mide la decodificación, ``save_chunk_file``, ``concat_session_to_wav``,
+``transcribir_whisper`` y ``transcribir_google`` sobre audio sintético y sobre
+archivos de ejemplo de varias duraciones. Por etapa y duración reporta latencia
+p50/p95, factor de tiempo real (latencia / duración del audio), RSS máximo y
+memoria asignada (``tracemalloc``). El reconocedor de Google es por defecto un
+stub local (no hace falta red), las sesiones van a un directorio propio y el
+caché de transcripciones no interviene. El RSS máximo solo se puede reiniciar
+entre etapas en Linux; en otros sistemas ``peak_rss_mb`` es ``null``. El
+resultado es un JSON que se puede comparar con el de otro commit
+(``manage.py asrbench --compare``).
+"""
+import io
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+import speech_recognition as sr
+from django.conf import settings
+
+from . import audio_store, cache, sessions, stream_decoder
+from .decode import decode_audio
+from .jobs import _percentile
+from .utils import (
+    concat_session_to_wav,
+    model_for_endpoint,
+    preload_whisper,
+    save_chunk_file,
+    session_num_samples,
+    transcribir_google,
+    transcribir_whisper,
+)
+
+SAMPLE_RATE = 16000
+STAGES = ("decode_wav", "decode_flac", "save_chunk", "concat", "whisper", "google")
+# Duración de cada chunk en la etapa save_chunk (como los del navegador)
+CHUNK_SECONDS = 1.0
+STUB_TEXT = "texto de prueba"
+
+
+def synthetic_audio(seconds, seed=0):
+    """Audio parecido a voz: tonos con armónicos modulados en sílabas, pausas y ruido de fondo."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    # 0.5 s de silencio cada 3 s para que el VAD encuentre varias regiones
+    pauses = (t % 3.0) < 2.5
+    samples = 0.3 * voiced * syllables * pauses + 0.003 * rng.standard_normal(len(t))
+    return samples.astype(np.float32)
+
+
+def load_fixture(path):
+    """``(muestras a 16 kHz, bytes originales)`` de un archivo de ejemplo."""
+    with open(path, "rb") as handle:
+        data = handle.read()
+    return decode_audio(io.BytesIO(data)), data
+
+
+def _encode(samples, fmt):
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, SAMPLE_RATE, format=fmt, subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def _peak_rss_mb():
+    """RSS máximo (MB) desde el último reinicio del contador."""
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _reset_peak_rss():
+    """Reinicia el RSS máximo; ``False`` si no se puede (fuera de Linux el pico es el del proceso)."""
+    try:
+        # Linux: escribir 5 en clear_refs reinicia VmHWM
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class StubRecognizer(sr.Recognizer):
+    """Reconocedor sin red: ``recognize_google`` devuelve un texto fijo tras ``latency`` segundos."""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    def recognize_google(self, audio_data, *args, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return STUB_TEXT
+
+
+def _chunks(data, seconds):
+    """Divide los bytes en ``ceil(seconds / CHUNK_SECONDS)`` partes, como un stream por partes."""
+    count = max(1, int(np.ceil(seconds / CHUNK_SECONDS)))
+    size = -(-len(data) // count)
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+class Benchmark:
+    """Ejecuta las etapas sobre una lista de entradas ``(nombre, muestras, bytes)``.
+
+    ``recognizer`` es el reconocedor de la etapa ``google`` (por defecto
+    :class:`StubRecognizer` con ``google_latency``). ``session_dir`` es la raíz de
+    las sesiones del benchmark; sin ella se usa un directorio temporal que se borra
+    al terminar.
+    """
+
+    def __init__(self, stages=STAGES, repeat=5, warmup=1, google_latency=0.0, log=print, recognizer=None,
+                 session_dir=None):
+        self.stages = [stage for stage in STAGES if stage in stages]
+        self.repeat = max(1, int(repeat))
+        self.warmup = max(0, int(warmup))
+        self.recognizer = recognizer or StubRecognizer(google_latency)
+        self.session_dir = session_dir
+        self.log = log
+        self._workdir = None
+
+    def _session_calls(self, label, stream, seconds):
+        """Funciones para save_chunk (un chunk por llamada), concat y su verificación sobre una sesión nueva."""
+        chunks = _chunks(stream, seconds)
+        counter = {"run": 0}
+
+        def new_session():
+            counter["run"] += 1
+            return f"bench-{label}-{counter['run']}"
+
+        def save_all():
+            session_id = new_session()
+            for index, chunk in enumerate(chunks, start=1):
+                save_chunk_file(session_id, index, io.BytesIO(chunk))
+            return session_id
+
+        def prepare_concat():
+            session_id = save_all()
+            # El WAV se reconstruye desde combined.webm, sin el decodificador de la sesión
+            stream_decoder.get_pool().close(session_id)
+            directory = os.path.join(self._workdir, session_id)
+            for name in os.listdir(directory):
+                if name.endswith(".wav"):
+                    os.remove(os.path.join(directory, name))
+            return (session_id,)
+
+        def check():
+            """Pasada sin medir; devuelve ``{etapa: motivo}`` de las que no producen audio.
+
+            ``save_chunk_file`` oculta los errores al agregar el PCM (p. ej. sin ffmpeg):
+            sin esta verificación se mediría el camino de error.
+            """
+            session_id = new_session()
+            reasons = {}
+            for index, chunk in enumerate(chunks, start=1):
+                before = session_num_samples(session_id)
+                save_chunk_file(session_id, index, io.BytesIO(chunk))
+                if session_num_samples(session_id) <= before:
+                    reasons["save_chunk"] = f"el chunk {index} no agregó audio al WAV de la sesión (¿falta ffmpeg?)"
+                    break
+            try:
+                (session_id,) = prepare_concat()
+                if audio_store.num_samples(concat_session_to_wav(session_id)) == 0:
+                    reasons["concat"] = "concat_session_to_wav devolvió un WAV vacío"
+            except Exception as exc:
+                reasons["concat"] = f"{type(exc).__name__}: {exc}"
+            return reasons
+
+        return save_all, prepare_concat, check, len(chunks)
+
+    def _calls(self, label, samples, data):
+        wav = _encode(samples, "WAV")
+        flac = _encode(samples, "FLAC")
+        save_all, prepare_concat, check, num_chunks = self._session_calls(
+            label, data if data is not None else wav, len(samples) / SAMPLE_RATE
+        )
+        # etapa -> (función, llamadas por ejecución, preparación no medida que devuelve sus argumentos)
+        return check, {
+            "decode_wav": (lambda: decode_audio(io.BytesIO(wav)), 1, None),
+            "decode_flac": (lambda: decode_audio(io.BytesIO(flac)), 1, None),
+            "save_chunk": (save_all, num_chunks, None),
+            "concat": (concat_session_to_wav, 1, prepare_concat),
+            "whisper": (lambda: transcribir_whisper(samples), 1, None),
+            "google": (lambda: transcribir_google(samples, recognizer=self.recognizer), 1, None),
+        }
+
+    def _measure(self, func, calls_per_run, setup=None):
+        setup = setup or tuple
+        for _ in range(self.warmup):
+            func(*setup())
+        latencies = []
+        resettable = _reset_peak_rss()
+        for _ in range(self.repeat):
+            args = setup()
+            started = time.perf_counter()
+            func(*args)
+            latencies.append((time.perf_counter() - started) / calls_per_run)
+        # Sin reinicio el pico incluiría las etapas anteriores: no se informa
+        peak_rss = _peak_rss_mb() if resettable else None
+
+        # Una pasada aparte con tracemalloc (lo hace más lento, no se mezcla con los tiempos)
+        args = setup()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            func(*args)
+            _current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        blocks = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "filename"))
+        return latencies, peak_rss, peak, blocks
+
+    def run(self, inputs):
+        """Devuelve la lista de resultados por etapa y entrada."""
+        self._workdir = self.session_dir or tempfile.mkdtemp(prefix="asrbench-")
+        results = []
+        skipped = {}
+        if "whisper" in self.stages:
+            try:
+                # transcribir_whisper oculta los errores: sin modelo se mediría el camino de error
+                preload_whisper(model_for_endpoint("upload"))
+            except Exception as exc:
+                skipped["whisper"] = f"{type(exc).__name__}: {exc}"
+        try:
+            with sessions.isolated_root(self._workdir), cache.bypass():
+                for label, samples, data in inputs:
+                    seconds = len(samples) / SAMPLE_RATE
+                    check, calls = self._calls(label, samples, data)
+                    skipped_input = dict(skipped)
+                    if {"save_chunk", "concat"} & set(self.stages):
+                        try:
+                            skipped_input.update(check())
+                        except Exception as exc:
+                            reason = f"{type(exc).__name__}: {exc}"
+                            skipped_input.update(save_chunk=reason, concat=reason)
+                    for stage in self.stages:
+                        func, calls_per_run, setup = calls[stage]
+                        self.log(f"{stage:<12} {label:<24} {seconds:7.1f} s")
+                        try:
+                            if stage in skipped_input:
+                                raise RuntimeError(skipped_input[stage])
+                            latencies, peak_rss, alloc_peak, blocks = self._measure(func, calls_per_run, setup)
+                        except Exception as exc:
+                            results.append({
+                                "stage": stage, "input": label, "audio_seconds": round(seconds, 3), "error": str(exc),
+                            })
+                            continue
+                        per_audio = seconds / calls_per_run
+                        p50 = _percentile(latencies, 0.5)
+                        results.append({
+                            "stage": stage,
+                            "input": label,
+                            "audio_seconds": round(seconds, 3),
+                            "calls_per_run": calls_per_run,
+                            "runs": len(latencies),
+                            "mean_ms": round(1000 * sum(latencies) / len(latencies), 3),
+                            "p50_ms": round(1000 * p50, 3),
+                            "p95_ms": round(1000 * _percentile(latencies, 0.95), 3),
+                            "real_time_factor": round(p50 / per_audio, 5) if per_audio else None,
+                            "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+                            "alloc_peak_mb": round(alloc_peak / 2**20, 3),
+                            "alloc_blocks": blocks,
+                        })
+        finally:
+            if self.session_dir is None:
+                shutil.rmtree(self._workdir, ignore_errors=True)
+        return results
+
+
+def metadata():
+    """Commit, versiones, plataforma y backend, para saber qué se está comparando."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "backend": getattr(settings, "ASR_BACKEND", {}).get("BACKEND", "eager"),
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """Cambios de p50 y memoria respecto a ``baseline``; ``regression`` si p50 empeora más de ``threshold``.
+
+    La memoria se compara con ``alloc_peak_mb`` (tracemalloc, igual en todas las
+    plataformas), no con ``peak_rss_mb``, que puede faltar.
+    """
+    previous = {(item["stage"], item["input"]): item for item in baseline.get("results", []) if "p50_ms" in item}
+    rows = []
+    for item in current.get("results", []):
+        old = previous.get((item["stage"], item["input"]))
+        if old is None or "p50_ms" not in item:
+            continue
+        change = (item["p50_ms"] - old["p50_ms"]) / old["p50_ms"] if old["p50_ms"] else 0.0
+        rows.append({
+            "stage": item["stage"],
+            "input": item["input"],
+            "p50_ms": item["p50_ms"],
+            "baseline_p50_ms": old["p50_ms"],
+            "p50_change": round(change, 4),
+            "alloc_peak_change_mb": round(item["alloc_peak_mb"] - old["alloc_peak_mb"], 3),
+            "regression": change > threshold,
+        })
+    return rows
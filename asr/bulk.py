@@ -0,0 +1,197 @@
+"""Transcripción masiva de archivos (``manage.py transcribe``).
+
+Los archivos se decodifican en un pool de procesos (cada uno con un solo hilo
+de BLAS/OpenMP) y las muestras se envían a Whisper desde varios hilos a la vez,
+así el planificador las agrupa en lotes. Los resultados se escriben en JSONL a
+medida que terminan; el mismo archivo sirve de checkpoint: con ``resume`` se
+omiten las rutas que ya tienen resultado (si una ruta se reintenta, vale su
+última línea).
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".opus", ".webm", ".m4a", ".aiff", ".pcm", ".raw")
+SAMPLE_RATE = 16000
+# Variables que limitan los hilos de las librerías numéricas en los procesos de decodificación
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def find_audio(source, extensions=AUDIO_EXTENSIONS):
+    """Rutas a procesar: los archivos de audio de un directorio (recursivo) o las de un manifiesto.
+
+    El manifiesto tiene una ruta por línea, o JSONL con el campo ``path``; las
+    rutas relativas se resuelven desde el directorio del manifiesto.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            yield path if os.path.isabs(path) else os.path.join(base, path)
+
+
+def completed_paths(output, retry_errors=False):
+    """Rutas que ya tienen resultado en ``output`` (las fallidas solo si no se reintentan)."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # línea cortada por una interrupción
+            if record.get("status") == "ok" or not retry_errors:
+                done.add(record["path"])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as handle:
+        if handle.seek(0, os.SEEK_END) == 0:
+            return True
+        handle.seek(-1, os.SEEK_END)
+        return handle.read(1) == b"\n"
+
+
+def _init_decoder(threads):
+    for name in _THREAD_ENV:
+        os.environ[name] = str(threads)
+
+
+def _decode_file(path):
+    """Decodifica en un proceso del pool. Devuelve ``(muestras o None, error, ms)``."""
+    from .decode import decode_audio
+
+    started = time.perf_counter()
+    try:
+        samples = decode_audio(path)
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}", (time.perf_counter() - started) * 1000
+    return samples, "", (time.perf_counter() - started) * 1000
+
+
+def _transcribe(engine, samples, model, decoding):
+    from .utils import transcribir_google, transcribir_whisper_detallado
+
+    started = time.perf_counter()
+    # Con raise_errors un fallo (servidor caído, red, memoria) queda como error y se puede reintentar
+    if engine == "google":
+        result = {"text": transcribir_google(samples, raise_errors=True), "segments": []}
+    else:
+        result = transcribir_whisper_detallado(samples, model=model, decoding=decoding, raise_errors=True)
+    return result, (time.perf_counter() - started) * 1000
+
+
+class BulkTranscriber:
+    """Decodifica con ``workers`` procesos y transcribe con ``concurrency`` peticiones simultáneas."""
+
+    def __init__(self, engine="whisper", model=None, decoding=None, workers=None, decode_threads=1,
+                 concurrency=8, log=print):
+        cpus = os.cpu_count() or 1
+        self.engine = engine
+        self.model = model
+        self.decoding = decoding
+        self.workers = max(1, workers or max(1, cpus // 4))
+        self.decode_threads = max(1, decode_threads)
+        self.concurrency = max(1, concurrency)
+        self.log = log
+        self.summary = {
+            "ok": 0, "errors": 0, "skipped": 0, "audio_seconds": 0.0, "decode_ms": 0.0, "transcribe_ms": 0.0,
+        }
+
+    def run(self, paths, output, resume=False, retry_errors=False):
+        done = completed_paths(output, retry_errors) if resume else set()
+        pending_paths = iter(paths)
+        started = time.perf_counter()
+        context = multiprocessing.get_context("spawn")  # sin heredar hilos ni el modelo del proceso principal
+
+        with open(output, "a" if resume else "w", encoding="utf-8") as out, \
+                ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_decoder,
+                                    initargs=(self.decode_threads,)) as decoders, \
+                ThreadPoolExecutor(self.concurrency, thread_name_prefix="asr-bulk") as transcribers:
+            if resume and not _ends_with_newline(output):
+                out.write("\n")  # la última línea quedó cortada por una interrupción
+            decoding, transcribing = {}, {}
+            exhausted = False
+            while True:
+                # Contrapresión: acotar los archivos decodificados que esperan en memoria
+                while not exhausted and len(decoding) + len(transcribing) < 2 * (self.workers + self.concurrency):
+                    path = next(pending_paths, None)
+                    if path is None:
+                        exhausted = True
+                    elif path in done:
+                        self.summary["skipped"] += 1
+                    else:
+                        decoding[decoders.submit(_decode_file, path)] = path
+                if not decoding and not transcribing:
+                    break
+                finished, _ = wait([*decoding, *transcribing], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in decoding:
+                        path = decoding.pop(future)
+                        samples, error, decode_ms = future.result()
+                        self.summary["decode_ms"] += decode_ms
+                        if samples is None:
+                            self._write(out, {"path": path, "status": "error", "error": error})
+                            continue
+                        seconds = len(samples) / SAMPLE_RATE
+                        job = transcribers.submit(_transcribe, self.engine, samples, self.model, self.decoding)
+                        transcribing[job] = (path, seconds, decode_ms)
+                    else:
+                        path, seconds, decode_ms = transcribing.pop(future)
+                        self._finish(out, future, path, seconds, decode_ms)
+
+        self.summary["wall_seconds"] = time.perf_counter() - started
+        return self.report()
+
+    def _finish(self, out, future, path, seconds, decode_ms):
+        try:
+            result, transcribe_ms = future.result()
+        except Exception as exc:
+            self._write(out, {"path": path, "status": "error", "error": f"{type(exc).__name__}: {exc}"})
+            return
+        self.summary["audio_seconds"] += seconds
+        self.summary["transcribe_ms"] += transcribe_ms
+        self._write(out, {
+            "path": path,
+            "status": "ok",
+            "engine": self.engine,
+            "text": result["text"],
+            "segments": result["segments"],
+            "duration_s": round(seconds, 3),
+            "decode_ms": round(decode_ms, 1),
+            "transcribe_ms": round(transcribe_ms, 1),
+        })
+
+    def _write(self, out, record):
+        self.summary["ok" if record["status"] == "ok" else "errors"] += 1
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        if record["status"] != "ok":
+            self.log(f"{record['path']}: {record['error']}")
+
+    def report(self):
+        summary = dict(self.summary)
+        wall = summary.get("wall_seconds") or 0.0
+        processed = summary["ok"] + summary["errors"]
+        summary.update(
+            files_per_second=round(processed / wall, 3) if wall else 0.0,
+            # Segundos de audio por segundo de reloj (inverso del factor de tiempo real)
+            audio_speedup=round(summary["audio_seconds"] / wall, 2) if wall else 0.0,
+            avg_decode_ms=round(summary["decode_ms"] / processed, 1) if processed else 0.0,
+            avg_transcribe_ms=round(summary["transcribe_ms"] / summary["ok"], 1) if summary["ok"] else 0.0,
+        )
+        return summary
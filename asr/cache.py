@@ -0,0 +1,184 @@
+"""Caché de transcripciones direccionada por contenido.
+
+La clave es un hash del PCM normalizado (16 kHz mono int16) más el motor, el
+modelo y los parámetros de decodificación, así que el mismo audio subido dos
+veces (o vuelto a decodificar con la misma configuración) no pasa de nuevo por
+los reconocedores. Hay un nivel en memoria (LRU acotado) y uno opcional en disco
+(un JSON por entrada, con desalojo de los más antiguos al superar el tamaño).
+"""
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .audio_store import to_pcm16
+
+
+def make_key(samples, engine, **params):
+    digest = hashlib.sha256()
+    digest.update(to_pcm16(samples).tobytes())
+    digest.update(engine.encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, max_entries=256, disk_dir=None, disk_max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "disk_evictions": 0}
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_files(self):
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key):
+        """Valor cacheado o ``None``."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._memory[key]
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, encoding="utf-8") as handle:
+                    value = json.load(handle)
+                os.utime(path)  # el mtime hace de "último uso" para el desalojo
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, value)
+                return value
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._stats["sets"] += 1
+            self._remember(key, value)
+        if self.disk_dir:
+            self._write_disk(key, value)
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _path, size, _mtime in self._disk_files())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """Borra los archivos menos usados hasta quedar en el 90 % del límite."""
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _path, size, _mtime in files)
+        target = self.disk_max_bytes * 0.9
+        for path, size, _mtime in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._stats["disk_evictions"] += 1
+        self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+            stats["max_entries"] = self.max_entries
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Caché compartida del proceso, configurada con ``ASR_CACHE``."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = getattr(settings, "ASR_CACHE", {})
+            _cache = TranscriptionCache(
+                max_entries=config.get("MAX_ENTRIES", 256),
+                disk_dir=config.get("DISK_DIR"),
+                disk_max_bytes=config.get("DISK_MAX_BYTES", 256 * 2**20),
+            )
+        return _cache
+
+
+_bypass = contextvars.ContextVar("asr_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass():
+    """Dentro del bloque :func:`cached` siempre calcula (p. ej. para medir los motores)."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cached(samples, engine, compute, **params):
+    """Devuelve el resultado cacheado o lo calcula con ``compute()`` y lo guarda.
+
+    Si el caché está desactivado (``ASR_CACHE["ENABLED"]``) o dentro de
+    :func:`bypass` siempre calcula.
+    """
+    if _bypass.get() or not getattr(settings, "ASR_CACHE", {}).get("ENABLED", True):
+        return compute()
+    cache = get_cache()
+    key = make_key(samples, engine, **params)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
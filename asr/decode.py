@@ -0,0 +1,158 @@
+"""Decodificación de audio a muestras float32 mono.
+
+WAV, FLAC y AIFF se leen directamente con soundfile (sin subprocesos ni archivos
+temporales) y el PCM crudo se interpreta con NumPy. Solo se mezclan canales o se
+remuestrea (con soxr) cuando hace falta. ffmpeg (vía pydub) queda únicamente
+para contenedores comprimidos como WebM, OGG o MP3.
+"""
+import io
+import os
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from . import metrics
+from .audio_store import to_pcm16
+
+SAMPLE_RATE = 16000
+# Extensiones que se interpretan como PCM int16 little-endian crudo (16 kHz mono)
+RAW_EXTENSIONS = (".pcm", ".raw")
+# Content-types de PCM int16 crudo y su orden de bytes: audio/L16 es big-endian
+# (RFC 2586) salvo ``endianness=little-endian``; los demás son little-endian
+RAW_CONTENT_TYPES = {"audio/l16": ">i2", "audio/pcm": "<i2", "audio/s16le": "<i2", "audio/x-s16le": "<i2"}
+_HEAD_SIZE = 12
+
+
+def sniff_format(head):
+    """Formato leíble por soundfile según los primeros bytes, o ``None``."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "WAV"
+    if head[:4] == b"fLaC":
+        return "FLAC"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "AIFF"
+    return None
+
+
+def to_mono(samples):
+    """Promedia los canales de un arreglo ``(frames, canales)``; no copia si ya es mono."""
+    if samples.ndim == 1:
+        return samples
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def resample(samples, sample_rate, target_sr=SAMPLE_RATE):
+    """Remuestrea con soxr solo si la frecuencia no coincide."""
+    if sample_rate == target_sr or not len(samples):
+        return samples
+    with metrics.stage("resample"):
+        return soxr.resample(samples, sample_rate, target_sr).astype(np.float32, copy=False)
+
+
+def decode_pcm(data, sample_rate=SAMPLE_RATE, channels=1, target_sr=SAMPLE_RATE, dtype="<i2"):
+    """Interpreta bytes PCM int16 crudos (little-endian salvo que ``dtype`` diga otra cosa)."""
+    pcm = np.frombuffer(data, dtype=dtype)
+    pcm = pcm[:len(pcm) - len(pcm) % channels].reshape(-1, channels)
+    samples = to_mono(pcm.astype(np.float32) / 32768.0)
+    return resample(samples, sample_rate, target_sr)
+
+
+def _raw_params(file_obj):
+    """``(sample_rate, channels, dtype)`` si el archivo es PCM crudo (por extensión o content-type)."""
+    content_type = (getattr(file_obj, "content_type", None) or "").lower()
+    mime, *parts = [part.strip() for part in content_type.split(";")]
+    if mime in RAW_CONTENT_TYPES:
+        params = dict(part.split("=", 1) for part in parts if "=" in part)
+        dtype = RAW_CONTENT_TYPES[mime]
+        if params.get("endianness") == "little-endian":
+            dtype = "<i2"
+        return int(params.get("rate", SAMPLE_RATE)), int(params.get("channels", 1)), dtype
+    name = file_obj if isinstance(file_obj, str) else getattr(file_obj, "name", None) or ""
+    if str(name).lower().endswith(RAW_EXTENSIONS):
+        return SAMPLE_RATE, 1, "<i2"
+    return None
+
+
+def _read_bytes(file_obj):
+    with metrics.stage("upload_read"):
+        if hasattr(file_obj, "chunks"):
+            return b"".join(file_obj.chunks())
+        return file_obj.read()
+
+
+def _rewind(file_obj):
+    try:
+        file_obj.seek(0)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+
+
+def _decode_ffmpeg(source, target_sr):
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(source)
+    audio = audio.set_frame_rate(target_sr).set_channels(1).set_sample_width(2)
+    return np.frombuffer(audio.raw_data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(source, target_sr=SAMPLE_RATE):
+    """Decodifica una ruta, bytes o archivo subido a float32 mono a ``target_sr``."""
+    with metrics.stage("decode"):
+        return _decode_audio(source, target_sr)
+
+
+def _decode_audio(source, target_sr):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(bytes(source))
+
+    raw = _raw_params(source)
+    if raw is not None:
+        if isinstance(source, str):
+            with open(source, "rb") as handle:
+                data = handle.read()
+        else:
+            data = _read_bytes(source)
+            _rewind(source)
+        sample_rate, channels, dtype = raw
+        return decode_pcm(data, sample_rate, channels, target_sr=target_sr, dtype=dtype)
+
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            head = handle.read(_HEAD_SIZE)
+        handle = source
+    else:
+        if not hasattr(source, "seekable") or not source.seekable():
+            source = io.BytesIO(_read_bytes(source))
+        _rewind(source)
+        head = source.read(_HEAD_SIZE)
+        _rewind(source)
+        handle = source
+
+    if sniff_format(head):
+        try:
+            samples, sample_rate = sf.read(handle, dtype="float32", always_2d=True)
+        except RuntimeError:
+            # Codificación dentro del contenedor que libsndfile no soporta
+            _rewind(handle)
+        else:
+            _rewind(handle)
+            return resample(to_mono(samples), sample_rate, target_sr)
+
+    if not isinstance(handle, str):
+        _rewind(handle)
+    return _decode_ffmpeg(handle, target_sr)
+
+
+def decode_pcm16(source, target_sr=SAMPLE_RATE):
+    """Como :func:`decode_audio` pero en int16 (formato del almacen de sesión)."""
+    return to_pcm16(decode_audio(source, target_sr))
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    """Escribe muestras float32 como WAV PCM 16 bits."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sf.write(path, samples, sample_rate, subtype="PCM_16", format="WAV")
+    return path
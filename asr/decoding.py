@@ -0,0 +1,119 @@
+"""Perfiles de decodificación de Whisper (``ASR_DECODING_PROFILES``).
+
+Cada perfil define el ancho del beam, la longitud máxima, las temperaturas de
+respaldo (se reintenta con la siguiente si la salida es repetitiva o poco
+probable) y un presupuesto de tiempo por pasada. Los parciales usan búsqueda
+voraz y los finales beam search con temperatura 0, como antes de los perfiles;
+el fallback de temperatura es opcional (perfil ``final-fallback`` o ``temperature``
+en la petición). Una petición puede ajustar su perfil dentro de
+``ASR_DECODING_LIMITS``.
+"""
+from django.conf import settings
+
+DEFAULT_PROFILE = "final"
+# Umbrales de Whisper para decidir si se reintenta con la siguiente temperatura
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+
+_DEFAULT_LIMITS = {"NUM_BEAMS": (1, 8), "MAX_LENGTH": (16, 448), "MAX_TIME": (0.5, 120.0), "MAX_TEMPERATURES": 6}
+# Parámetros que se pueden ajustar por petición y el campo del perfil que modifican
+OVERRIDES = {"num_beams": "NUM_BEAMS", "max_length": "MAX_LENGTH", "max_time": "MAX_TIME", "temperature": "TEMPERATURES"}
+
+
+def _profiles():
+    return getattr(settings, "ASR_DECODING_PROFILES", {})
+
+
+def _limits():
+    return {**_DEFAULT_LIMITS, **getattr(settings, "ASR_DECODING_LIMITS", {})}
+
+
+def profile_for_endpoint(endpoint):
+    """Perfil configurado para un endpoint (``partial``, ``final``, ``upload``, ``stream``)."""
+    return getattr(settings, "ASR_ENDPOINT_PROFILES", {}).get(endpoint) or DEFAULT_PROFILE
+
+
+def _in_range(name, value, limits):
+    low, high = limits[name]
+    if not low <= value <= high:
+        raise ValueError(f"{name.lower()} debe estar entre {low} y {high}")
+    return value
+
+
+def resolve(decoding=None, overrides=None):
+    """Devuelve el perfil como dict normalizado (hashable por su ``repr``).
+
+    ``decoding`` es el nombre de un perfil o un dict ya resuelto. ``overrides``
+    usa las claves de :data:`OVERRIDES`; los valores fuera de los límites
+    lanzan ``ValueError``.
+    """
+    if isinstance(decoding, dict) and not overrides:
+        return decoding
+    if isinstance(decoding, dict):
+        profile = dict(decoding)
+    else:
+        name = decoding or DEFAULT_PROFILE
+        if name not in _profiles():
+            raise ValueError(f"perfil de decodificación desconocido: {name}")
+        config = _profiles()[name]
+        profile = {
+            "NUM_BEAMS": int(config.get("NUM_BEAMS", 1)),
+            "MAX_LENGTH": int(config.get("MAX_LENGTH", 448)),
+            "TEMPERATURES": tuple(float(t) for t in config.get("TEMPERATURES", (0.0,))),
+            "MAX_TIME": config.get("MAX_TIME"),
+        }
+
+    limits = _limits()
+    for key, value in (overrides or {}).items():
+        if value in (None, ""):
+            continue
+        if key not in OVERRIDES:
+            raise ValueError(f"parámetro de decodificación no soportado: {key}")
+        field = OVERRIDES[key]
+        if field == "TEMPERATURES":
+            values = value.split(",") if isinstance(value, str) else value
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            temperatures = tuple(float(t) for t in values)
+            if not 1 <= len(temperatures) <= limits["MAX_TEMPERATURES"] or any(not 0 <= t <= 1 for t in temperatures):
+                raise ValueError(f"temperature: entre 1 y {limits['MAX_TEMPERATURES']} valores en [0, 1]")
+            profile[field] = temperatures
+        elif field == "MAX_TIME":
+            profile[field] = _in_range(field, float(value), limits)
+        else:
+            profile[field] = _in_range(field, int(value), limits)
+    return profile
+
+
+def from_request(params, endpoint):
+    """Perfil para una petición: ``profile`` elige otro perfil y el resto lo ajusta."""
+    name = params.get("profile") or profile_for_endpoint(endpoint)
+    allowed = getattr(settings, "ASR_REQUEST_PROFILES", None)
+    if allowed is not None and name not in allowed:
+        raise ValueError(f"perfil no permitido: {name}")
+    return resolve(name, {key: params.get(key) for key in OVERRIDES if params.get(key) not in (None, "")})
+
+
+def is_greedy(profile):
+    """Búsqueda voraz sin fallback de temperatura: una sola pasada determinista, token a token."""
+    return profile["NUM_BEAMS"] == 1 and tuple(profile["TEMPERATURES"]) == (0.0,)
+
+
+def generate_kwargs(profile):
+    """Argumentos de ``model.generate`` para un perfil resuelto."""
+    kwargs = {"num_beams": profile["NUM_BEAMS"], "max_length": profile["MAX_LENGTH"]}
+    if profile["NUM_BEAMS"] > 1:
+        kwargs["early_stopping"] = True
+    temperatures = profile["TEMPERATURES"]
+    if len(temperatures) > 1:
+        # Fallback de temperatura de Whisper: reintenta si la salida es repetitiva o poco probable
+        kwargs.update(
+            temperature=temperatures,
+            compression_ratio_threshold=COMPRESSION_RATIO_THRESHOLD,
+            logprob_threshold=LOGPROB_THRESHOLD,
+        )
+    elif temperatures[0] > 0:
+        kwargs.update(do_sample=True, temperature=temperatures[0])
+    if profile.get("MAX_TIME"):
+        kwargs["max_time"] = float(profile["MAX_TIME"])
+    return kwargs
@@ -0,0 +1,117 @@
+"""Ejecución concurrente de los motores (Whisper y Google) con timeout por motor.
+
+Las llamadas de los motores son bloqueantes (CPU o red), así que se ejecutan en
+un pool de hilos compartido. El tiempo de respuesta queda en max(motores) en
+lugar de la suma. Un motor que supera su timeout se reporta como error; su hilo
+termina en segundo plano y el resultado se descarta.
+
+Las llamadas de una petición que a su vez reparten trabajo entre los motores
+(un chunk o el cierre de una sesión por WebSocket, una respuesta SSE) corren en
+otro pool (:func:`run_request`): si ocuparan un hilo del pool de motores
+mientras esperan a :func:`run_parallel`, con el pool lleno nadie avanzaría.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+from . import metrics
+
+_executor = None
+_request_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "ASR_ENGINE_WORKERS", 8), thread_name_prefix="asr-engine"
+            )
+        return _executor
+
+
+def get_request_executor():
+    """Pool de las llamadas de petición que esperan a los motores (ver :func:`run_request`)."""
+    global _request_executor
+    with _executor_lock:
+        if _request_executor is None:
+            _request_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "ASR_REQUEST_WORKERS", 16), thread_name_prefix="asr-request"
+            )
+        return _request_executor
+
+
+def engine_timeout(engine):
+    return getattr(settings, "ASR_ENGINE_TIMEOUTS", {}).get(engine)
+
+
+def _timeout_message(engine):
+    return f"{engine}: tiempo de espera agotado ({engine_timeout(engine)} s)"
+
+
+def short_error(exc):
+    """Primera línea del mensaje de una excepción, acotada para respuestas JSON."""
+    message = str(exc).strip() or exc.__class__.__name__
+    return message.splitlines()[0][:200]
+
+
+def run_parallel(tasks):
+    """Ejecuta ``{motor: callable}`` en paralelo. Devuelve ``(resultados, errores)``."""
+    executor = get_executor()
+    started = time.monotonic()
+    # Cada motor corre con el contexto de la petición (trace id)
+    futures = {engine: executor.submit(contextvars.copy_context().run, task) for engine, task in tasks.items()}
+    results, errors = {}, {}
+    for engine, future in futures.items():
+        timeout = engine_timeout(engine)
+        remaining = None if timeout is None else max(0.0, started + timeout - time.monotonic())
+        try:
+            results[engine] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            metrics.error(f"{engine}_timeout")
+            errors[engine] = _timeout_message(engine)
+        except Exception as exc:
+            errors[engine] = short_error(exc)
+    return results, errors
+
+
+async def _run_in(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, lambda: context.run(func, *args))
+
+
+async def run_blocking(func, *args):
+    """Ejecuta una llamada bloqueante en el pool de motores sin bloquear el event loop."""
+    return await _run_in(get_executor(), func, *args)
+
+
+async def run_request(func, *args):
+    """Como :func:`run_blocking`, para llamadas que esperan a otras del pool de motores."""
+    return await _run_in(get_request_executor(), func, *args)
+
+
+async def run_parallel_async(tasks):
+    """Versión async de :func:`run_parallel` para vistas async (ASGI)."""
+
+    async def run(engine, task):
+        return await asyncio.wait_for(run_blocking(task), timeout=engine_timeout(engine))
+
+    engines = list(tasks)
+    outcomes = await asyncio.gather(*(run(engine, tasks[engine]) for engine in engines), return_exceptions=True)
+    results, errors = {}, {}
+    for engine, outcome in zip(engines, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            metrics.error(f"{engine}_timeout")
+            errors[engine] = _timeout_message(engine)
+        elif isinstance(outcome, Exception):
+            errors[engine] = short_error(outcome)
+        else:
+            results[engine] = outcome
+    return results, errors
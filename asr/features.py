@@ -0,0 +1,250 @@
+"""Log-mel incremental por sesión (equivalente a ``WhisperFeatureExtractor``).
+
+Whisper calcula, para una ventana de hasta 30 s, la STFT (n_fft=400, hop=160,
+ventana Hann, centrada con padding reflect) de la ventana rellenada con ceros a
+30 s, el banco de filtros mel (Slaney) y ``log10``; descarta el último frame,
+recorta a ``max - 8`` y normaliza con ``(x + 4) / 4``.
+
+En tiempo real las ventanas se superponen casi por completo entre chunks, así
+que los frames del stream de la sesión se calculan una sola vez y se guardan en
+un buffer circular "espejado" (cada frame se escribe dos veces), por lo que
+cualquier tramo de frames es un slice contiguo sin copia. Por ventana solo se
+calculan al vuelo los frames de los bordes (los dos primeros, que en Whisper
+llevan padding reflect, y los que tocan el final del audio), y el recorte
+``max - 8`` se aplica por ventana.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_RATE = 16000
+N_FFT = 400
+HOP = 160
+N_SAMPLES = 30 * SAMPLE_RATE
+N_FRAMES = N_SAMPLES // HOP
+LOG_FLOOR = -10.0  # log10 del piso 1e-10 (frames de solo ceros)
+_PAD = N_FFT // 2
+_WINDOW = np.hanning(N_FFT + 1)[:-1]  # Hann periódica, como en transformers
+
+
+def _hz_to_mel(freq):
+    freq = np.asarray(freq, dtype=np.float64)
+    mels = 3.0 * freq / 200.0
+    log_region = freq >= 1000.0
+    return np.where(log_region, 15.0 + np.log(np.maximum(freq, 1e-10) / 1000.0) * (27.0 / np.log(6.4)), mels)
+
+
+def _mel_to_hz(mels):
+    mels = np.asarray(mels, dtype=np.float64)
+    freq = 200.0 * mels / 3.0
+    log_region = mels >= 15.0
+    return np.where(log_region, 1000.0 * np.exp(np.log(6.4) / 27.0 * (mels - 15.0)), freq)
+
+
+def mel_filter_bank(n_mels=80, sampling_rate=SAMPLE_RATE, n_fft=N_FFT):
+    """Banco de filtros mel Slaney ``(n_fft // 2 + 1, n_mels)``, igual al de ``WhisperFeatureExtractor``."""
+    filter_freqs = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sampling_rate / 2), n_mels + 2))
+    fft_freqs = np.linspace(0, sampling_rate // 2, n_fft // 2 + 1)
+    filter_diff = np.diff(filter_freqs)
+    slopes = filter_freqs[None, :] - fft_freqs[:, None]
+    down = -slopes[:, :-2] / filter_diff[:-1]
+    up = slopes[:, 2:] / filter_diff[1:]
+    filters = np.maximum(0.0, np.minimum(down, up))
+    return filters * (2.0 / (filter_freqs[2:n_mels + 2] - filter_freqs[:n_mels]))[None, :]
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def _filters_for(n_mels):
+    with _filters_lock:
+        if n_mels not in _filters:
+            _filters[n_mels] = mel_filter_bank(n_mels).T.copy()
+        return _filters[n_mels]
+
+
+def log_mel_frames(frames, n_mels=80):
+    """``log10`` del espectro mel de frames ``(n, 400)`` (ya con su padding). Devuelve ``(n_mels, n)``."""
+    if not len(frames):
+        return np.zeros((n_mels, 0), dtype=np.float32)
+    spectrum = np.fft.rfft(np.asarray(frames, dtype=np.float64) * _WINDOW, axis=-1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    mel = _filters_for(n_mels) @ power.T
+    return np.log10(np.maximum(mel, 1e-10)).astype(np.float32)
+
+
+def normalize(log_spec, out=None):
+    """Recorte ``max - 8`` y escala ``(x + 4) / 4`` de Whisper, por ventana."""
+    out = np.maximum(log_spec, log_spec.max() - 8.0, out=out)
+    out += 4.0
+    out /= 4.0
+    return out
+
+
+def reference_features(samples, n_mels=80):
+    """Cálculo directo (no incremental) de las features de una ventana, para comparar."""
+    padded = np.zeros(N_SAMPLES, dtype=np.float64)
+    samples = np.asarray(samples[:N_SAMPLES], dtype=np.float64)
+    padded[:len(samples)] = samples
+    padded = np.pad(padded, _PAD, mode="reflect")
+    frames = sliding_window_view(padded, N_FFT)[::HOP][:N_FRAMES]
+    return normalize(log_mel_frames(frames, n_mels))
+
+
+def _window_frames(window, frame_indices):
+    """Frames ``(len(frame_indices), 400)`` de la ventana rellenada a 30 s con padding reflect."""
+    idx = np.asarray(frame_indices, dtype=np.int64)[:, None] * HOP - _PAD + np.arange(N_FFT)[None, :]
+    idx = np.where(idx < 0, -idx, idx)
+    idx = np.where(idx >= N_SAMPLES, 2 * (N_SAMPLES - 1) - idx, idx)
+    inside = idx < len(window)
+    return np.where(inside, window[np.minimum(idx, max(len(window) - 1, 0))] if len(window) else 0.0, 0.0)
+
+
+class StreamingLogMel:
+    """Frames log-mel del stream de una sesión en un buffer circular espejado.
+
+    ``reader(start, stop)`` devuelve las muestras float32 ``[start:stop]`` del
+    stream (p. ej. el almacen de la sesión). El frame ``k`` del stream está
+    centrado en la muestra ``k * HOP`` y coincide con el frame ``k - a`` de
+    cualquier ventana que empiece en ``a * HOP``, salvo en los bordes.
+    """
+
+    def __init__(self, reader, n_mels=80, capacity_frames=4096):
+        self.reader = reader
+        self.n_mels = n_mels
+        self.capacity = max(int(capacity_frames), N_FRAMES)
+        self._buffer = np.zeros((n_mels, 2 * self.capacity), dtype=np.float32)
+        self._first = 0  # primer frame del stream que sigue en el buffer
+        self._next = 0  # siguiente frame por calcular
+        self._lock = threading.Lock()
+        self.stats = {"computed_frames": 0, "edge_frames": 0, "windows": 0, "resets": 0}
+
+    def _write(self, start_frame, values):
+        """Escribe frames consecutivos en ambas mitades del buffer."""
+        if values.shape[1] > self.capacity:
+            start_frame += values.shape[1] - self.capacity
+            values = values[:, -self.capacity:]
+        positions = (start_frame + np.arange(values.shape[1])) % self.capacity
+        self._buffer[:, positions] = values
+        self._buffer[:, positions + self.capacity] = values
+
+    def _extend(self, last_frame, total_samples):
+        """Calcula los frames del stream hasta ``last_frame`` (exclusivo)."""
+        if last_frame <= self._next:
+            return
+        first = self._next
+        lo = first * HOP - _PAD
+        hi = (last_frame - 1) * HOP + _PAD
+        samples = self.reader(max(0, lo), min(hi, total_samples)).astype(np.float64)
+        if lo < 0:
+            # Inicio del stream: padding reflect, igual que en una ventana que empieza en 0
+            samples = np.concatenate((samples[1:1 - lo][::-1], samples))
+        frames = sliding_window_view(samples, N_FFT)[::HOP][:last_frame - first]
+        self._write(first, log_mel_frames(frames, self.n_mels))
+        self._next = last_frame
+        self._first = max(self._first, last_frame - self.capacity)
+        self.stats["computed_frames"] += last_frame - first
+
+    def _view(self, first, count):
+        """Slice sin copia de ``count`` frames del stream desde ``first``."""
+        start = first % self.capacity
+        return self._buffer[:, start:start + count]
+
+    def window(self, start, stop, total_samples=None):
+        """Features normalizadas ``(n_mels, 3000)`` de la ventana ``[start, stop)`` del stream.
+
+        ``start`` debe ser múltiplo de ``HOP``.
+        """
+        if start % HOP:
+            raise ValueError(f"start debe ser múltiplo de {HOP}")
+        stop = min(stop, start + N_SAMPLES)
+        length = stop - start
+        total_samples = stop if total_samples is None else total_samples
+        first_frame = start // HOP
+        # Frames interiores: su soporte [k*HOP - 200, k*HOP + 200) cae dentro del audio de la ventana
+        inner_lo = 2
+        inner_hi = max(inner_lo, min(N_FRAMES, (length - _PAD) // HOP + 1))
+
+        with self._lock:
+            if first_frame + inner_lo < self._first or first_frame + inner_lo > self._next:
+                # La ventana empieza antes de lo que queda en el buffer (o salta hacia adelante)
+                self._first = self._next = first_frame + inner_lo
+                self.stats["resets"] += 1
+            self._extend(first_frame + inner_hi, total_samples)
+
+            out = np.empty((self.n_mels, N_FRAMES), dtype=np.float32)
+            out[:, inner_lo:inner_hi] = self._view(first_frame + inner_lo, inner_hi - inner_lo)
+
+            # Bordes: los dos primeros frames (padding reflect) y los que tocan el final
+            # del audio; desde zero_from el soporte del frame es solo relleno de ceros
+            zero_from = min(N_FRAMES, max(inner_hi, -(-(length + _PAD) // HOP)))
+            edges = list(range(inner_lo)) + list(range(inner_hi, zero_from))
+            out[:, edges] = log_mel_frames(_window_frames(self.reader(start, stop), edges), self.n_mels)
+            out[:, zero_from:] = LOG_FLOOR
+            self.stats["edge_frames"] += len(edges)
+            self.stats["windows"] += 1
+        return normalize(out, out=out)
+
+
+def _config():
+    return getattr(settings, "ASR_FEATURES", {})
+
+
+class FeaturePool:
+    """Extractores por sesión (los menos usados se descartan al superar ``max_sessions``)."""
+
+    def __init__(self, max_sessions=32, capacity_frames=4096):
+        self.max_sessions = max_sessions
+        self.capacity_frames = capacity_frames
+        self._extractors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, reader, n_mels=80):
+        with self._lock:
+            extractor = self._extractors.get(session_id)
+            if extractor is None or extractor.n_mels != n_mels:
+                extractor = StreamingLogMel(reader, n_mels=n_mels, capacity_frames=self.capacity_frames)
+                self._extractors[session_id] = extractor
+            extractor.reader = reader
+            self._extractors.move_to_end(session_id)
+            while len(self._extractors) > self.max_sessions:
+                self._extractors.popitem(last=False)
+            return extractor
+
+    def discard(self, session_id):
+        with self._lock:
+            self._extractors.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            extractors = list(self._extractors.values())
+        totals = {"sessions": len(extractors)}
+        for extractor in extractors:
+            for key, value in extractor.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enabled():
+    return _config().get("ENABLED", True)
+
+
+def get_pool():
+    """Pool compartido del proceso, configurado con ``ASR_FEATURES``."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = _config()
+            _pool = FeaturePool(
+                max_sessions=config.get("MAX_SESSIONS", 32),
+                capacity_frames=int(config.get("CAPACITY_SECONDS", 40) * SAMPLE_RATE / HOP),
+            )
+        return _pool
@@ -0,0 +1,409 @@
+"""Cola de trabajos de transcripción con prioridades y pool de workers local.
+
+Las transcripciones largas (resultado final, subidas) se encolan y el cliente
+consulta el resultado por id en lugar de mantener la petición abierta. Los
+trabajos se ejecutan por clase de prioridad: los parciales en tiempo real
+siempre antes que los finales y estos antes que los lotes, y hay workers
+reservados solo para parciales. Los trabajos persistentes se registran en
+``TranscriptionJob`` (SQLite), así que cualquier worker web puede responder la
+consulta; los parciales viven solo en memoria.
+
+Un trabajo que supera el ``timeout`` de :meth:`JobQueue.run` se marca fallido:
+si seguía en cola no se ejecuta, y si ya corría su hilo se reemplaza por otro
+(el original termina ese trabajo, descarta el resultado y sale). Las filas
+persistentes guardan el proceso que las ejecuta (``owner``); las de un proceso
+de este host que ya no existe se marcan fallidas al arrancar la cola o al
+consultarlas, porque la función y el audio solo vivían en su memoria.
+"""
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import metrics
+from .fanout import short_error
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"partial": 0, "final": 1, "batch": 2}
+# Trabajos terminados que se conservan en memoria (los persistentes siguen en la base)
+MAX_FINISHED = 512
+# Ventana (s) para calcular el throughput de trabajos terminados
+THROUGHPUT_WINDOW = 60.0
+ORPHAN_ERROR = "interrumpido: el proceso que ejecutaba el trabajo terminó"
+
+
+def _config():
+    return getattr(settings, "ASR_JOBS", {})
+
+
+def _owner():
+    """Identificador del proceso que ejecuta los trabajos (``host:pid``)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """``False`` solo si ``owner`` es un proceso de este host que ya terminó."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True  # otro host: no se puede saber
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # existe pero es de otro usuario
+    return True
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class _Job:
+    __slots__ = ("id", "kind", "priority", "func", "args", "with_status", "persist", "session_id", "status",
+                 "result", "status_code", "error", "enqueued_at", "started_at", "finished_at", "done", "context",
+                 "worker_priority", "abandoned")
+
+    def __init__(self, kind, priority, func, args, with_status, persist, session_id):
+        self.id = uuid.uuid4()
+        self.kind = kind
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.with_status = with_status
+        self.persist = persist
+        self.session_id = session_id or ""
+        self.status = "queued"
+        self.result = None
+        self.status_code = 200
+        self.error = ""
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        # El trabajo corre con el contexto (trace id) de quien lo encoló
+        self.context = contextvars.copy_context()
+        # Clases que atiende el hilo que lo ejecuta (para reemplazarlo) y si se abandonó por timeout
+        self.worker_priority = None
+        self.abandoned = False
+
+    def as_dict(self):
+        data = {
+            "job_id": str(self.id),
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "session_id": self.session_id,
+            "result": self.result,
+            "status_code": self.status_code,
+            "error": self.error,
+        }
+        if self.started_at is not None:
+            data["wait_ms"] = round((self.started_at - self.enqueued_at) * 1000, 1)
+        if self.finished_at is not None:
+            data["run_ms"] = round((self.finished_at - self.started_at) * 1000, 1)
+        return data
+
+
+class JobQueue:
+    """Cola con prioridad atendida por ``workers`` hilos (+ ``interactive_workers`` solo para parciales)."""
+
+    def __init__(self, workers=2, interactive_workers=1):
+        self.workers = max(1, int(workers))
+        self.interactive_workers = max(0, int(interactive_workers))
+        self.owner = _owner()
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._finished = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._stats = {}
+        self._completions = deque()
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for index in range(self.workers + self.interactive_workers):
+            max_priority = PRIORITIES["partial"] if index >= self.workers else max(PRIORITIES.values())
+            self._start_worker(max_priority)
+
+    def _start_worker(self, max_priority):
+        thread = threading.Thread(
+            target=self._loop, args=(max_priority,), name=f"asr-job-{len(self._threads)}", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def _class_stats(self, kind):
+        return self._stats.setdefault(kind, {
+            "submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "total_run_ms": 0.0,
+            "waits_ms": deque(maxlen=1000),
+        })
+
+    def recover_orphans(self):
+        """Marca fallidos los trabajos persistentes en cola o en curso de procesos de este host que terminaron."""
+        from .models import TranscriptionJob
+
+        pending = TranscriptionJob.objects.filter(
+            status__in=(TranscriptionJob.STATUS_QUEUED, TranscriptionJob.STATUS_RUNNING)
+        ).exclude(owner=self.owner)
+        orphans = [record.id for record in pending.only("id", "owner") if not _owner_alive(record.owner)]
+        if orphans:
+            TranscriptionJob.objects.filter(id__in=orphans).update(
+                status=TranscriptionJob.STATUS_FAILED, status_code=500, error=ORPHAN_ERROR, finished_at=timezone.now()
+            )
+            logger.warning("Trabajos huérfanos marcados como fallidos: %d", len(orphans))
+        return len(orphans)
+
+    def submit(self, kind, func, *args, priority=None, with_status=False, persist=True, session_id=""):
+        """Encola ``func(*args)`` y devuelve el id del trabajo.
+
+        ``priority`` es una clase de :data:`PRIORITIES` (por defecto la de ``kind``).
+        Con ``with_status`` la función devuelve ``(payload, status_code)``.
+        """
+        return str(self._enqueue(kind, func, args, priority, with_status, persist, session_id).id)
+
+    def _enqueue(self, kind, func, args, priority, with_status, persist, session_id):
+        priority = PRIORITIES[priority or kind]
+        job = _Job(kind, priority, func, args, with_status, persist, session_id)
+        if persist:
+            from .models import TranscriptionJob
+
+            TranscriptionJob.objects.create(
+                id=job.id, kind=kind, priority=priority, session_id=job.session_id, owner=self.owner
+            )
+        with self._cond:
+            self._ensure_workers()
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._class_stats(kind)["submitted"] += 1
+            self._cond.notify_all()
+        return job
+
+    def run(self, kind, func, *args, timeout=None, priority=None):
+        """Ejecuta ``func(*args)`` en el pool (sin persistir) y espera el resultado."""
+        job = self._enqueue(kind, func, args, priority, False, False, "")
+        if not job.done.wait(timeout) and self._abandon(job, timeout):
+            raise TimeoutError(job.error)
+        if job.status == "failed":
+            raise RuntimeError(job.error)
+        return job.result
+
+    def _abandon(self, job, timeout):
+        """Marca fallido un trabajo que superó su ``timeout``; ``False`` si terminó justo antes."""
+        with self._cond:
+            if job.done.is_set():
+                return False
+            job.error = f"trabajo {job.kind} sin terminar tras {timeout} s"
+            job.status_code = 504
+            self._class_stats(job.kind)["timed_out"] += 1
+            if job.status == "queued":
+                # Sigue en el heap: el worker que lo saque lo descarta sin ejecutarlo
+                job.status = "failed"
+                job.abandoned = True
+                job.done.set()
+                return True
+            # Ya corre: otro hilo toma su lugar y el actual sale al terminar
+            job.abandoned = True
+            self._start_worker(job.worker_priority)
+            return True
+
+    def _next_job(self, max_priority):
+        with self._cond:
+            while True:
+                while not self._heap or self._heap[0][0] > max_priority:
+                    self._cond.wait()
+                _priority, _seq, job = heapq.heappop(self._heap)
+                if not job.abandoned:
+                    break
+                job.func = job.args = job.context = None
+                self._forget(job)
+            job.status = "running"
+            job.worker_priority = max_priority
+            self._running += 1
+            return job
+
+    def _loop(self, max_priority):
+        while True:
+            job = self._next_job(max_priority)
+            if self._execute(job):
+                return  # abandonado por timeout: ya hay otro hilo en su lugar
+
+    def _execute(self, job):
+        """Ejecuta el trabajo; devuelve ``True`` si se abandonó mientras corría."""
+        job.started_at = time.monotonic()
+        if job.persist:
+            self._save(job, started_at=timezone.now())
+        try:
+            result = job.context.run(job.func, *job.args)
+            if job.with_status:
+                result, status_code = result
+            else:
+                status_code = 200
+            with self._cond:
+                if not job.abandoned:
+                    job.result, job.status_code, job.status = result, status_code, "done"
+        except Exception as exc:
+            logger.warning("Trabajo %s %s falló: %s", job.kind, job.id, exc)
+            metrics.error(f"job_{job.kind}")
+            with self._cond:
+                if not job.abandoned:
+                    job.error, job.status_code, job.status = short_error(exc), 500, "failed"
+        with self._cond:
+            if job.abandoned:
+                job.status = "failed"
+        job.finished_at = time.monotonic()
+        job.func = job.args = job.context = None
+        if job.persist:
+            self._save(job, finished_at=timezone.now())
+            close_old_connections()
+
+        with self._cond:
+            self._running -= 1
+            stats = self._class_stats(job.kind)
+            stats["completed" if job.status == "done" else "failed"] += 1
+            stats["total_run_ms"] += (job.finished_at - job.started_at) * 1000
+            stats["waits_ms"].append((job.started_at - job.enqueued_at) * 1000)
+            self._completions.append(job.finished_at)
+            self._forget(job)
+            if job.abandoned:
+                self._threads.remove(threading.current_thread())
+        job.done.set()
+        return job.abandoned
+
+    def _forget(self, job):
+        """Registra ``job`` como terminado y descarta los más viejos (con ``_cond`` tomado)."""
+        self._finished.append(job.id)
+        while len(self._finished) > MAX_FINISHED:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    def _save(self, job, **fields):
+        from .models import TranscriptionJob
+
+        try:
+            TranscriptionJob.objects.filter(id=job.id).update(
+                status=job.status, result=job.result, status_code=job.status_code, error=job.error, **fields
+            )
+        except Exception as exc:
+            logger.warning("No se pudo guardar el trabajo %s: %s", job.id, exc)
+
+    def get(self, job_id):
+        """Estado del trabajo (memoria de este proceso o base de datos), o ``None``."""
+        try:
+            key = uuid.UUID(str(job_id))
+        except ValueError:
+            return None
+        job = self._jobs.get(key)
+        if job is not None:
+            return job.as_dict()
+        from .models import TranscriptionJob
+
+        record = TranscriptionJob.objects.filter(id=key).first()
+        if record is None:
+            return None
+        if record.status in (record.STATUS_QUEUED, record.STATUS_RUNNING) and not _owner_alive(record.owner):
+            record.status, record.status_code, record.error = record.STATUS_FAILED, 500, ORPHAN_ERROR
+            record.finished_at = timezone.now()
+            record.save(update_fields=["status", "status_code", "error", "finished_at"])
+        data = {
+            "job_id": str(record.id),
+            "kind": record.kind,
+            "priority": record.priority,
+            "status": record.status,
+            "session_id": record.session_id,
+            "result": record.result,
+            "status_code": record.status_code,
+            "error": record.error,
+        }
+        if record.started_at:
+            data["wait_ms"] = round((record.started_at - record.created_at).total_seconds() * 1000, 1)
+        if record.finished_at and record.started_at:
+            data["run_ms"] = round((record.finished_at - record.started_at).total_seconds() * 1000, 1)
+        return data
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            while self._completions and now - self._completions[0] > THROUGHPUT_WINDOW:
+                self._completions.popleft()
+            depth = {kind: 0 for kind in PRIORITIES}
+            for priority, _seq, job in self._heap:
+                depth[job.kind] = depth.get(job.kind, 0) + 1
+            classes = {}
+            for kind, stats in self._stats.items():
+                finished = stats["completed"] + stats["failed"]
+                waits = list(stats["waits_ms"])
+                classes[kind] = {
+                    "submitted": stats["submitted"],
+                    "completed": stats["completed"],
+                    "failed": stats["failed"],
+                    "timed_out": stats["timed_out"],
+                    "queued": depth.get(kind, 0),
+                    "avg_wait_ms": round(sum(waits) / len(waits), 2) if waits else 0.0,
+                    "p95_wait_ms": round(_percentile(waits, 0.95), 2),
+                    "avg_run_ms": round(stats["total_run_ms"] / finished, 2) if finished else 0.0,
+                }
+            return {
+                "workers": self.workers,
+                "interactive_workers": self.interactive_workers,
+                "running": self._running,
+                "queue_depth": len(self._heap),
+                "throughput_per_min": round(len(self._completions) * 60.0 / THROUGHPUT_WINDOW, 2),
+                "classes": classes,
+            }
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Cola compartida del proceso, configurada con ``ASR_JOBS``."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            config = _config()
+            # Por defecto tantos hilos como el lote del planificador, para que los trabajos lo puedan llenar
+            batch = getattr(settings, "ASR_SCHEDULER", {}).get("MAX_BATCH_SIZE", 8)
+            _queue = JobQueue(
+                workers=config.get("WORKERS") or batch,
+                interactive_workers=config.get("INTERACTIVE_WORKERS") or batch,
+            )
+            # En un hilo aparte: get_queue también se llama desde vistas async
+            threading.Thread(target=_recover_orphans, args=(_queue,), name="asr-job-recover", daemon=True).start()
+        return _queue
+
+
+def _recover_orphans(queue):
+    try:
+        queue.recover_orphans()
+    except Exception as exc:
+        logger.warning("No se pudieron revisar los trabajos huérfanos: %s", exc)
+    finally:
+        close_old_connections()
+
+
+def _queue_depth():
+    classes = get_queue().stats()["classes"]
+    return {(kind,): classes.get(kind, {}).get("queued", 0) for kind in PRIORITIES}
+
+
+metrics.register_gauge(
+    "asr_job_queue_depth", "Trabajos en espera por clase de prioridad.", _queue_depth, labels=("kind",)
+)
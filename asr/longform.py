@@ -0,0 +1,66 @@
+"""División de audio largo en ventanas de 30 s y unión de sus segmentos.
+
+Whisper solo ve 30 s por pasada. El audio se corta en los puntos más silenciosos
+cerca del límite de cada ventana; cada ventana incluye además un poco de
+contexto de sus vecinas, y al unir se conserva cada segmento solo en la ventana
+"dueña" del instante donde cae su punto medio.
+"""
+import numpy as np
+
+SAMPLE_RATE = 16000
+WINDOW_SAMPLES = 30 * SAMPLE_RATE
+# Contexto que cada ventana comparte con la anterior y con la siguiente
+OVERLAP_SAMPLES = 2 * SAMPLE_RATE
+# Zona al final de cada región donde se busca el punto más silencioso para cortar
+SEARCH_SAMPLES = 6 * SAMPLE_RATE
+FRAME_SAMPLES = SAMPLE_RATE // 10
+
+
+def _quietest_point(samples, lo, hi):
+    """Inicio del frame de 100 ms con menor energía dentro de ``[lo, hi)``."""
+    frames = (hi - lo) // FRAME_SAMPLES
+    if frames <= 1:
+        return hi
+    block = np.asarray(samples[lo:lo + frames * FRAME_SAMPLES], dtype=np.float32)
+    energy = np.square(block.reshape(frames, FRAME_SAMPLES)).mean(axis=1)
+    return lo + int(np.argmin(energy)) * FRAME_SAMPLES + FRAME_SAMPLES // 2
+
+
+def split_windows(samples, cut_points=None):
+    """Devuelve ventanas ``(start, stop, own_start, own_stop)`` en muestras.
+
+    ``[start, stop)`` es el audio que se decodifica (<= 30 s) y ``[own_start,
+    own_stop)`` la región de la que la ventana es dueña al unir. Si se pasan
+    ``cut_points`` (p. ej. pausas detectadas por VAD) se prefieren como cortes.
+    """
+    total = len(samples)
+    region = WINDOW_SAMPLES - 2 * OVERLAP_SAMPLES
+    candidates = np.asarray(sorted(cut_points or []), dtype=np.int64)
+    cuts = [0]
+    while total - cuts[-1] > WINDOW_SAMPLES - OVERLAP_SAMPLES:
+        hi = cuts[-1] + region
+        lo = hi - SEARCH_SAMPLES
+        inside = candidates[(candidates > lo) & (candidates <= hi)]
+        cuts.append(int(inside[-1]) if inside.size else _quietest_point(samples, lo, hi))
+    cuts.append(total)
+
+    windows = []
+    for own_start, own_stop in zip(cuts[:-1], cuts[1:]):
+        start = max(0, own_start - OVERLAP_SAMPLES)
+        stop = min(total, own_stop + OVERLAP_SAMPLES)
+        windows.append((start, stop, own_start, own_stop))
+    return windows
+
+
+def merge_segments(windows, results):
+    """Une los segmentos de cada ventana (tiempos relativos) en una lista absoluta."""
+    merged = []
+    for (start, _stop, own_start, own_stop), segments in zip(windows, results):
+        offset = start / SAMPLE_RATE
+        for segment in segments:
+            seg_start = offset + segment["start"]
+            seg_end = offset + segment["end"]
+            middle = (seg_start + seg_end) / 2 * SAMPLE_RATE
+            if own_start <= middle < own_stop:
+                merged.append({"start": round(seg_start, 2), "end": round(seg_end, 2), "text": segment["text"]})
+    return merged
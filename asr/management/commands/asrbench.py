@@ -0,0 +1,104 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asr import benchmark
+
+
+def _rss(value):
+    return "n/d" if value is None else f"{value:.1f}"
+
+
+class Command(BaseCommand):
+    help = "Mide latencia, factor de tiempo real y memoria de las etapas del pipeline (sin red)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lengths", default="5,30,120", help="Duraciones (s) del audio sintético, separadas por comas."
+        )
+        parser.add_argument("--fixture", action="append", default=[], help="Archivo de audio de ejemplo (se puede repetir).")
+        parser.add_argument(
+            "--stage", action="append", choices=benchmark.STAGES, help="Etapa a medir (por defecto todas)."
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Ejecuciones medidas por etapa.")
+        parser.add_argument("--warmup", type=int, default=1, help="Ejecuciones previas no medidas.")
+        parser.add_argument(
+            "--google-latency", type=float, default=0.0, help="Latencia simulada (s) del stub de Google."
+        )
+        parser.add_argument("--output", help="Ruta del JSON de resultados.")
+        parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar.")
+        parser.add_argument(
+            "--threshold", type=float, default=0.10, help="Aumento relativo de p50 que cuenta como regresión."
+        )
+        parser.add_argument(
+            "--fail-on-regression", action="store_true", help="Terminar con error si hay regresiones."
+        )
+
+    def handle(self, *args, **options):
+        inputs = []
+        try:
+            lengths = [float(value) for value in options["lengths"].split(",") if value.strip()]
+        except ValueError:
+            raise CommandError("--lengths debe ser una lista de números")
+        for seconds in lengths:
+            inputs.append((f"synthetic-{seconds:g}s", benchmark.synthetic_audio(seconds), None))
+        for path in options["fixture"]:
+            try:
+                samples, data = benchmark.load_fixture(path)
+            except Exception as exc:
+                raise CommandError(f"No se pudo leer {path}: {exc}")
+            inputs.append((os.path.basename(path), samples, data))
+        if not inputs:
+            raise CommandError("No hay audio para medir")
+
+        runner = benchmark.Benchmark(
+            stages=options["stage"] or benchmark.STAGES,
+            repeat=options["repeat"],
+            warmup=options["warmup"],
+            google_latency=options["google_latency"],
+            log=lambda message: self.stderr.write(message),
+        )
+        report = {"meta": benchmark.metadata(), "results": runner.run(inputs)}
+        self._print(report["results"])
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Resultados en {options['output']}")
+
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"No se pudo leer {options['compare']}: {exc}")
+            rows = benchmark.compare(report, baseline, options["threshold"])
+            self._print_comparison(rows, baseline.get("meta", {}).get("commit", "?"))
+            regressions = [row for row in rows if row["regression"]]
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regresiones de latencia")
+
+    def _print(self, results):
+        self.stdout.write(
+            f"{'etapa':<12} {'entrada':<24} {'audio s':>8} {'p50 ms':>10} {'p95 ms':>10} "
+            f"{'RTF':>8} {'RSS MB':>8} {'alloc MB':>9}"
+        )
+        for item in results:
+            if "error" in item:
+                self.stdout.write(f"{item['stage']:<12} {item['input']:<24} {item['audio_seconds']:>8.1f} {item['error']}")
+                continue
+            self.stdout.write(
+                f"{item['stage']:<12} {item['input']:<24} {item['audio_seconds']:>8.1f} {item['p50_ms']:>10.2f} "
+                f"{item['p95_ms']:>10.2f} {item['real_time_factor']:>8.4f} {_rss(item['peak_rss_mb']):>8} "
+                f"{item['alloc_peak_mb']:>9.2f}"
+            )
+
+    def _print_comparison(self, rows, commit):
+        self.stdout.write(f"Comparación con {commit}:")
+        for row in rows:
+            flag = "  REGRESIÓN" if row["regression"] else ""
+            self.stdout.write(
+                f"{row['stage']:<12} {row['input']:<24} {row['baseline_p50_ms']:>10.2f} -> {row['p50_ms']:>10.2f} ms "
+                f"({row['p50_change']:+.1%}){flag}"
+            )
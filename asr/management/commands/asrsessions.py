@@ -0,0 +1,60 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asr import sessions
+
+
+class Command(BaseCommand):
+    help = "Muestra el uso de disco de las sesiones en tiempo real y borra las expiradas o indicadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["report", "purge"], help="report: listar sesiones; purge: borrarlas.")
+        parser.add_argument("--session", action="append", default=[], help="Sesión a borrar (se puede repetir).")
+        parser.add_argument(
+            "--older-than", type=float, help="Borrar sesiones sin actividad hace más de N segundos (por defecto el TTL)."
+        )
+        parser.add_argument("--all", action="store_true", help="Borrar todas las sesiones.")
+        parser.add_argument("--json", action="store_true", help="Salida en JSON.")
+
+    def handle(self, *args, **options):
+        if options["action"] == "report":
+            self._report(options["json"])
+        else:
+            self._purge(options)
+
+    def _report(self, as_json):
+        now = time.time()
+        items = sorted(sessions.list_sessions(), key=lambda item: item["mtime"])
+        for item in items:
+            item["idle_seconds"] = round(now - item["mtime"], 1)
+        total = sum(item["bytes"] for item in items)
+        if as_json:
+            self.stdout.write(json.dumps({"sessions": items, "count": len(items), "bytes": total}, indent=2))
+            return
+        for item in items:
+            self.stdout.write(
+                f"{item['session_id']:<40} {item['bytes'] / 2**20:9.2f} MB  "
+                f"{item['files']:4d} archivos  inactiva {item['idle_seconds']:.0f} s"
+            )
+        self.stdout.write(f"{len(items)} sesiones, {total / 2**20:.2f} MB en {sessions.root()}")
+
+    def _purge(self, options):
+        if options["session"]:
+            freed = 0
+            for session_id in options["session"]:
+                if not sessions.is_valid_session_id(session_id):
+                    raise CommandError(f"session_id inválido: {session_id!r}")
+                freed += sessions.release(session_id)
+            self.stdout.write(f"{len(options['session'])} sesiones borradas, {freed / 2**20:.2f} MB liberados")
+            return
+
+        ttl = options["older_than"]
+        if options["all"] or ttl == 0:
+            ttl = -1  # cualquier antigüedad (un TTL de 0 desactiva la expiración)
+        result = sessions.collect(ttl=ttl)
+        self.stdout.write(
+            f"{len(result['removed'])} sesiones borradas; quedan {result['sessions']} "
+            f"({result['bytes'] / 2**20:.2f} MB)"
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from asr.model_server import serve
+
+
+class Command(BaseCommand):
+    help = "Inicia el proceso que mantiene cargado el modelo Whisper para todos los workers web."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--address",
+            help="unix:/ruta.sock o host:puerto (por defecto ASR_MODEL_SERVER['ADDRESS']).",
+        )
+        parser.add_argument("--no-warmup", action="store_true", help="No ejecutar la pasada de calentamiento.")
+
+    def handle(self, *args, **options):
+        serve(
+            address=options["address"],
+            warmup=not options["no_warmup"],
+            log=lambda message: self.stdout.write(message),
+        )
@@ -0,0 +1,84 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asr import backends, bulk
+from asr.decoding import from_request
+from asr.utils import configure_scheduler, model_for_endpoint, preload_whisper
+
+
+class Command(BaseCommand):
+    help = "Transcribe en lote un directorio o un manifiesto de archivos de audio y escribe JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Directorio (recursivo) o manifiesto (una ruta por línea o JSONL con path).")
+        parser.add_argument("--output", required=True, help="Archivo JSONL de resultados (también es el checkpoint).")
+        parser.add_argument("--resume", action="store_true", help="Continuar: omitir rutas que ya están en --output.")
+        parser.add_argument("--retry-errors", action="store_true", help="Con --resume, reintentar las que fallaron.")
+        parser.add_argument("--engine", choices=["whisper", "google"], default="whisper")
+        parser.add_argument("--model", help="Variante de ASR_MODELS (por defecto la del endpoint upload).")
+        parser.add_argument("--profile", help="Perfil de decodificación (por defecto el del endpoint upload).")
+        parser.add_argument("--workers", type=int, help="Procesos de decodificación (por defecto CPUs / 4).")
+        parser.add_argument("--decode-threads", type=int, default=1, help="Hilos BLAS/OpenMP por proceso de decodificación.")
+        parser.add_argument(
+            "--threads", type=int, help="Hilos de torch para la inferencia (por defecto CPUs - workers)."
+        )
+        parser.add_argument("--batch-size", type=int, default=8, help="Tamaño máximo de lote de Whisper.")
+        parser.add_argument(
+            "--concurrency", type=int, help="Archivos transcribiéndose a la vez (por defecto 2 × --batch-size)."
+        )
+        parser.add_argument("--extensions", help="Extensiones a incluir al recorrer un directorio, separadas por comas.")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if not os.path.exists(source):
+            raise CommandError(f"No existe {source}")
+        if os.path.exists(options["output"]) and not options["resume"]:
+            raise CommandError(f"{options['output']} ya existe: usar --resume o borrarlo")
+        extensions = bulk.AUDIO_EXTENSIONS
+        if options["extensions"]:
+            extensions = tuple(f".{ext.strip().lstrip('.').lower()}" for ext in options["extensions"].split(","))
+
+        model = options["model"] or model_for_endpoint("upload")
+        try:
+            decoding = from_request({"profile": options["profile"]}, "upload")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        transcriber = bulk.BulkTranscriber(
+            engine=options["engine"],
+            model=model,
+            decoding=decoding,
+            workers=options["workers"],
+            decode_threads=options["decode_threads"],
+            concurrency=options["concurrency"] or 2 * options["batch_size"],
+            log=lambda message: self.stderr.write(message),
+        )
+        if options["engine"] == "whisper":
+            self._prepare_whisper(model, options["threads"], transcriber.workers, options["batch_size"])
+
+        summary = transcriber.run(
+            bulk.find_audio(source, extensions),
+            options["output"],
+            resume=options["resume"],
+            retry_errors=options["retry_errors"],
+        )
+        self.stdout.write(json.dumps(summary, indent=2))
+        self.stdout.write(
+            f"{summary['ok']} transcritos, {summary['errors']} con error, {summary['skipped']} omitidos; "
+            f"{summary['audio_seconds'] / 3600:.2f} h de audio en {summary['wall_seconds']:.1f} s "
+            f"({summary['files_per_second']} archivos/s, {summary['audio_speedup']}x tiempo real)"
+        )
+
+    def _prepare_whisper(self, model, threads, workers, batch_size):
+        # Los núcleos se reparten entre los procesos de decodificación y torch
+        threads = threads or max(1, (os.cpu_count() or 1) - workers)
+        try:
+            backends.configure_threads(threads)
+            preload_whisper(model)
+        except Exception as exc:
+            raise CommandError(f"No se pudo cargar Whisper ({model}): {exc}")
+        if not configure_scheduler(max_batch_size=batch_size, batch_window_ms=50):
+            self.stderr.write("--batch-size no se aplica: el lote lo fija ASR_SCHEDULER del servidor de modelo")
+        self.stderr.write(f"Whisper {model}: {threads} hilos de torch, {workers} procesos de decodificación")
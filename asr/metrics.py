@@ -0,0 +1,292 @@
+"""Métricas en formato de texto de Prometheus y trace id por petición.
+
+Registro propio y mínimo (contadores, gauges e histogramas con etiquetas), sin
+dependencias: ``GET /asr/metrics/`` devuelve :func:`render`. Cada etapa del
+pipeline se mide con ``with metrics.stage("decode"):`` en el histograma
+``asr_stage_seconds``; las etapas pueden estar anidadas (``resample`` ocurre
+dentro de ``decode``, ``encoder`` dentro de ``generate``).
+
+El registro es por proceso. Con un servidor de modelo, las etapas de inferencia
+(``features``, ``encoder``, ``generate``) se miden allí y viajan en la respuesta
+(:func:`record_stages`), así que aparecen en las métricas del worker web que hizo
+la petición. Con varios workers de gunicorn cada uno tiene su propio registro y
+un scrape de ``/asr/metrics/`` ve solo al que lo atendió: para totales exactos
+conviene un worker por proceso con su propio target (p. ej. un dyno con
+``WEB_CONCURRENCY=1``), o sumar en Prometheus las series de cada worker.
+
+El trace id de la petición vive en un ``contextvars.ContextVar`` que
+``TraceMiddleware`` fija y devuelve en la cabecera ``X-Trace-Id``; los logs del
+paquete lo incluyen (ver ``TraceIdFilter`` y ``LOGGING`` en settings).
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_HEADER = "X-Trace-Id"
+# Ids recibidos del cliente (X-Request-ID) que se aceptan tal cual
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_trace_id = contextvars.ContextVar("asr_trace_id", default="")
+# Lista donde stage() también acumula lo medido (ver collect_stages)
+_collected_stages = contextvars.ContextVar("asr_collected_stages", default=None)
+
+
+def _config():
+    return getattr(settings, "ASR_METRICS", {})
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: etiquetas esperadas {self.labels}, recibidas {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge con valor fijado por ``set`` o calculado al exportar con ``callback``.
+
+    ``callback()`` devuelve un número (sin etiquetas) o ``{valores de etiquetas: número}``.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.callback is None:
+            return super()._samples()
+        try:
+            values = self.callback()
+        except Exception as exc:
+            logging.getLogger(__name__).warning("gauge %s: %s", self.name, exc)
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            (self.name, key if isinstance(key, tuple) else (key,), (), value)
+            for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(state["counts"]), state["sum"], state["count"]) for key, state in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_bucket", key, (("le", "+Inf"),), count))
+            samples.append((f"{self.name}_sum", key, (), total))
+            samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "asr_stage_seconds",
+    "Duración de cada etapa del pipeline (upload_read, decode, resample, features, encoder, generate, "
+    "google_request, disk_write).",
+    labels=("stage",),
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "asr_request_seconds", "Duración de las peticiones HTTP por vista y código.", labels=("view", "method", "status"),
+))
+RESULTS = REGISTRY.register(Counter(
+    "asr_results_total", "Resultados por motor: ok, empty, filtered o no_speech.", labels=("engine", "outcome"),
+))
+ERRORS = REGISTRY.register(Counter("asr_errors_total", "Errores por etapa.", labels=("stage",)))
+
+
+@contextmanager
+def stage(name):
+    """Mide un bloque en ``asr_stage_seconds{stage=name}``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        collected = _collected_stages.get()
+        if collected is not None:
+            collected.append((name, elapsed))
+
+
+@contextmanager
+def collect_stages():
+    """Devuelve una lista con los ``(etapa, segundos)`` medidos dentro del bloque."""
+    collected = []
+    token = _collected_stages.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected_stages.reset(token)
+
+
+def record_stages(stages):
+    """Registra etapas medidas en otro proceso (el servidor de modelo)."""
+    for name, seconds in stages:
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def result(engine, outcome):
+    RESULTS.inc(engine=engine, outcome=outcome)
+
+
+def error(stage_name):
+    ERRORS.inc(stage=stage_name)
+
+
+def register_gauge(name, documentation, callback, labels=()):
+    """Gauge calculado al exportar (p. ej. profundidad de colas)."""
+    return REGISTRY.register(Gauge(name, documentation, labels=labels, callback=callback))
+
+
+def render():
+    return REGISTRY.render()
+
+
+def enabled():
+    return _config().get("ENABLED", True)
+
+
+def trace_ids_enabled():
+    return _config().get("TRACE_IDS", True)
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def set_trace_id(trace_id):
+    """Fija el trace id del contexto actual; devuelve el token para restaurarlo."""
+    return _trace_id.set(trace_id)
+
+
+def reset_trace_id(token):
+    _trace_id.reset(token)
+
+
+def new_trace_id(incoming=None):
+    """Usa el id del cliente si es válido o genera uno nuevo."""
+    if incoming and _TRACE_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+class TraceIdFilter(logging.Filter):
+    """Agrega ``trace_id`` a los registros de log (``-`` fuera de una petición)."""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get() or "-"
+        return True
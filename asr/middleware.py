@@ -0,0 +1,57 @@
+"""Middleware de trazas: trace id por petición y duración en ``asr_request_seconds``."""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class TraceMiddleware:
+    """Usa el ``X-Request-ID`` del cliente (o genera uno) como trace id y lo devuelve en ``X-Trace-Id``.
+
+    Funciona con vistas síncronas y asíncronas; con ``ASR_METRICS["TRACE_IDS"]``
+    en falso solo mide la duración.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        token, started = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.reset_trace_id(token)
+        return self._finish(request, response, started)
+
+    async def _acall(self, request):
+        token, started = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.reset_trace_id(token)
+        return self._finish(request, response, started)
+
+    def _start(self, request):
+        trace_id = metrics.new_trace_id(request.headers.get("X-Request-ID"))
+        request.trace_id = trace_id
+        return metrics.set_trace_id(trace_id), time.perf_counter()
+
+    def _finish(self, request, response, started):
+        match = getattr(request, "resolver_match", None)
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+        if metrics.trace_ids_enabled():
+            response[metrics.TRACE_HEADER] = request.trace_id
+        return response
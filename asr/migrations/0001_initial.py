@@ -0,0 +1,35 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:04
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=32)),
+                ('priority', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('running', 'En ejecución'), ('done', 'Terminado'), ('failed', 'Fallido')], default='queued', max_length=16)),
+                ('session_id', models.CharField(blank=True, default='', max_length=64)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('status_code', models.PositiveSmallIntegerField(default=200)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='asr_transcr_status_b21b42_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asr', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+    ]
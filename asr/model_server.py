@@ -0,0 +1,188 @@
+"""Servidor de modelo compartido por todos los workers web.
+
+El modelo Whisper vive en un único proceso (``manage.py runmodelserver``) que
+escucha en un socket local. Los workers web no importan torch ni cargan pesos:
+envían las muestras por ``multiprocessing.connection`` y reciben el resultado.
+Dentro del servidor las peticiones de todos los workers pasan por el mismo
+planificador, así que también se agrupan en lotes.
+
+Los mensajes viajan como pickle: quien conoce la clave puede ejecutar código en
+el servidor, así que se exige una ``ASR_MODEL_SERVER["AUTHKEY"]`` explícita
+(no se reutiliza ``SECRET_KEY``). Servidor y workers deben correr en el mismo
+host; sin ``ADDRESS`` cada worker infiere en su propio proceso.
+"""
+import queue
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+
+class ModelServerUnavailable(RuntimeError):
+    """El servidor de modelo configurado no acepta conexiones o no respondió a tiempo."""
+
+
+def _config():
+    return getattr(settings, "ASR_MODEL_SERVER", {})
+
+
+def _parse_address(address):
+    """``unix:/ruta/al.sock`` o ``host:puerto``."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):], "AF_UNIX"
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port)), "AF_INET"
+
+
+def _authkey():
+    key = _config().get("AUTHKEY")
+    if not key:
+        raise ImproperlyConfigured("ASR_MODEL_SERVER['AUTHKEY'] es obligatoria para usar el servidor de modelo")
+    return key.encode() if isinstance(key, str) else key
+
+
+class ModelClient:
+    """Cliente con una conexión por hilo; reconecta una vez si el servidor se reinició."""
+
+    def __init__(self, address, authkey, timeout=None):
+        self.address, self.family = _parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, family=self.family, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, message, on_text=None):
+        """Envía ``message`` y espera el resultado; los mensajes ``text`` previos van a ``on_text``."""
+        for attempt in range(2):
+            received = False
+            try:
+                conn = self._connection()
+                conn.send(message)
+                while True:
+                    if self.timeout is not None and not conn.poll(self.timeout):
+                        self._reset()
+                        raise ModelServerUnavailable("el servidor de modelo no respondio a tiempo")
+                    reply = conn.recv()
+                    if "text" not in reply:
+                        break
+                    received = True
+                    on_text(reply["text"])
+                break
+            except (EOFError, OSError, AuthenticationError) as exc:
+                self._reset()
+                # Sin reintento si ya llegó texto: se repetiría en el cliente
+                if attempt or received:
+                    raise ModelServerUnavailable(f"servidor de modelo en {self.address} no disponible: {exc}") from exc
+        # Etapas medidas en el servidor: el registro de métricas es por proceso
+        metrics.record_stages(reply.get("stages", ()))
+        if not reply["ok"]:
+            raise RuntimeError(f"servidor de modelo: {reply['error']}")
+        return reply["result"]
+
+    def generate(self, samples, options):
+        return self._call({"op": "generate", "samples": samples, "options": options})
+
+    def generate_stream(self, samples, options, on_text):
+        """Como :meth:`generate`, llamando a ``on_text`` con el texto a medida que se genera."""
+        return self._call({"op": "generate_stream", "samples": samples, "options": options}, on_text)
+
+    def stats(self):
+        return self._call({"op": "stats"})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Cliente compartido del proceso, o ``None`` si no hay servidor configurado."""
+    global _client
+    address = _config().get("ADDRESS")
+    if not address:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = ModelClient(address, _authkey(), timeout=_config().get("TIMEOUT"))
+        return _client
+
+
+def _handle(conn):
+    from .utils import get_scheduler, local_inference_stats
+
+    scheduler = get_scheduler()
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, ConnectionError):
+                return
+            stages = []
+            try:
+                if message["op"] == "generate":
+                    result = scheduler.submit(message["samples"], message["options"], stages=stages)
+                elif message["op"] == "generate_stream":
+                    result = _generate_stream(conn, scheduler, message, stages)
+                elif message["op"] == "stats":
+                    result = local_inference_stats()
+                else:
+                    raise ValueError(f"operacion desconocida: {message['op']}")
+                reply = {"ok": True, "result": result, "stages": stages}
+            except Exception as exc:
+                reply = {"ok": False, "error": f"{exc.__class__.__name__}: {exc}", "stages": stages}
+            try:
+                conn.send(reply)
+            except (EOFError, ConnectionError, BrokenPipeError):
+                return
+
+
+def _generate_stream(conn, scheduler, message, stages):
+    """Envía ``{"ok", "text"}`` por cada fragmento generado y devuelve el resultado final."""
+    events = queue.Queue()
+    item = {"samples": message["samples"], "on_text": lambda text: events.put(("text", text))}
+    future = scheduler.submit_async(item, message["options"], stages=stages)
+    future.add_done_callback(lambda _future: events.put(("done", None)))
+    while True:
+        kind, text = events.get()
+        if kind == "done":
+            return future.result()
+        conn.send({"ok": True, "text": text})
+
+
+def serve(address=None, warmup=True, log=print):
+    """Carga el modelo, lo calienta y atiende conexiones hasta que se interrumpa."""
+    from .utils import warmup as warmup_model
+
+    address = address or _config().get("ADDRESS") or "127.0.0.1:8765"
+    listen_address, family = _parse_address(address)
+    authkey = _authkey()
+    if warmup:
+        log("Cargando y calentando el modelo...")
+        warmup_model()
+    with Listener(listen_address, family=family, authkey=authkey) as listener:
+        log(f"Servidor de modelo escuchando en {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as exc:  # handshake fallido (authkey incorrecta, etc.)
+                log(f"Conexion rechazada: {exc}")
+                continue
+            threading.Thread(target=_handle, args=(conn,), daemon=True).start()
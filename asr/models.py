@@ -1,3 +1,39 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class TranscriptionJob(models.Model):
+    """Trabajo de transcripción asíncrono (resultado consultable desde cualquier worker)."""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "En cola"),
+        (STATUS_RUNNING, "En ejecución"),
+        (STATUS_DONE, "Terminado"),
+        (STATUS_FAILED, "Fallido"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=32)
+    priority = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    session_id = models.CharField(max_length=64, blank=True, default="")
+    # Proceso que lo ejecuta (host:pid): si terminó sin completarlo, el trabajo quedó huérfano
+    owner = models.CharField(max_length=128, blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(default=200)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
@@ -0,0 +1,229 @@
+"""Decodificación de parciales reutilizando lo ya decodificado en chunks anteriores.
+
+En tiempo real la ventana de una sesión empieza en el mismo punto durante
+varios chunks y solo crece por el final. Para cada parcial el decoder recibe:
+
+* como prompt (``<|startofprev|>``) el texto confirmado antes de la ventana;
+* como prefijo forzado los tokens (con marcas de tiempo) de los segmentos ya
+  confirmados dentro de la ventana.
+
+Prompt, tokens iniciales y prefijo se procesan en una sola pasada del decoder
+(prefill con caché de claves/valores) y la búsqueda voraz solo genera los
+tokens nuevos del final. El encoder sí corre en cada parcial: la ventana crece
+con cada chunk, así que su log-mel nunca se repite (una ventana idéntica ya la
+resuelve la caché de transcripciones).
+
+Es un bucle voraz propio con las reglas de marcas de tiempo de Whisper; solo
+se usa cuando el perfil del parcial es voraz (``NUM_BEAMS`` 1, una temperatura).
+"""
+import time
+
+from django.conf import settings
+
+from . import decoding, metrics
+
+TIME_PRECISION = 0.02  # segundos por token de marca de tiempo
+MAX_INITIAL_TIMESTAMP = 1.0
+DEFAULT_PROMPT_TOKENS = 128
+
+DECODER_STEPS = metrics.REGISTRY.register(metrics.Counter(
+    "asr_decoder_steps_total", "Pasadas del decoder de Whisper en los parciales con prefijo.", labels=("kind",),
+))
+
+
+def _config():
+    return getattr(settings, "ASR_STREAMING", {})
+
+
+def enabled(profile):
+    """Si los parciales usan este módulo: activado y con un perfil voraz."""
+    return _config().get("PREFIX_REUSE", True) and decoding.is_greedy(profile)
+
+
+class Vocab:
+    """Ids especiales del tokenizer de Whisper usados por el bucle de decodificación."""
+
+    def __init__(self, processor, model):
+        tokenizer = processor.tokenizer
+        ids = tokenizer.convert_tokens_to_ids
+        self.eot = tokenizer.eos_token_id
+        self.sot = ids("<|startoftranscript|>")
+        self.startofprev = ids("<|startofprev|>")
+        self.no_timestamps = ids("<|notimestamps|>")
+        self.timestamp_begin = ids("<|0.00|>")
+        self.init = [self.sot] + [
+            token for _position, token in processor.get_decoder_prompt_ids(
+                language="spanish", task="transcribe", no_timestamps=False
+            )
+        ]
+        config = model.generation_config
+        self.suppress = list(getattr(config, "suppress_tokens", None) or [])
+        self.begin_suppress = list(getattr(config, "begin_suppress_tokens", None) or [])
+        self.max_positions = model.config.max_target_positions
+
+
+def prompt_tokens(processor, vocab, text, max_tokens=DEFAULT_PROMPT_TOKENS):
+    """``<|startofprev|>`` + los últimos ``max_tokens`` tokens de ``text`` (vacío si no hay texto)."""
+    text = (text or "").strip()
+    if not text or max_tokens <= 0:
+        return []
+    return [vocab.startofprev] + processor.tokenizer.encode(" " + text, add_special_tokens=False)[-max_tokens:]
+
+
+def _apply_rules(logits, sequence, vocab, repetition_penalty):
+    """Reglas de Whisper sobre los logits del siguiente token (``sequence``: tokens tras los iniciales)."""
+    import torch
+
+    ts_begin = vocab.timestamp_begin
+    logits[vocab.suppress] = -float("inf")
+    logits[vocab.no_timestamps] = -float("inf")
+    logits[vocab.eot + 1:ts_begin] = -float("inf")  # otros tokens especiales
+    if repetition_penalty and repetition_penalty != 1.0:
+        seen = sorted({token for token in sequence if token < vocab.eot})
+        if seen:
+            values = logits[seen]
+            logits[seen] = torch.where(values > 0, values / repetition_penalty, values * repetition_penalty)
+
+    if not sequence:
+        # El primer token es una marca de tiempo temprana
+        logits[vocab.begin_suppress] = -float("inf")
+        logits[:ts_begin] = -float("inf")
+        logits[ts_begin + int(round(MAX_INITIAL_TIMESTAMP / TIME_PRECISION)) + 1:] = -float("inf")
+        return logits
+
+    last_was_timestamp = sequence[-1] >= ts_begin
+    penultimate_was_timestamp = len(sequence) < 2 or sequence[-2] >= ts_begin
+    if last_was_timestamp:
+        if penultimate_was_timestamp:
+            logits[ts_begin:] = -float("inf")  # después de abrir un segmento viene texto
+        else:
+            logits[:vocab.eot] = -float("inf")  # después de texto + marca: otra marca o fin
+    timestamps = [token for token in sequence if token >= ts_begin]
+    if timestamps:
+        # Las marcas no retroceden
+        floor = timestamps[-1] if last_was_timestamp and not penultimate_was_timestamp else timestamps[-1] + 1
+        logits[ts_begin:floor] = -float("inf")
+
+    # Si la probabilidad total de las marcas supera la del mejor token de texto, se fuerza una marca
+    logprobs = torch.log_softmax(logits.float(), dim=-1)
+    if torch.logsumexp(logprobs[ts_begin:], dim=-1) > logprobs[:ts_begin].max():
+        logits[:ts_begin] = -float("inf")
+    return logits
+
+
+def greedy_decode(model, encoder_hidden, vocab, prompt, prefix, max_new_tokens, repetition_penalty=1.0,
+                  max_time=None):
+    """Prefill de ``prompt + iniciales + prefix`` en una pasada y búsqueda voraz del resto.
+
+    Devuelve ``(tokens nuevos, pasadas del decoder)``.
+    """
+    import torch
+
+    started = time.monotonic()
+    decoder_ids = torch.tensor([prompt + vocab.init + prefix], device=encoder_hidden.device)
+    encoder_outputs = (encoder_hidden,)
+    sequence = list(prefix)
+    new_tokens = []
+    with torch.no_grad():
+        output = model(encoder_outputs=encoder_outputs, decoder_input_ids=decoder_ids, use_cache=True)
+        steps = 1
+        while len(new_tokens) < max_new_tokens:
+            logits = _apply_rules(output.logits[0, -1].float(), sequence, vocab, repetition_penalty)
+            token = int(torch.argmax(logits))
+            if token == vocab.eot:
+                break
+            new_tokens.append(token)
+            sequence.append(token)
+            if max_time and time.monotonic() - started > max_time:
+                break
+            output = model(
+                encoder_outputs=encoder_outputs,
+                decoder_input_ids=torch.tensor([[token]], device=encoder_hidden.device),
+                past_key_values=output.past_key_values,
+                use_cache=True,
+            )
+            steps += 1
+    return new_tokens, steps
+
+
+def parse_segments(tokenizer, tokens, timestamp_begin, window_seconds):
+    """Segmentos ``{start, end, text, tokens, closed}`` de una salida con marcas de tiempo.
+
+    ``tokens`` de cada segmento incluye sus marcas (sirve de prefijo forzado); un
+    segmento sin marca de cierre (salida cortada) termina en ``window_seconds``.
+    """
+    segments = []
+    current = None
+    for index, token in enumerate(tokens):
+        if token >= timestamp_begin:
+            seconds = (token - timestamp_begin) * TIME_PRECISION
+            if current is None:
+                current = {"start": seconds, "first": index, "text": []}
+                continue
+            if current["text"]:
+                segments.append({
+                    "start": current["start"],
+                    "end": seconds,
+                    "text": tokenizer.decode(current["text"], skip_special_tokens=True).strip(),
+                    "tokens": tokens[current["first"]:index + 1],
+                    "closed": True,
+                })
+            current = None
+        else:
+            if current is None:
+                current = {"start": segments[-1]["end"] if segments else 0.0, "first": index, "text": []}
+            current["text"].append(token)
+    if current is not None and current["text"]:
+        segments.append({
+            "start": current["start"],
+            "end": window_seconds,
+            "text": tokenizer.decode(current["text"], skip_special_tokens=True).strip(),
+            "tokens": tokens[current["first"]:],
+            "closed": False,
+        })
+    return [segment for segment in segments if segment["text"]]
+
+
+_vocabs = {}
+
+
+def ejecutar_lote(processor, model, name, batch, profile, repetition_penalty=1.0):
+    """Runner de los parciales con prefijo: cada item ``{samples|features, num_samples, prompt, prefix}``.
+
+    Los items se decodifican uno por uno (cada uno tiene su propio prompt y
+    prefijo). Devuelve ``{"segments", "steps"}``.
+    """
+    import torch
+
+    vocab = _vocabs.get(name)
+    if vocab is None:
+        vocab = _vocabs[name] = Vocab(processor, model)
+    max_length = profile["MAX_LENGTH"]
+    results = []
+    for item in batch:
+        if item.get("features") is not None:
+            input_features = torch.from_numpy(item["features"])[None]
+        else:
+            input_features = processor(item["samples"], sampling_rate=16000, return_tensors="pt").input_features
+        with torch.no_grad(), metrics.stage("encoder"):
+            encoder_hidden = model.get_encoder()(input_features.to(model.dtype)).last_hidden_state
+
+        prompt = prompt_tokens(processor, vocab, item.get("prompt"), _config().get("PROMPT_TOKENS", DEFAULT_PROMPT_TOKENS))
+        prefix = list(item.get("prefix") or [])
+        room = vocab.max_positions - len(prompt) - len(vocab.init) - len(prefix)
+        if room < 8:
+            prefix, room = [], vocab.max_positions - len(prompt) - len(vocab.init)
+        with metrics.stage("generate"):
+            new_tokens, steps = greedy_decode(
+                model, encoder_hidden, vocab, prompt, prefix, min(max_length, room),
+                repetition_penalty=repetition_penalty, max_time=profile.get("MAX_TIME"),
+            )
+        DECODER_STEPS.inc(steps - 1, kind="generated")
+        DECODER_STEPS.inc(kind="prefill")
+        window_seconds = item["num_samples"] / 16000
+        results.append({
+            "segments": parse_segments(processor.tokenizer, new_tokens, vocab.timestamp_begin, window_seconds),
+            "steps": steps,
+            "prefix_tokens": len(prefix),
+        })
+    return results
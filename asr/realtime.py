@@ -0,0 +1,198 @@
+"""Procesamiento de sesiones en tiempo real, compartido por HTTP y WebSocket."""
+import logging
+import os
+
+from . import admission, google_stream, metrics, sessions, stream_decoder
+from .decoding import profile_for_endpoint
+from .fanout import engine_timeout, run_parallel, short_error
+from .jobs import get_queue
+from .streaming import transcribir_parcial
+from .utils import (
+    cargar_muestras,
+    cargar_parcial,
+    combined_wav_path,
+    concat_session_to_wav,
+    guardar_parcial,
+    model_for_endpoint,
+    save_chunk_file,
+    session_duration_ms,
+    session_num_samples,
+    session_samples,
+    transcribir_google,
+    transcribir_whisper_detallado,
+)
+from .vad import has_speech
+
+logger = logging.getLogger(__name__)
+
+# Contexto previo al chunk nuevo que se incluye en el VAD (0.5 s a 16 kHz)
+VAD_CONTEXT_SAMPLES = 8000
+
+
+def _liberar(session_id):
+    """Libera el almacenamiento de la sesión tras el resultado final (si está configurado)."""
+    if sessions.release_on_finalize():
+        sessions.release(session_id)
+
+
+def procesar_chunk(session_id, part_index, audio_file):
+    """Guarda un chunk y calcula los parciales de ambos motores.
+
+    ``part_index`` (entero, ya validado) es el número del chunk en la sesión.
+    Devuelve ``(payload, status_code)``.
+    """
+    try:
+        samples_before = session_num_samples(session_id)
+        chunk_path, _combined_webm_path = save_chunk_file(session_id, part_index, audio_file)
+    except sessions.QuotaExceeded as exc:
+        metrics.error("quota")
+        return {"error": f"Cuota de almacenamiento superada: {exc}"}, 413
+    except Exception as exc:
+        logger.warning("Error guardando chunk %s de %s: %s", part_index, session_id, exc)
+        metrics.error("chunk_save")
+        return {"error": f"Error guardando chunk: {short_error(exc)}"}, 500
+
+    previous = cargar_parcial(session_id)
+
+    # VAD sobre el audio nuevo (con un poco de contexto): si no hay voz, el
+    # parcial de Google no cambia y se evita la petición de red
+    new_audio = session_samples(session_id, samples_before - VAD_CONTEXT_SAMPLES)
+    chunk_has_speech = has_speech(new_audio)
+
+    # Transcribir con Google Speech Recognition leyendo el PCM ya decodificado de la sesión
+    def speech_partial():
+        if google_stream.incremental():
+            # Solo los segmentos de voz terminados que aún no se enviaron
+            return google_stream.transcribir_sesion(session_id)
+        if not chunk_has_speech:
+            return previous["speech"]
+        samples = session_samples(session_id)
+        if len(samples):
+            return transcribir_google(samples)
+        return ""
+
+    # Transcribir con Whisper usando el WAV combinado
+    admission_outcome = {}
+
+    def whisper_partial():
+        wav_path = combined_wav_path(session_id)
+        if not os.path.exists(wav_path):
+            logger.debug("Archivo WAV no existe: %s", wav_path)
+            return ""
+        file_size = os.path.getsize(wav_path)
+
+        # Verificar duración mínima leyendo solo la cabecera del almacen
+        duration_ms = session_duration_ms(session_id)
+        logger.debug("Whisper chunk %d: %d bytes, %dms", part_index, file_size, duration_ms)
+
+        # Solo procesar si tenemos al menos 3 segundos
+        if duration_ms < 3000:
+            logger.debug("Audio muy corto para Whisper: %dms", duration_ms)
+            return ""
+
+        # Decodificación incremental: solo el audio aún no confirmado. Se ejecuta en la
+        # cola de trabajos con la prioridad de los parciales (antes que finales y lotes)
+        def decode():
+            return get_queue().run("partial", transcribir_parcial, session_id, timeout=engine_timeout("whisper"))
+
+        if admission.enabled():
+            # Con carga: solo el parcial más nuevo de la sesión, o el último conocido si no hay lugar
+            whisper_result, outcome = admission.get_controller().run(session_id, decode)
+            if outcome != admission.ADMITTED:
+                admission_outcome["whisper"] = outcome
+                return previous["whisper"]
+        else:
+            whisper_result = decode()
+        logger.debug("Whisper chunk result: %r", whisper_result)
+        metrics.result("whisper_partial", "ok" if whisper_result else "empty")
+        return whisper_result
+
+    # Ambos motores en paralelo; Whisper SOLO después del chunk 4 para tener audio suficiente
+    tasks = {"speech": speech_partial}
+    if part_index >= 4:  # Esperar al menos 4 chunks (6+ segundos de audio)
+        tasks["whisper"] = whisper_partial
+    results, errors = run_parallel(tasks)
+    partial = {"whisper": results.get("whisper", ""), "speech": results.get("speech", "")}
+
+    guardar_parcial(session_id, {
+        "whisper": partial["whisper"] or previous["whisper"],
+        "speech": partial["speech"] or previous["speech"],
+    })
+
+    payload = {"ok": True, "saved": chunk_path, "partial": partial}
+    if errors:
+        payload["errors"] = errors
+    if admission_outcome:
+        # El parcial de Whisper es el último conocido (no se decodificó este chunk)
+        payload["admission"] = admission_outcome
+
+    return payload, 200
+
+
+def finalizar_sesion(session_id, decoding=None, on_event=None):
+    """Transcripción final de todo el audio acumulado. Devuelve ``(payload, status_code)``.
+
+    ``decoding`` es el perfil de decodificación (por defecto el del endpoint ``final``).
+    ``on_event`` recibe el texto de Whisper a medida que se genera (ver
+    ``transcribir_whisper_detallado``).
+    """
+    # Vaciar el decodificador de la sesión para que el WAV tenga todo el audio
+    stream_decoder.get_pool().close(session_id)
+
+    # Crear/obtener archivo WAV final
+    try:
+        wav_path = concat_session_to_wav(session_id)
+    except Exception as exc:
+        logger.warning("Error creando archivo final de %s: %s", session_id, exc)
+        metrics.error("concat")
+        return {"error": f"Error creando archivo final: {short_error(exc)}"}, 500
+
+    if not (os.path.exists(wav_path) and os.path.getsize(wav_path) > 0):
+        message = "Archivo de audio vacío o no encontrado"
+        _liberar(session_id)
+        return {
+            "session_id": session_id,
+            "final": {"whisper": "", "speech": ""},
+            "segments": {"whisper": []},
+            "ok": False,
+            "errors": {"whisper": message, "speech": message},
+        }, 200
+
+    logger.debug("Procesando Whisper final, archivo: %d bytes", os.path.getsize(wav_path))
+    # Decodificar una sola vez (lectura directa del almacen) para ambos motores
+    samples = cargar_muestras(wav_path)
+
+    # Transcribir con Whisper (audio completo, en ventanas si supera 30 s)
+    def whisper_final():
+        return transcribir_whisper_detallado(
+            samples, model=model_for_endpoint("final"), decoding=decoding or profile_for_endpoint("final"),
+            on_event=on_event,
+        )
+
+    def speech_final():
+        if google_stream.incremental():
+            return google_stream.transcribir_sesion(session_id, final=True, samples=samples)
+        return transcribir_google(samples)
+
+    results, errors = run_parallel({"whisper": whisper_final, "speech": speech_final})
+
+    detailed = results.get("whisper") or {"text": "", "segments": []}
+    whisper_result = detailed["text"]
+    segments = detailed["segments"]
+    if not whisper_result and "whisper" not in errors:
+        # Fallback: el último parcial ya cubría el audio de la sesión
+        logger.debug("Resultado Whisper final vacío, usando el último parcial")
+        whisper_result = cargar_parcial(session_id)["whisper"]
+    logger.debug("Whisper final result: %r", whisper_result)
+
+    final = {"whisper": whisper_result, "speech": results.get("speech", "")}
+
+    payload = {"session_id": session_id, "final": final, "segments": {"whisper": segments}}
+    if errors:
+        payload["ok"] = False
+        payload["errors"] = errors
+    else:
+        payload["ok"] = True
+
+    _liberar(session_id)
+    return payload, 200
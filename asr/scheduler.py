@@ -0,0 +1,167 @@
+"""Planificador de inferencia con micro-batching dinámico.
+
+Las peticiones que llegan desde distintos hilos se acumulan durante una ventana
+corta (o hasta llenar un lote) y se ejecutan juntas con una sola llamada al
+``runner``. Solo se agrupan peticiones con las mismas opciones de decodificación.
+
+Las etapas que el runner mide con ``metrics.stage`` se pueden recuperar por
+petición (``submit_async(..., stages=[])``): el servidor de modelo las devuelve
+a los workers web para que las registren en sus métricas.
+"""
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+from . import metrics
+
+
+def _options_key(options):
+    return tuple(sorted((key, repr(value)) for key, value in (options or {}).items()))
+
+
+class _Request:
+    __slots__ = ("item", "options", "key", "future", "enqueued_at", "stages")
+
+    def __init__(self, item, options, stages=None):
+        self.item = item
+        self.options = options or {}
+        self.key = _options_key(options)
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.stages = stages
+
+
+class InferenceScheduler:
+    """Agrupa peticiones concurrentes y las ejecuta en lotes con ``runner(items, options)``.
+
+    ``runner`` recibe la lista de items de un lote y las opciones compartidas, y
+    devuelve una lista de resultados en el mismo orden.
+    """
+
+    def __init__(self, runner, max_batch_size=8, batch_window_ms=20):
+        self.runner = runner
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_window = max(0.0, batch_window_ms / 1000.0)
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "batches": 0,
+            "max_queue_depth": 0,
+            "total_wait_ms": 0.0,
+            "total_run_ms": 0.0,
+        }
+        self._batch_sizes = Counter()
+
+    def configure(self, max_batch_size=None, batch_window_ms=None):
+        """Cambia el tamaño máximo de lote o la ventana; aplica desde el próximo lote."""
+        with self._cond:
+            if max_batch_size is not None:
+                self.max_batch_size = max(1, int(max_batch_size))
+            if batch_window_ms is not None:
+                self.batch_window = max(0.0, batch_window_ms / 1000.0)
+            self._cond.notify_all()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="asr-scheduler", daemon=True)
+            self._thread.start()
+
+    def submit_async(self, item, options=None, stages=None):
+        """Encola un item y devuelve un ``Future`` con su resultado.
+
+        Si ``stages`` es una lista, antes de resolver el ``Future`` se le agregan
+        los ``(etapa, segundos)`` medidos en el lote. Cada lote se atribuye a una
+        sola de sus peticiones, así se cuenta una vez, como al inferir en proceso.
+        """
+        request = _Request(item, options, stages)
+        with self._cond:
+            self._ensure_worker()
+            self._pending.append(request)
+            self._stats["submitted"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._pending))
+            self._cond.notify_all()
+        return request.future
+
+    def submit(self, item, options=None, timeout=None, stages=None):
+        """Encola un item y espera su resultado."""
+        return self.submit_async(item, options, stages).result(timeout=timeout)
+
+    def _matching(self, key):
+        return sum(1 for request in self._pending if request.key == key)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            first = self._pending[0]
+            deadline = first.enqueued_at + self.batch_window
+            while self._matching(first.key) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rest = [], deque()
+            while self._pending:
+                request = self._pending.popleft()
+                if request.key == first.key and len(batch) < self.max_batch_size:
+                    batch.append(request)
+                else:
+                    rest.append(request)
+            self._pending = rest
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            try:
+                with metrics.collect_stages() as stages:
+                    results = self.runner([request.item for request in batch], batch[0].options)
+                if len(results) != len(batch):
+                    raise RuntimeError("el runner devolvio una cantidad de resultados distinta al lote")
+            except Exception as exc:
+                for request in batch:
+                    request.future.set_exception(exc)
+                failed = True
+            else:
+                owner = next((request.stages for request in batch if request.stages is not None), None)
+                if owner is not None:
+                    owner.extend(stages)
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+                failed = False
+
+            finished = time.monotonic()
+            with self._cond:
+                self._stats["batches"] += 1
+                self._stats["failed" if failed else "completed"] += len(batch)
+                self._stats["total_wait_ms"] += sum((started - r.enqueued_at) * 1000 for r in batch)
+                self._stats["total_run_ms"] += (finished - started) * 1000
+                self._batch_sizes[len(batch)] += 1
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        """Profundidad de cola, tamaños de lote y tiempos medios de espera/ejecución."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending)
+            stats["batch_sizes"] = {str(size): count for size, count in sorted(self._batch_sizes.items())}
+        processed = stats["completed"] + stats["failed"]
+        batches = stats["batches"]
+        total_wait_ms = stats.pop("total_wait_ms")
+        total_run_ms = stats.pop("total_run_ms")
+        stats["avg_batch_size"] = round(processed / batches, 2) if batches else 0.0
+        stats["avg_wait_ms"] = round(total_wait_ms / processed, 2) if processed else 0.0
+        stats["avg_run_ms"] = round(total_run_ms / batches, 2) if batches else 0.0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["batch_window_ms"] = self.batch_window * 1000
+        return stats
@@ -0,0 +1,205 @@
+"""Ciclo de vida del almacenamiento de sesiones en tiempo real.
+
+Cada sesión vive en ``<ASR_SESSIONS["DIR"]>/<session_id>``. Las sesiones sin
+actividad durante ``TTL`` segundos se borran, hay un límite de bytes por sesión
+y otro global (al superarlo se borran primero las sesiones más antiguas), y una
+sesión finalizada libera su directorio de inmediato.
+
+:func:`isolated_root` cambia la raíz dentro de un bloque (p. ej. el benchmark):
+esas sesiones no cuentan para las cuotas ni disparan la limpieza.
+"""
+import contextvars
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import features, metrics, stream_decoder
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class QuotaExceeded(Exception):
+    """La sesión o el almacenamiento global superó su cuota de bytes."""
+
+
+_lock = threading.Lock()
+_state = {"last_gc": 0.0, "total_bytes": None}
+_isolated_root = contextvars.ContextVar("asr_isolated_session_root", default=None)
+
+
+def _config():
+    return getattr(settings, "ASR_SESSIONS", {})
+
+
+def root():
+    directory = _isolated_root.get() or _config().get("DIR", "/tmp/asr_sessions")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+@contextmanager
+def isolated_root(directory):
+    """Usa ``directory`` como raíz de las sesiones del bloque, sin cuotas ni limpieza."""
+    token = _isolated_root.set(directory)
+    try:
+        yield directory
+    finally:
+        _isolated_root.reset(token)
+
+
+def keep_parts():
+    """Si se guardan los chunks individuales además de ``combined.webm``."""
+    return _config().get("KEEP_PARTS", False)
+
+
+def release_on_finalize():
+    return _config().get("RELEASE_ON_FINALIZE", True)
+
+
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_RE.match(session_id))
+
+
+def session_path(session_id):
+    """Ruta del directorio de la sesión; rechaza ids que podrían salir de la raíz."""
+    if not is_valid_session_id(session_id):
+        raise ValueError(f"session_id inválido: {session_id!r}")
+    return os.path.join(root(), session_id)
+
+
+def _scan(directory):
+    """``(bytes, archivos, mtime más reciente)`` del directorio de una sesión."""
+    size = files = 0
+    mtime = 0.0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0, 0, 0.0
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        size += stat.st_size
+        files += 1
+        mtime = max(mtime, stat.st_mtime)
+    return size, files, mtime
+
+
+def session_bytes(session_id):
+    return _scan(session_path(session_id))[0]
+
+
+def list_sessions():
+    """Sesiones en disco: ``[{"session_id", "bytes", "files", "mtime"}, ...]``."""
+    sessions = []
+    base = root()
+    for entry in os.scandir(base):
+        if not entry.is_dir() or not is_valid_session_id(entry.name):
+            continue
+        size, files, mtime = _scan(entry.path)
+        if not files:
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+        sessions.append({"session_id": entry.name, "bytes": size, "files": files, "mtime": mtime})
+    return sessions
+
+
+def release(session_id):
+    """Cierra el decodificador y el extractor de la sesión y borra su directorio. Devuelve los bytes liberados."""
+    stream_decoder.get_pool().close(session_id)
+    features.get_pool().discard(session_id)
+    directory = session_path(session_id)
+    freed = _scan(directory)[0]
+    shutil.rmtree(directory, ignore_errors=True)
+    with _lock:
+        if _state["total_bytes"] is not None:
+            _state["total_bytes"] = max(0, _state["total_bytes"] - freed)
+    return freed
+
+
+def collect(ttl=None, max_total_bytes=None, protect=()):
+    """Borra las sesiones expiradas y, si se supera la cuota global, las más antiguas.
+
+    Las sesiones en ``protect`` (p. ej. la que está recibiendo un chunk) no se borran.
+    """
+    config = _config()
+    ttl = config.get("TTL", 3600) if ttl is None else ttl
+    max_total_bytes = config.get("MAX_TOTAL_BYTES") if max_total_bytes is None else max_total_bytes
+    now = time.time()
+    removed, kept = [], []
+    for session in sorted(list_sessions(), key=lambda item: item["mtime"]):
+        if ttl and now - session["mtime"] > ttl and session["session_id"] not in protect:
+            release(session["session_id"])
+            removed.append(session["session_id"])
+        else:
+            kept.append(session)
+
+    total = sum(session["bytes"] for session in kept)
+    remaining = len(kept)
+    if max_total_bytes and total > max_total_bytes:
+        # Desalojar las menos recientes hasta quedar en el 90 % de la cuota
+        for session in kept:
+            if total <= max_total_bytes * 0.9:
+                break
+            if session["session_id"] in protect:
+                continue
+            total -= release(session["session_id"])
+            removed.append(session["session_id"])
+            remaining -= 1
+
+    with _lock:
+        _state["last_gc"] = time.monotonic()
+        _state["total_bytes"] = total
+    if removed:
+        logger.info("Sesiones liberadas: %d, en disco: %d bytes", len(removed), total)
+    return {"removed": removed, "sessions": remaining, "bytes": total}
+
+
+def maybe_collect(protect=()):
+    """Ejecuta :func:`collect` como máximo una vez cada ``GC_INTERVAL`` segundos."""
+    with _lock:
+        due = time.monotonic() - _state["last_gc"] >= _config().get("GC_INTERVAL", 60)
+        if due:
+            _state["last_gc"] = time.monotonic()
+    if due:
+        collect(protect=protect)
+
+
+def reserve(session_id, incoming):
+    """Verifica las cuotas antes de guardar ``incoming`` bytes en la sesión."""
+    if _isolated_root.get():
+        return
+    config = _config()
+    maybe_collect(protect={session_id})
+
+    max_session = config.get("MAX_SESSION_BYTES")
+    if max_session and session_bytes(session_id) + incoming > max_session:
+        raise QuotaExceeded(f"la sesión superó su cuota de {max_session} bytes")
+
+    max_total = config.get("MAX_TOTAL_BYTES")
+    with _lock:
+        total = _state["total_bytes"]
+    if max_total and total is not None and total + incoming > max_total:
+        # La estimación puede estar desactualizada: recalcular antes de rechazar
+        total = collect(protect={session_id})["bytes"]
+        if total + incoming > max_total:
+            raise QuotaExceeded(f"el almacenamiento de sesiones superó su cuota de {max_total} bytes")
+    with _lock:
+        if _state["total_bytes"] is not None:
+            _state["total_bytes"] += incoming
+
+
+metrics.register_gauge(
+    "asr_active_sessions", "Sesiones en tiempo real con audio en disco.", lambda: len(list_sessions())
+)
@@ -0,0 +1,162 @@
+"""Decodificación especulativa (*assisted generation*) con un modelo borrador.
+
+Un Whisper chico con el mismo tokenizer (``ASR_SPECULATIVE["DRAFT_MODEL"]``)
+propone varios tokens y el modelo grande los verifica en una sola pasada del
+decoder; con búsqueda voraz la salida es la misma que la del modelo grande solo.
+``transformers`` solo lo admite con lotes de un audio y sin beam search, así que
+se usa únicamente con perfiles voraces (``NUM_BEAMS`` 1, una temperatura) y cada
+audio del lote se decodifica por separado.
+
+La tasa de aceptación se estima contando pasadas del decoder de cada modelo:
+cada verificación del grande produce los tokens aceptados más uno propio.
+
+Con los perfiles por defecto solo ``stream`` es voraz (``final`` y ``upload``
+usan beam search), así que al arrancar se avisa en el log de los endpoints donde
+el borrador no se aplica y :func:`stats` lo informa en ``skipped_reason``.
+"""
+import logging
+import threading
+
+from django.conf import settings
+
+from . import decoding, metrics
+
+logger = logging.getLogger(__name__)
+
+TOKENS = metrics.REGISTRY.register(metrics.Counter(
+    "asr_speculative_tokens_total",
+    "Decodificación especulativa: tokens generados y pasadas del decoder del modelo y del borrador.",
+    labels=("kind",),
+))
+
+
+def _config():
+    return getattr(settings, "ASR_SPECULATIVE", {})
+
+
+def draft_model_name():
+    return _config().get("DRAFT_MODEL") or ""
+
+
+def enabled(name, profile):
+    """Si ``name`` decodifica con borrador para este perfil."""
+    draft = draft_model_name()
+    return bool(_config().get("ENABLED", False) and draft and draft != name and decoding.is_greedy(profile))
+
+
+def _skip_reason(endpoint):
+    """Por qué el borrador no se aplica a ``endpoint``, o ``""`` si se aplica."""
+    if endpoint == "partial" and getattr(settings, "ASR_STREAMING", {}).get("PREFIX_REUSE", True):
+        return "decodifica con prefijo (asr.prefix_decode)"
+    profile = decoding.resolve(decoding.profile_for_endpoint(endpoint))
+    if profile["NUM_BEAMS"] > 1:
+        return f"beam search (NUM_BEAMS {profile['NUM_BEAMS']})"
+    if len(profile["TEMPERATURES"]) > 1:
+        return "fallback de temperatura"
+    return ""
+
+
+def skipped_reason():
+    """Por qué la decodificación especulativa no se aplica (en todos o en algunos endpoints), o ``None``."""
+    if not _config().get("ENABLED", False):
+        return "deshabilitada (ASR_SPECULATIVE)"
+    if not draft_model_name():
+        return "sin DRAFT_MODEL"
+    reasons = {endpoint: _skip_reason(endpoint) for endpoint in getattr(settings, "ASR_ENDPOINT_PROFILES", {})}
+    return "; ".join(f"{endpoint}: {reason}" for endpoint, reason in reasons.items() if reason) or None
+
+
+def active_endpoints():
+    """Endpoints cuyo perfil usa el borrador (vacío si está deshabilitada)."""
+    if not _config().get("ENABLED", False) or not draft_model_name():
+        return []
+    return [endpoint for endpoint in getattr(settings, "ASR_ENDPOINT_PROFILES", {}) if not _skip_reason(endpoint)]
+
+
+def check_configuration():
+    """Avisa al arrancar si está habilitada pero algún endpoint no la usa."""
+    if not _config().get("ENABLED", False):
+        return
+    reason = skipped_reason()
+    if reason:
+        active = ", ".join(active_endpoints()) or "ninguno"
+        logger.warning("Decodificación especulativa sin efecto en parte de los endpoints (activa en: %s): %s",
+                       active, reason)
+
+
+_local = threading.local()
+_counted = set()
+_counted_lock = threading.Lock()
+_stats = {"requests": 0, "generated_tokens": 0, "target_steps": 0, "draft_steps": 0}
+_stats_lock = threading.Lock()
+
+
+def _count_decoder_steps(model, kind):
+    """Hook (una vez por modelo) que cuenta las pasadas del decoder durante :func:`generate`."""
+    with _counted_lock:
+        if id(model) in _counted:
+            return
+        _counted.add(id(model))
+
+    def after(_module, _args, _output):
+        counts = getattr(_local, "counts", None)
+        if counts is not None:
+            counts[kind] += 1
+
+    model.get_decoder().register_forward_hook(after)
+
+
+def generate(model, draft, input_features, prompt_ids, streamers=None, **generate_kwargs):
+    """``model.generate`` de a un audio con ``draft`` como asistente. Devuelve una lista de secuencias.
+
+    ``prompt_ids`` son los tokens iniciales (sot, idioma, tarea...) que no cuentan
+    como generados; ``streamers`` (uno por audio) recibe los tokens a medida que salen.
+    """
+    _count_decoder_steps(model, "target")
+    _count_decoder_steps(draft, "draft")
+    num_tokens = _config().get("NUM_ASSISTANT_TOKENS")
+    if num_tokens:
+        draft.generation_config.num_assistant_tokens = num_tokens
+    sequences = []
+    for index in range(input_features.shape[0]):
+        _local.counts = {"target": 0, "draft": 0}
+        try:
+            if streamers is not None:
+                generate_kwargs["streamer"] = streamers[index]
+            ids = model.generate(input_features[index:index + 1], assistant_model=draft, **generate_kwargs)[0]
+            counts = _local.counts
+        finally:
+            _local.counts = None
+        generated = sum(1 for token in ids.tolist() if token not in prompt_ids)
+        _record(generated, counts["target"], counts["draft"])
+        sequences.append(ids)
+    return sequences
+
+
+def _record(generated, target_steps, draft_steps):
+    TOKENS.inc(generated, kind="generated")
+    TOKENS.inc(target_steps, kind="target_steps")
+    TOKENS.inc(draft_steps, kind="draft_steps")
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["generated_tokens"] += generated
+        _stats["target_steps"] += target_steps
+        _stats["draft_steps"] += draft_steps
+
+
+def stats():
+    """Contadores y tasa de aceptación estimada (tokens del borrador aceptados / propuestos)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    accepted = max(0, stats["generated_tokens"] - stats["target_steps"])
+    stats.update(
+        enabled=bool(_config().get("ENABLED", False)),
+        draft_model=draft_model_name(),
+        endpoints=active_endpoints(),
+        skipped_reason=skipped_reason(),
+        acceptance_rate=round(min(1.0, accepted / stats["draft_steps"]), 3) if stats["draft_steps"] else None,
+        tokens_per_target_step=(
+            round(stats["generated_tokens"] / stats["target_steps"], 2) if stats["target_steps"] else None
+        ),
+    )
+    return stats
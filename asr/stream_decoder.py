@@ -0,0 +1,305 @@
+"""Decodificador WebM/Opus persistente por sesión.
+
+El navegador envía fragmentos de un único stream WebM. En lugar de decodificar
+cada fragmento por separado (o todo ``combined.webm`` en cada chunk), cada sesión
+tiene un proceso ffmpeg de larga duración: los bytes nuevos se escriben en su
+stdin y un hilo lector agrega el PCM producido al almacen de la sesión. El costo
+por chunk es constante. Los decodificadores inactivos se cierran solos.
+
+Con varios workers cada proceso tiene su propio decodificador por sesión. Los
+fragmentos de una sesión se decodifican de a uno (lock de archivo entre
+procesos) y un decodificador que no recibió todos los bytes anteriores de
+``combined.webm`` se descarta y se resincroniza desde el historial. Un
+decodificador desfasado nunca se vacía en el WAV (su PCM pendiente ya lo
+escribió otro proceso): se termina con :meth:`StreamDecoder.discard`.
+
+La resincronización vuelve a decodificar todo ``combined.webm``, así que cuesta
+O(historial) cada vez que una sesión cambia de worker (``resync_bytes`` en las
+estadísticas). Por WebSocket la sesión queda en el worker de la conexión; por
+HTTP con varios workers conviene enrutar las sesiones siempre al mismo (sticky
+sessions por ``session_id``) o usar un solo worker con más hilos.
+"""
+import contextlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from . import audio_store, metrics
+from .decode import decode_pcm16
+
+FFMPEG_ARGS = [
+    "-hide_banner", "-loglevel", "error",
+    # El stream llega por partes: no esperar a analizar varios segundos de entrada
+    "-probesize", "32", "-analyzeduration", "0", "-fflags", "nobuffer",
+    "-i", "pipe:0",
+    "-f", "s16le", "-ac", "1", "-ar", str(audio_store.SAMPLE_RATE),
+    "-flush_packets", "1", "pipe:1",
+]
+_READ_SIZE = 8192
+LOCK_FILE = "decoder.lock"
+
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, "ASR_STREAM_DECODER", {})
+
+
+@contextlib.contextmanager
+def _stream_lock(wav_path):
+    """Serializa entre procesos la decodificación de los fragmentos de una sesión."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(os.path.dirname(wav_path), LOCK_FILE), "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class StreamDecoder:
+    """Un proceso ffmpeg que decodifica el stream de una sesión hacia su WAV."""
+
+    def __init__(self, wav_path, skip_samples=0, webm_path=None):
+        self.wav_path = wav_path
+        self.webm_path = webm_path
+        self.last_used = time.monotonic()
+        self.last_output = 0.0
+        # Bytes del stream escritos en ffmpeg (posición en combined.webm)
+        self.fed_bytes = 0
+        # Muestras ya presentes en el almacen que se descartan al resincronizar
+        self._skip_bytes = skip_samples * audio_store.SAMPLE_WIDTH
+        self._lock = threading.Lock()
+        self._output = threading.Condition()
+        self._process = subprocess.Popen(
+            [_config().get("FFMPEG", "ffmpeg"), *FFMPEG_ARGS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(target=self._read_loop, name="asr-decoder", daemon=True)
+        self._reader.start()
+
+    @property
+    def alive(self):
+        return self._process.poll() is None
+
+    def in_sync(self):
+        """Si recibió todo ``combined.webm``: ningún otro proceso escribió después en el WAV."""
+        if not self.webm_path:
+            return True
+        try:
+            return self.fed_bytes == os.path.getsize(self.webm_path)
+        except OSError:
+            return False  # la sesión se liberó
+
+    def _read_loop(self):
+        pending = b""
+        stdout = self._process.stdout
+        while True:
+            data = stdout.read1(_READ_SIZE)
+            if not data:
+                break
+            if self._skip_bytes:
+                skipped = min(self._skip_bytes, len(data))
+                self._skip_bytes -= skipped
+                data = data[skipped:]
+            data = pending + data
+            usable = len(data) - len(data) % audio_store.SAMPLE_WIDTH
+            pending = data[usable:]
+            if usable:
+                try:
+                    audio_store.append_samples(self.wav_path, np.frombuffer(data[:usable], dtype="<i2"))
+                except OSError as e:
+                    logger.warning("Decodificador: no se pudo escribir %s: %s", self.wav_path, e)
+                    metrics.error("wav_append")
+            with self._output:
+                self.last_output = time.monotonic()
+                self._output.notify_all()
+
+    def feed(self, data):
+        """Escribe bytes del stream y espera a que ffmpeg entregue el PCM correspondiente."""
+        config = _config()
+        settle = config.get("SETTLE_MS", 40) / 1000
+        deadline = time.monotonic() + config.get("MAX_WAIT_MS", 500) / 1000
+        with self._lock:
+            self.last_used = time.monotonic()
+            started = time.monotonic()
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+            self.fed_bytes += len(data)
+            # ffmpeg emite el PCM en varias escrituras: esperar hasta que deje de producir
+            with self._output:
+                while True:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        break
+                    if self.last_output > started and now - self.last_output >= settle:
+                        break
+                    self._output.wait(min(settle, deadline - now))
+
+    def close(self, timeout=10):
+        """Cierra stdin para que ffmpeg vacíe lo pendiente y espera al hilo lector."""
+        with self._lock:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._reader.join(timeout=timeout)
+
+    def discard(self, timeout=10):
+        """Termina ffmpeg sin vaciar lo pendiente (lo vuelve a producir el que lo reemplaza)."""
+        with self._lock:
+            self._process.kill()
+            self._process.wait(timeout=timeout)
+            self._reader.join(timeout=timeout)
+
+
+class DecoderPool:
+    """Decodificadores por sesión, con límite de procesos y cierre por inactividad."""
+
+    def __init__(self, idle_timeout=60, max_decoders=64):
+        self.idle_timeout = idle_timeout
+        self.max_decoders = max_decoders
+        self._decoders = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stats = {"spawned": 0, "reaped": 0, "evicted": 0, "resyncs": 0, "resync_bytes": 0, "fallbacks": 0}
+
+    def _ensure_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name="asr-decoder-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 2))
+            self.reap()
+
+    def reap(self):
+        """Cierra los decodificadores sin uso en los últimos ``idle_timeout`` segundos."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                session_id for session_id, decoder in self._decoders.items()
+                if now - decoder.last_used > self.idle_timeout or not decoder.alive
+            ]
+            decoders = [self._decoders.pop(session_id) for session_id in idle]
+            self._stats["reaped"] += len(decoders)
+        for decoder in decoders:
+            self._retire(decoder)
+
+    def _retire(self, decoder):
+        """Cierra un decodificador que salió del pool; solo vacía su PCM si sigue al día con el stream."""
+        try:
+            with _stream_lock(decoder.wav_path):
+                if decoder.alive and decoder.in_sync():
+                    decoder.close()
+                    return
+        except FileNotFoundError:
+            pass  # la sesión ya se liberó
+        decoder.discard()
+
+    def _spawn(self, session_id, data, wav_path, webm_path):
+        """Crea el decodificador; si la sesión ya tenía audio, lo resincroniza con el historial.
+
+        Devuelve ``(decoder, bytes a escribir, decodificador desalojado o None)``.
+        """
+        history = os.path.getsize(webm_path) if webm_path and os.path.exists(webm_path) else 0
+        evicted = None
+        if history > len(data):
+            # El stream empezó en otro proceso (o el decodificador se cerró): se vuelve a
+            # decodificar desde el inicio y se descartan las muestras ya guardadas
+            decoder = StreamDecoder(wav_path, skip_samples=audio_store.num_samples(wav_path), webm_path=webm_path)
+            with open(webm_path, "rb") as handle:
+                data = handle.read()
+            self._stats["resyncs"] += 1
+            self._stats["resync_bytes"] += len(data)
+        else:
+            decoder = StreamDecoder(wav_path, webm_path=webm_path)
+        with self._lock:
+            self._decoders[session_id] = decoder
+            self._stats["spawned"] += 1
+            if len(self._decoders) > self.max_decoders:
+                oldest = min(self._decoders, key=lambda key: self._decoders[key].last_used)
+                evicted = self._decoders.pop(oldest)
+                self._stats["evicted"] += 1
+            self._ensure_reaper()
+        return decoder, data, evicted
+
+    def feed(self, session_id, data, wav_path, webm_path=None):
+        """Decodifica ``data`` (siguiente fragmento del stream) y agrega el PCM a ``wav_path``.
+
+        ``webm_path`` es el stream acumulado (incluyendo ``data``), usado para
+        resincronizar. Sin ffmpeg se decodifica el fragmento aislado.
+        """
+        if shutil.which(_config().get("FFMPEG", "ffmpeg")) is None:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            audio_store.append_samples(wav_path, decode_pcm16(data))
+            return
+        evicted = None
+        with _stream_lock(wav_path):
+            with self._lock:
+                decoder = self._decoders.get(session_id)
+                if decoder is not None and not decoder.alive:
+                    self._decoders.pop(session_id)
+                    decoder = None
+            if decoder is not None and webm_path and decoder.fed_bytes + len(data) != os.path.getsize(webm_path):
+                # Otro proceso decodificó parte del stream: este decodificador quedó desfasado
+                with self._lock:
+                    if self._decoders.get(session_id) is decoder:
+                        self._decoders.pop(session_id)
+                decoder.discard()
+                decoder = None
+            if decoder is None:
+                decoder, data, evicted = self._spawn(session_id, data, wav_path, webm_path)
+            decoder.feed(data)
+        # Fuera del lock de esta sesión: el desalojado toma el de la suya
+        if evicted is not None:
+            self._retire(evicted)
+
+    def close(self, session_id):
+        """Vacía y cierra el decodificador de la sesión (antes de la transcripción final)."""
+        with self._lock:
+            decoder = self._decoders.pop(session_id, None)
+        if decoder is not None:
+            self._retire(decoder)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active"] = len(self._decoders)
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool compartido del proceso, configurado con ``ASR_STREAM_DECODER``."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = _config()
+            _pool = DecoderPool(
+                idle_timeout=config.get("IDLE_TIMEOUT", 60),
+                max_decoders=config.get("MAX_DECODERS", 64),
+            )
+        return _pool
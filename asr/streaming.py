@@ -0,0 +1,266 @@
+"""Transcripción incremental de sesiones en tiempo real (estilo *local agreement*).
+
+Por sesión se guarda un prefijo confirmado (texto + posición en el audio) y la
+última hipótesis sin confirmar. En cada chunk solo se vuelve a decodificar el
+audio no confirmado (más un pequeño solapamiento), y un segmento se confirma
+cuando dos hipótesis consecutivas coinciden. La ventana está acotada, así que el
+costo por chunk no crece con la duración de la sesión.
+
+Con ``ASR_STREAMING["PREFIX_REUSE"]`` y un perfil voraz, la ventana empieza en
+un punto fijo durante varios chunks: los segmentos ya confirmados dentro de ella
+se fuerzan como prefijo del decoder y el texto anterior va como prompt, así solo
+se generan los tokens nuevos (ver ``asr.prefix_decode``). La ventana se reinicia
+en la posición confirmada cuando lo confirmado dentro de ella supera
+``WINDOW_TRIM_SECONDS``.
+"""
+import contextlib
+import json
+import os
+import re
+
+from django.conf import settings
+
+from . import audio_store, decoding as decoding_profiles, features, metrics, prefix_decode
+from .decoding import profile_for_endpoint
+from .utils import (
+    combined_wav_path,
+    feature_size,
+    filtrar_resultado,
+    model_for_endpoint,
+    session_dir,
+    whisper_prefijo,
+    whisper_segmentos,
+)
+from .vad import detect_speech
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SAMPLE_RATE = audio_store.SAMPLE_RATE
+STATE_FILE = "stream_state.json"
+LOCK_FILE = "stream_state.lock"
+
+# Contexto ya confirmado que se vuelve a decodificar antes de la ventana
+OVERLAP_SAMPLES = SAMPLE_RATE // 2
+# Tamaño máximo de la ventana sin confirmar; al alcanzarlo se fuerza la confirmación
+MAX_WINDOW_SAMPLES = 20 * SAMPLE_RATE
+MIN_WINDOW_SAMPLES = SAMPLE_RATE
+# Audio final que se conserva sin confirmar cuando la ventana es solo silencio
+SILENCE_KEEP_SAMPLES = SAMPLE_RATE
+# Palabras del final del prefijo confirmado que se buscan repetidas al inicio de la hipótesis
+MAX_NGRAM_DEDUP = 5
+# Whisper solo ve 30 s: una ventana con prefijo no puede superarlos
+MAX_PREFIX_WINDOW_SAMPLES = 30 * SAMPLE_RATE
+
+
+def _config():
+    return getattr(settings, "ASR_STREAMING", {})
+
+
+def _empty_state():
+    return {
+        "committed_text": "",
+        "committed_samples": 0,
+        "hypothesis": [],
+        # Ventana con prefijo: inicio fijo, tokens confirmados dentro y texto previo (prompt)
+        "window_start": None,
+        "window_tokens": [],
+        "prompt": "",
+    }
+
+
+def _state_path(session_id):
+    return os.path.join(session_dir(session_id), STATE_FILE)
+
+
+def load_state(session_id):
+    try:
+        with open(_state_path(session_id), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return _empty_state()
+
+
+def save_state(session_id, state):
+    path = _state_path(session_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(state, handle, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def _session_lock(session_id):
+    """Serializa la actualización del estado entre peticiones de la misma sesión."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(session_dir(session_id), LOCK_FILE), "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _normalize(text):
+    return re.sub(r"[^\w\s]", "", text.lower()).split()
+
+
+def _strip_repeated_prefix(committed_text, text):
+    """Quita del inicio de ``text`` las palabras que repiten el final del texto confirmado."""
+    committed = _normalize(committed_text)
+    words = text.split()
+    normalized = _normalize(text)
+    for n in range(min(MAX_NGRAM_DEDUP, len(committed), len(normalized)), 0, -1):
+        if committed[-n:] == normalized[:n] and len(words) == len(normalized):
+            return " ".join(words[n:])
+    return text
+
+
+def _join(*parts):
+    return " ".join(part.strip() for part in parts if part and part.strip())
+
+
+def _agreed_count(previous, current):
+    count = 0
+    for old, new in zip(previous, current):
+        if _normalize(old) != _normalize(new["text"]):
+            break
+        count += 1
+    return count
+
+
+def _confirmar(state, segments, stop, window_full):
+    """Confirma los segmentos en los que coinciden las dos últimas hipótesis. Devuelve cuántos."""
+    # El último segmento puede estar cortado, nunca se confirma salvo con la ventana llena
+    agreed = min(_agreed_count(state["hypothesis"], segments), len(segments) - 1)
+    if window_full and agreed == 0:
+        agreed = max(1, len(segments) - 1)
+
+    if agreed:
+        state["committed_text"] = _join(
+            state["committed_text"], *(segment["text"] for segment in segments[:agreed])
+        )
+        state["committed_samples"] = min(stop, segments[agreed - 1]["end"])
+    state["hypothesis"] = [segment["text"] for segment in segments[agreed:]]
+    return agreed
+
+
+def _window_features(session_id, wav_path, model, start, stop, total):
+    if not features.enabled():
+        return None
+    # Log-mel incremental: solo se calculan los frames del audio nuevo
+    extractor = features.get_pool().get(
+        session_id, lambda lo, hi: audio_store.read_float(wav_path, lo, hi), n_mels=feature_size(model)
+    )
+    with metrics.stage("features"):
+        return extractor.window(start, stop, total)
+
+
+def _transcribir_con_prefijo(session_id, state, wav_path, total, profile):
+    """Parcial con la ventana fija, prefijo forzado y prompt. Actualiza ``state``."""
+    committed = state["committed_samples"]
+    stop = min(total, committed + MAX_WINDOW_SAMPLES)
+    window_full = stop - committed >= MAX_WINDOW_SAMPLES
+    trim = int(_config().get("WINDOW_TRIM_SECONDS", 10) * SAMPLE_RATE)
+    window_start = state.get("window_start")
+    if window_start is None or committed - window_start > trim or stop - window_start > MAX_PREFIX_WINDOW_SAMPLES:
+        # Nueva ventana desde lo confirmado: lo anterior pasa al prompt
+        window_start = committed // features.HOP * features.HOP
+        state.update(window_start=window_start, window_tokens=[], prompt=state["committed_text"])
+
+    samples = audio_store.read_float(wav_path, window_start, stop)
+    segments = []
+    if detect_speech(samples[committed - window_start:], SAMPLE_RATE):
+        model = model_for_endpoint("partial")
+        result = whisper_prefijo(
+            samples,
+            prompt=state["prompt"],
+            prefix=state["window_tokens"],
+            model=model,
+            decoding=profile,
+            features=_window_features(session_id, wav_path, model, window_start, stop, total),
+        )
+        for segment in result["segments"]:
+            end = window_start + int(segment["end"] * SAMPLE_RATE)
+            if end > committed:
+                segments.append({"end": end, "text": segment["text"], "tokens": segment["tokens"],
+                                 "closed": segment["closed"]})
+        if segments and result["prefix_tokens"] < len(state["window_tokens"]):
+            # El prefijo no entró en el decoder: la salida puede repetir lo confirmado
+            segments[0]["text"] = _strip_repeated_prefix(state["committed_text"], segments[0]["text"])
+            segments = [segment for segment in segments if segment["text"].strip()]
+            state["window_start"] = None
+
+    if not segments:
+        state["committed_samples"] = max(committed, stop - SILENCE_KEEP_SAMPLES)
+        state["hypothesis"] = []
+        state["window_start"] = None  # el silencio no deja tokens para el prefijo
+        return
+
+    agreed = _confirmar(state, segments, stop, window_full)
+    if state["window_start"] is not None:
+        if all(segment["closed"] for segment in segments[:agreed]):
+            for segment in segments[:agreed]:
+                state["window_tokens"].extend(segment["tokens"])
+        else:
+            state["window_start"] = None  # confirmado a la fuerza sin marca de cierre
+
+
+def transcribir_parcial(session_id):
+    """Actualiza la transcripción incremental de la sesión y devuelve el texto parcial."""
+    wav_path = combined_wav_path(session_id)
+    with _session_lock(session_id):
+        state = load_state(session_id)
+        committed = state["committed_samples"]
+        total = audio_store.num_samples(wav_path)
+
+        if total - committed < MIN_WINDOW_SAMPLES:
+            return filtrar_resultado(_join(state["committed_text"], *state["hypothesis"]))
+
+        profile = decoding_profiles.resolve(profile_for_endpoint("partial"))
+        if prefix_decode.enabled(profile):
+            _transcribir_con_prefijo(session_id, state, wav_path, total, profile)
+            save_state(session_id, state)
+            return filtrar_resultado(_join(state["committed_text"], *state["hypothesis"]))
+
+        # El inicio se alinea al hop del log-mel para reutilizar los frames ya calculados
+        start = max(0, committed - OVERLAP_SAMPLES) // features.HOP * features.HOP
+        stop = min(total, committed + MAX_WINDOW_SAMPLES)
+        samples = audio_store.read_float(wav_path, start, stop)
+        window_full = stop - committed >= MAX_WINDOW_SAMPLES
+
+        # VAD: si la ventana no tiene voz no se llama a Whisper
+        regions = detect_speech(samples, SAMPLE_RATE)
+        decoded = []
+        if regions:
+            model = model_for_endpoint("partial")
+            decoded = whisper_segmentos(
+                samples, SAMPLE_RATE, model=model, decoding=profile,
+                features=_window_features(session_id, wav_path, model, start, stop, total),
+            )
+
+        segments = []
+        for segment in decoded:
+            end = start + int(segment["end"] * SAMPLE_RATE)
+            if end <= committed:
+                continue  # cae completo en el solapamiento ya confirmado
+            segments.append({"end": end, "text": segment["text"]})
+        if segments:
+            segments[0]["text"] = _strip_repeated_prefix(state["committed_text"], segments[0]["text"])
+            segments = [segment for segment in segments if segment["text"].strip()]
+
+        if not segments:
+            # Solo silencio: avanzar el punto confirmado conservando el final por si empieza a hablar
+            state["committed_samples"] = max(committed, stop - SILENCE_KEEP_SAMPLES)
+            state["hypothesis"] = []
+            save_state(session_id, state)
+            return filtrar_resultado(state["committed_text"])
+
+        _confirmar(state, segments, stop, window_full)
+        save_state(session_id, state)
+
+    return filtrar_resultado(_join(state["committed_text"], *state["hypothesis"]))
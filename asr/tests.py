@@ -1,3 +1,1466 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Listener
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import soundfile as sf
+import speech_recognition as sr
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import (
+    admission,
+    audio_store,
+    backends,
+    benchmark,
+    bulk,
+    decoding,
+    fanout,
+    features,
+    google_stream,
+    jobs,
+    metrics,
+    model_server,
+    prefix_decode,
+    realtime,
+    sessions,
+    speculative,
+    stream_decoder,
+    streaming,
+    utils,
+    vad,
+    views,
+    websocket,
+)
+from .cache import TranscriptionCache, cached, make_key
+from .decode import decode_audio, sniff_format
+from .scheduler import InferenceScheduler
+from .utils import combined_wav_path
+
+
+try:
+    from transformers import WhisperFeatureExtractor
+except ImportError:
+    WhisperFeatureExtractor = None
+def _tone(seconds, amplitude=0.3, frequency=220):
+    t = np.arange(int(seconds * audio_store.SAMPLE_RATE)) / audio_store.SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def _silence(seconds, noise=0.0, seed=0):
+    count = int(seconds * audio_store.SAMPLE_RATE)
+    return (noise * np.random.default_rng(seed).standard_normal(count)).astype(np.float32)
+
+
+def _wav_upload(samples, name="audio.wav"):
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, audio_store.SAMPLE_RATE, format="WAV", subtype="PCM_16")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="audio/wav")
+
+
+class AudioStoreTests(TestCase):
+    """WAV de sesión de solo anexado."""
+
+    def test_anexar_y_leer_ventanas(self):
+        rng = np.random.default_rng(0)
+        first = rng.uniform(-1, 1, 1000).astype(np.float32)
+        second = rng.integers(-32768, 32767, 500).astype(np.int16)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "combined.wav")
+            self.assertEqual(audio_store.num_samples(path), 0)
+            self.assertEqual(audio_store.append_samples(path, first), 1000)
+            self.assertEqual(audio_store.append_samples(path, second), 1500)
+            self.assertTrue(audio_store.is_session_wav(path))
+
+            expected = np.concatenate((audio_store.to_pcm16(first), second))
+            np.testing.assert_array_equal(audio_store.read_view(path), expected)
+            np.testing.assert_array_equal(audio_store.read_view(path, 900, 1100), expected[900:1100])
+            self.assertEqual(len(audio_store.read_view(path, 2000, 3000)), 0)
+            np.testing.assert_allclose(audio_store.read_float(path, 1000), second / 32768.0)
+
+            # La cabecera es válida: cualquier lector de WAV ve las mismas muestras
+            data, sample_rate = sf.read(path, dtype="int16")
+            self.assertEqual(sample_rate, audio_store.SAMPLE_RATE)
+            np.testing.assert_array_equal(data, expected)
+
+
+class _SessionTestCase(TestCase):
+    """Sesiones en un directorio temporal y sin caché de transcripciones."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        session_config = {**settings.ASR_SESSIONS, "DIR": directory.name}
+        overrides = override_settings(ASR_SESSIONS=session_config, ASR_CACHE={"ENABLED": False})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.session_id = uuid.uuid4().hex
+        self.wav_path = combined_wav_path(self.session_id)
+
+    def append_voice(self, seconds):
+        audio_store.append_samples(self.wav_path, _tone(seconds))
+
+
+BLOCK_SECONDS = 2.0
+
+
+class LocalAgreementTests(_SessionTestCase):
+    """Parciales incrementales: solo se confirma lo que repiten dos hipótesis seguidas."""
+
+    def fake_segmentos(self, samples, target_sr=16000, model=None, decoding=None, features=None):
+        # Un "modelo" que transcribe cada bloque de 2 s del stream como "bloque k"
+        self.windows.append(len(samples))
+        start = (audio_store.num_samples(self.wav_path) - len(samples)) / target_sr
+        stop = start + len(samples) / target_sr
+        segments = []
+        for block in range(int(start // BLOCK_SECONDS), int(np.ceil(stop / BLOCK_SECONDS))):
+            begin, end = block * BLOCK_SECONDS, min(stop, (block + 1) * BLOCK_SECONDS)
+            if end > start:
+                segments.append({"start": max(0.0, begin - start), "end": end - start, "text": f"bloque {block}"})
+        return segments
+
+    def test_confirma_sin_duplicar_y_ventana_acotada(self):
+        self.windows = []
+        streaming_config = {**settings.ASR_STREAMING, "PREFIX_REUSE": False}
+        with override_settings(ASR_STREAMING=streaming_config), \
+                mock.patch.object(streaming, "whisper_segmentos", self.fake_segmentos):
+            self.append_voice(6.0)
+            self.assertEqual(streaming.transcribir_parcial(self.session_id), "bloque 0 bloque 1 bloque 2")
+            self.assertEqual(streaming.load_state(self.session_id)["committed_text"], "")
+            for _ in range(12):
+                self.append_voice(BLOCK_SECONDS)
+                text = streaming.transcribir_parcial(self.session_id)
+
+        blocks = int(audio_store.num_samples(self.wav_path) / audio_store.SAMPLE_RATE / BLOCK_SECONDS)
+        self.assertEqual(text, " ".join(f"bloque {block}" for block in range(blocks)))
+        state = streaming.load_state(self.session_id)
+        self.assertTrue(state["committed_text"].startswith("bloque 0 bloque 1"))
+        self.assertGreater(state["committed_samples"], 0)
+        # Cada parcial decodifica solo lo no confirmado (más el solapamiento), no toda la sesión
+        self.assertLess(max(self.windows), 12 * audio_store.SAMPLE_RATE)
+
+
+class InferenceSchedulerTests(TestCase):
+    """Micro-batching: peticiones concurrentes con las mismas opciones van en un lote."""
+
+    def test_agrupa_por_opciones_y_respeta_el_orden(self):
+        batches = []
+
+        def runner(items, options):
+            batches.append((list(items), options["beams"]))
+            return [f"{item}/{options['beams']}" for item in items]
+
+        scheduler = InferenceScheduler(runner, max_batch_size=4, batch_window_ms=200)
+        futures = [scheduler.submit_async(index, {"beams": 1}) for index in range(6)]
+        futures.append(scheduler.submit_async(99, {"beams": 5}))
+        self.assertEqual([future.result(timeout=5) for future in futures],
+                         [f"{index}/1" for index in range(6)] + ["99/5"])
+        self.assertEqual(sorted(len(items) for items, _beams in batches), [1, 2, 4])
+        for items, beams in batches:
+            self.assertEqual(beams, 5 if items == [99] else 1)
+        stats = scheduler.stats()
+        self.assertEqual((stats["completed"], stats["batches"]), (7, 3))
+
+    def test_error_del_runner_llega_a_todo_el_lote(self):
+        scheduler = InferenceScheduler(lambda items, options: [], max_batch_size=2, batch_window_ms=100)
+        futures = [scheduler.submit_async(index) for index in range(2)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        self.assertEqual(scheduler.stats()["failed"], 2)
+
+
+class ModelServerTests(TestCase):
+    """Cliente y servidor de modelo por ``multiprocessing.connection`` con un planificador falso."""
+
+    def setUp(self):
+        def runner(items, options):
+            results = []
+            with metrics.stage("generate"):
+                for item in items:
+                    if isinstance(item, dict):  # generate_stream
+                        for word in ("hola", " mundo"):
+                            item["on_text"](word)
+                        item = item["samples"]
+                    results.append(f"{len(item)} muestras, {options['model']}")
+            return results
+
+        patcher = mock.patch.object(utils, "get_scheduler", return_value=InferenceScheduler(runner, batch_window_ms=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        listener = Listener(("127.0.0.1", 0), authkey=b"clave")
+        self.addCleanup(listener.close)
+
+        def serve():
+            while True:
+                try:
+                    conn = listener.accept()
+                except OSError:
+                    return
+                threading.Thread(target=model_server._handle, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=serve, daemon=True).start()
+        host, port = listener.address
+        self.model_client = model_server.ModelClient(f"{host}:{port}", b"clave", timeout=5)
+
+    def test_generate_y_stream(self):
+        samples = np.zeros(1600, dtype=np.float32)
+        self.assertEqual(self.model_client.generate(samples, {"model": "base"}), "1600 muestras, base")
+        texts = []
+        result = self.model_client.generate_stream(samples, {"model": "base"}, texts.append)
+        self.assertEqual((texts, result), (["hola", " mundo"], "1600 muestras, base"))
+
+    def test_etapas_del_servidor_en_las_metricas_del_cliente(self):
+        samples = np.zeros(1600, dtype=np.float32)
+        with mock.patch.object(metrics, "record_stages") as record:
+            self.model_client.generate(samples, {"model": "base"})
+            self.model_client.generate_stream(samples, {"model": "base"}, lambda text: None)
+        for call in record.call_args_list:
+            self.assertEqual([name for name, _seconds in call.args[0]], ["generate"])
+        self.assertEqual(record.call_count, 2)
+
+        # Un lote de dos peticiones se atribuye a una sola
+        scheduler = InferenceScheduler(lambda items, options: self._measured(items), batch_window_ms=200)
+        lists = [[], []]
+        futures = [scheduler.submit_async(index, {}, stages=stages) for index, stages in enumerate(lists)]
+        self.assertEqual([future.result(5) for future in futures], [0, 1])
+        self.assertEqual(sorted(len(stages) for stages in lists), [0, 1])
+
+    @staticmethod
+    def _measured(items):
+        with metrics.stage("generate"):
+            return list(items)
+
+    def test_error_del_servidor(self):
+        with self.assertRaisesRegex(RuntimeError, "operacion desconocida"):
+            self.model_client._call({"op": "borrar"})
+
+    def test_clave_obligatoria(self):
+        with override_settings(ASR_MODEL_SERVER={"ADDRESS": "127.0.0.1:8765", "AUTHKEY": ""}):
+            with self.assertRaises(ImproperlyConfigured):
+                model_server.serve(warmup=False)
+        with override_settings(ASR_MODEL_SERVER={"AUTHKEY": "clave"}):
+            self.assertEqual(model_server._authkey(), b"clave")
+
+    def test_servidor_caido_no_devuelve_texto_vacio(self):
+        listener = Listener(("127.0.0.1", 0), authkey=b"clave")
+        host, port = listener.address
+        listener.close()
+        client = model_server.ModelClient(f"{host}:{port}", b"clave", timeout=1)
+        with self.assertRaises(model_server.ModelServerUnavailable):
+            client.generate(np.zeros(1600, dtype=np.float32), {})
+
+        # Un error del modelo da un resultado vacío, el servidor caído se propaga
+        audio = _tone(2.0)
+        with override_settings(ASR_CACHE={"ENABLED": False}), \
+                mock.patch.object(utils, "whisper_generar", side_effect=RuntimeError("fallo")):
+            with self.assertLogs("asr.utils", "ERROR"):
+                self.assertEqual(utils.transcribir_whisper_detallado(audio)["text"], "")
+            with self.assertRaises(RuntimeError):
+                utils.transcribir_whisper_detallado(audio, raise_errors=True)
+        unavailable = model_server.ModelServerUnavailable("servidor de modelo no disponible")
+        with override_settings(ASR_CACHE={"ENABLED": False}), \
+                mock.patch.object(utils, "whisper_generar", side_effect=unavailable):
+            with self.assertRaises(model_server.ModelServerUnavailable):
+                utils.transcribir_whisper_detallado(audio)
+            response = self.client.post(reverse("api-whisper"), {"audio": _wav_upload(_tone(2.0))})
+        self.assertEqual(response.status_code, 503)
+
+
+class ModelRegistryTests(TestCase):
+    """Modelo por endpoint y variantes del registro."""
+
+    models = {
+        "grande": {"PATH": "openai/whisper-large"},
+        "chico-int8": {"PATH": "openai/whisper-small", "QUANTIZATION": "int8"},
+        "v3": {"PATH": "openai/whisper-large-v3", "N_MELS": 128},
+    }
+
+    def test_modelo_por_endpoint(self):
+        with override_settings(ASR_MODELS=self.models, ASR_DEFAULT_MODEL="grande",
+                               ASR_ENDPOINT_MODELS={"partial": "chico-int8", "final": ""}):
+            self.assertEqual(utils.model_for_endpoint("partial"), "chico-int8")
+            self.assertEqual(utils.model_for_endpoint("final"), "grande")
+            self.assertEqual(utils.model_for_endpoint("upload"), "grande")
+            self.assertEqual(utils.feature_size("v3"), 128)
+            self.assertEqual(utils.feature_size(), 80)
+            with self.assertRaises(KeyError):
+                utils.feature_size("inexistente")
+            stats = utils.registry_stats()
+        self.assertEqual(set(stats), set(self.models))
+        self.assertEqual(stats["chico-int8"]["quantization"], "int8")
+        self.assertFalse(stats["grande"]["loaded"])
+
+    def test_el_modelo_va_en_las_opciones_del_lote(self):
+        scheduler = mock.Mock()
+        scheduler.submit.return_value = "texto"
+        with override_settings(ASR_CACHE={"ENABLED": False}), \
+                mock.patch.object(utils, "_model_client", return_value=None), \
+                mock.patch.object(utils, "get_scheduler", return_value=scheduler):
+            self.assertEqual(utils.whisper_generar(np.zeros(1600, dtype=np.float32), model="chico-int8"), "texto")
+        _item, options = scheduler.submit.call_args.args
+        self.assertEqual(options["model"], "chico-int8")
+
+
+class LongFormTests(TestCase):
+    """Transcripción de audio de más de 30 s por ventanas."""
+
+    def test_hilos_acotados_al_lote_y_segmentos_en_orden(self):
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0, "calls": 0}
+
+        def fake_segmentos(samples, target_sr=16000, model=None, decoding=None):
+            with lock:
+                running["now"] += 1
+                running["calls"] += 1
+                running["max"] = max(running["max"], running["now"])
+            threading.Event().wait(0.02)
+            with lock:
+                running["now"] -= 1
+            return [{"start": 0.0, "end": len(samples) / target_sr, "text": "ventana"}]
+
+        samples = _tone(240.0)
+        with override_settings(ASR_SCHEDULER={**getattr(settings, "ASR_SCHEDULER", {}), "MAX_BATCH_SIZE": 2}), \
+                mock.patch.object(utils, "whisper_segmentos", fake_segmentos):
+            result = utils.transcribir_whisper_detallado(samples)
+        self.assertGreater(running["calls"], 2)
+        self.assertLessEqual(running["max"], 2)
+        starts = [segment["start"] for segment in result["segments"]]
+        self.assertEqual(starts, sorted(starts))
+
+
+class VADTests(TestCase):
+    """Detector de voz por energía."""
+
+    def test_regiones_de_voz(self):
+        samples = np.concatenate((
+            _silence(1.0, 0.001), _tone(1.0), _silence(1.0, 0.001), _tone(0.5), _silence(0.5, 0.001),
+        ))
+        regions = vad.detect_speech(samples)
+        self.assertEqual(len(regions), 2)
+        rate = audio_store.SAMPLE_RATE
+        # Con el margen de PAD_MS alrededor de cada región
+        self.assertAlmostEqual(regions[0][0] / rate, 1.0, delta=0.2)
+        self.assertAlmostEqual(regions[0][1] / rate, 2.0, delta=0.2)
+        self.assertAlmostEqual(regions[1][0] / rate, 3.0, delta=0.2)
+        self.assertEqual(vad.pause_points(regions), [(regions[0][1] + regions[1][0]) // 2])
+        trimmed, offset = vad.trim_silence(samples, regions)
+        self.assertEqual((offset, len(trimmed)), (regions[0][0], regions[1][1] - regions[0][0]))
+
+    def test_silencio_y_ruido_no_son_voz(self):
+        self.assertFalse(vad.has_speech(_silence(2.0)))
+        self.assertFalse(vad.has_speech(_silence(2.0, 0.001)))
+        # Un tono más corto que MIN_SPEECH_MS
+        self.assertFalse(vad.has_speech(np.concatenate((_silence(1.0, 0.001), _tone(0.1)))))
+
+    def test_desactivado_devuelve_todo(self):
+        with override_settings(ASR_VAD={"ENABLED": False}):
+            self.assertEqual(vad.detect_speech(_silence(1.0)), [(0, audio_store.SAMPLE_RATE)])
+
+
+class TranscriptionCacheTests(TestCase):
+    """Caché por contenido con niveles en memoria y en disco."""
+
+    def test_clave_por_audio_motor_y_parametros(self):
+        samples = _tone(0.5)
+        self.assertEqual(make_key(samples, "whisper", beams=5), make_key(samples.copy(), "whisper", beams=5))
+        self.assertEqual(make_key(samples, "whisper"), make_key(audio_store.to_pcm16(samples), "whisper"))
+        self.assertNotEqual(make_key(samples, "whisper"), make_key(samples, "google"))
+        self.assertNotEqual(make_key(samples, "whisper", beams=5), make_key(samples, "whisper", beams=1))
+
+    def test_lru_en_memoria(self):
+        cache = TranscriptionCache(max_entries=2)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        self.assertEqual(cache.get("a"), "A")  # "b" pasa a ser el menos usado
+        cache.set("c", "C")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), ("A", "C"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_nivel_en_disco_y_desalojo(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TranscriptionCache(max_entries=1, disk_dir=directory, disk_max_bytes=200)
+            cache.set("k1", {"text": "uno"})
+            cache.set("k2", {"text": "dos"})
+            # Fuera de memoria pero en disco; otro proceso (otra instancia) también lo ve
+            self.assertEqual(cache.get("k1"), {"text": "uno"})
+            self.assertEqual(TranscriptionCache(disk_dir=directory).get("k2"), {"text": "dos"})
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            for index in range(20):
+                cache.set(f"x{index}", {"text": "x" * 20})
+            self.assertLessEqual(cache.stats()["disk_bytes"], 200)
+            self.assertGreater(cache.stats()["disk_evictions"], 0)
+
+    def test_cached_calcula_una_sola_vez(self):
+        compute = mock.Mock(return_value="texto")
+        with override_settings(ASR_CACHE={"ENABLED": True, "MAX_ENTRIES": 8}), \
+                mock.patch("asr.cache._cache", TranscriptionCache()):
+            samples = _tone(0.2, frequency=330)
+            self.assertEqual(cached(samples, "whisper", compute, beams=1), "texto")
+            self.assertEqual(cached(samples, "whisper", compute, beams=1), "texto")
+            self.assertEqual(compute.call_count, 1)
+            cached(samples, "whisper", compute, beams=5)
+            self.assertEqual(compute.call_count, 2)
+        with override_settings(ASR_CACHE={"ENABLED": False}):
+            cached(samples, "whisper", compute, beams=1)
+        self.assertEqual(compute.call_count, 3)
+
+
+@override_settings(ASR_ENGINE_TIMEOUTS={"lento": 0.1})
+class FanoutTests(TestCase):
+    """Motores en paralelo con timeout por motor."""
+
+    tasks = {
+        "rapido": lambda: time.sleep(0.2) or "ok",
+        "otro": lambda: time.sleep(0.2) or "ok",
+        "lento": lambda: time.sleep(0.5) or "tarde",
+        "roto": lambda: 1 / 0,
+    }
+
+    def _check(self, results, errors, elapsed):
+        self.assertEqual(results, {"rapido": "ok", "otro": "ok"})
+        self.assertIn("tiempo de espera agotado", errors["lento"])
+        self.assertIn("division by zero", errors["roto"])
+        # En paralelo: max(motores) y no la suma; el motor lento no se espera
+        self.assertLess(elapsed, 0.45)
+
+    def test_run_parallel(self):
+        started = time.monotonic()
+        results, errors = fanout.run_parallel(self.tasks)
+        self._check(results, errors, time.monotonic() - started)
+
+    def test_run_parallel_async(self):
+        started = time.monotonic()
+        results, errors = asyncio.run(fanout.run_parallel_async(self.tasks))
+        self._check(results, errors, time.monotonic() - started)
+
+
+class CompareASRViewTests(TestCase):
+    """``POST /asr/compare/`` decodifica una vez y consulta ambos motores."""
+
+    def test_ambos_motores_y_errores(self):
+        with mock.patch.object(views, "transcribir_whisper", return_value="hola whisper") as whisper, \
+                mock.patch.object(views, "transcribir_google", side_effect=RuntimeError("sin red")):
+            response = self.client.post(reverse("api-compare"), {"audio": _wav_upload(_tone(1.0))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "whisper": "hola whisper", "speechrecognition": "", "errors": {"speech": "sin red"},
+        })
+        # Whisper recibe las muestras ya decodificadas
+        self.assertEqual(len(whisper.call_args.args[0]), audio_store.SAMPLE_RATE)
+
+    def test_audio_invalido(self):
+        response = self.client.post(reverse("api-compare"), {"audio": SimpleUploadedFile("a.wav", b"RIFF roto")})
+        self.assertEqual(response.status_code, 400)
+
+
+class RealtimeChunkViewTests(TestCase):
+    """Validación de ``POST /asr/realtime_chunk/``."""
+
+    def test_part_index_invalido(self):
+        for part_index in ("abc", "1.5", "-1", ""):
+            with self.subTest(part_index=part_index):
+                response = self.client.post(reverse("api-realtime-chunk"), {
+                    "session_id": uuid.uuid4().hex,
+                    "part_index": part_index,
+                    "audio": SimpleUploadedFile("chunk.webm", b"\x1a\x45\xdf\xa3"),
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "invalid part_index"})
+
+
+class _Socket:
+    """Extremo cliente de una conexión ASGI WebSocket para :func:`websocket.websocket_application`."""
+
+    def __init__(self, path, query=""):
+        self.scope = {"type": "websocket", "path": path, "query_string": query.encode()}
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+
+    async def run(self, *messages):
+        await self.incoming.put({"type": "websocket.connect"})
+        for message in messages:
+            await self.incoming.put(message)
+        await self.incoming.put({"type": "websocket.disconnect"})
+        await asyncio.wait_for(
+            websocket.websocket_application(self.scope, self.incoming.get, self.outgoing.put), timeout=10
+        )
+        sent = []
+        while not self.outgoing.empty():
+            message = self.outgoing.get_nowait()
+            sent.append(json.loads(message["text"]) if "text" in message else message)
+        return sent
+
+
+class WebSocketTests(TestCase):
+    """``/asr/ws/realtime/``: chunks binarios, parciales y finalize por el mismo socket."""
+
+    def test_chunks_y_finalize(self):
+        def fake_chunk(session_id, part_index, audio_file):
+            return {"whisper": f"parcial {part_index}: {len(audio_file.read())} bytes"}, 200
+
+        session_id = uuid.uuid4().hex
+        with mock.patch.object(websocket, "procesar_chunk", fake_chunk), \
+                mock.patch.object(websocket, "finalizar_sesion", return_value=({"whisper": "final"}, 200)):
+            sent = asyncio.run(_Socket(websocket.REALTIME_PATH, f"session_id={session_id}").run(
+                {"type": "websocket.receive", "bytes": b"abc"},
+                {"type": "websocket.receive", "bytes": b"defg"},
+                {"type": "websocket.receive", "text": json.dumps({"type": "finalize"})},
+            ))
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        self.assertEqual(sent[1], {"type": "ready", "session_id": session_id})
+        self.assertEqual((sent[2]["part_index"], sent[2]["whisper"]), (0, "parcial 0: 3 bytes"))
+        self.assertEqual((sent[3]["part_index"], sent[3]["whisper"]), (1, "parcial 1: 4 bytes"))
+        self.assertEqual(sent[4], {"type": "final", "status": 200, "whisper": "final"})
+        self.assertEqual(sent[5], {"type": "websocket.close", "code": 1000})
+
+    @override_settings(ASR_ENGINE_TIMEOUTS={"whisper": 2, "speech": 2})
+    def test_chunk_con_pool_de_motores_lleno(self):
+        # procesar_chunk reparte trabajo en el pool de motores: con un solo hilo no debe bloquearse
+        def fake_chunk(session_id, part_index, audio_file):
+            results, _errors = fanout.run_parallel({"whisper": lambda: "w", "speech": lambda: "s"})
+            return results, 200
+
+        engine_pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(engine_pool.shutdown)
+        with mock.patch.object(fanout, "_executor", engine_pool), \
+                mock.patch.object(websocket, "procesar_chunk", fake_chunk):
+            sent = asyncio.run(_Socket(websocket.REALTIME_PATH).run({"type": "websocket.receive", "bytes": b"x"}))
+        self.assertEqual((sent[2]["whisper"], sent[2]["speech"]), ("w", "s"))
+
+    def test_rechazos(self):
+        sent = asyncio.run(_Socket("/asr/ws/otro/").run())
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4404}])
+        sent = asyncio.run(_Socket(websocket.REALTIME_PATH, "session_id=../x").run())
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4400}])
+
+
+class RealtimeTransportTests(_SessionTestCase):
+    """HTTP y WebSocket numeran igual los chunks: mismos archivos y mismo arranque de Whisper."""
+
+    CHUNKS = 6
+
+    def _run(self, send_chunks):
+        schedule = []
+
+        def fake_parallel(tasks):
+            schedule.append("whisper" in tasks)
+            return {}, {}
+
+        session_id = uuid.uuid4().hex
+        with override_settings(ASR_SESSIONS={**settings.ASR_SESSIONS, "KEEP_PARTS": True}), \
+                mock.patch.object(realtime, "run_parallel", fake_parallel), \
+                mock.patch.object(stream_decoder, "get_pool"):
+            send_chunks(session_id)
+            files = sorted(name for name in os.listdir(utils.session_dir(session_id)) if name.startswith("part_"))
+        return files, schedule
+
+    def test_mismos_archivos_y_parciales(self):
+        def http(session_id):
+            for index in range(self.CHUNKS):
+                response = self.client.post(reverse("api-realtime-chunk"), {
+                    "session_id": session_id,
+                    "part_index": index,
+                    "audio": SimpleUploadedFile("chunk.webm", b"chunk %d" % index),
+                })
+                self.assertEqual(response.status_code, 200)
+
+        def ws(session_id):
+            chunks = [{"type": "websocket.receive", "bytes": b"chunk %d" % index} for index in range(self.CHUNKS)]
+            sent = asyncio.run(_Socket(websocket.REALTIME_PATH, f"session_id={session_id}").run(*chunks))
+            self.assertEqual([message["part_index"] for message in sent[2:]], list(range(self.CHUNKS)))
+
+        files, schedule = self._run(http)
+        self.assertEqual(files, [f"part_{index:04d}.webm" for index in range(self.CHUNKS)])
+        # Whisper arranca en el quinto chunk (part_index 4)
+        self.assertEqual(schedule, [False] * 4 + [True] * (self.CHUNKS - 4))
+        self.assertEqual(self._run(ws), (files, schedule))
+
+
+class DecodeTests(TestCase):
+    """Decodificación directa de WAV/FLAC/PCM sin ffmpeg."""
+
+    def _encoded(self, samples, sample_rate, fmt):
+        buffer = io.BytesIO()
+        sf.write(buffer, samples, sample_rate, format=fmt, subtype="PCM_16")
+        return buffer.getvalue()
+
+    def test_wav_y_flac_estereo_a_16k_mono(self):
+        tone = _tone(1.0)
+        stereo = np.stack((tone, tone), axis=1)
+        with mock.patch("asr.decode._decode_ffmpeg", side_effect=AssertionError("no debe usar ffmpeg")):
+            for fmt in ("WAV", "FLAC"):
+                with self.subTest(fmt=fmt):
+                    data = self._encoded(stereo, audio_store.SAMPLE_RATE, fmt)
+                    self.assertEqual(sniff_format(data[:12]), fmt)
+                    samples = decode_audio(data)
+                    self.assertEqual((samples.dtype, samples.ndim, len(samples)), (np.float32, 1, len(tone)))
+                    np.testing.assert_allclose(samples, tone, atol=1e-4)
+            # 48 kHz se remuestrea
+            resampled = decode_audio(self._encoded(np.zeros(48000), 48000, "WAV"))
+            self.assertEqual(len(resampled), audio_store.SAMPLE_RATE)
+
+    def test_pcm_crudo(self):
+        pcm = audio_store.to_pcm16(_tone(0.5))
+        upload = SimpleUploadedFile("chunk.pcm", pcm.tobytes())
+        np.testing.assert_allclose(decode_audio(upload), pcm / 32768.0)
+        stereo = np.repeat(pcm, 2)
+        for content_type, data in (
+            ("audio/L16; rate=16000; channels=2", stereo.astype(">i2").tobytes()),
+            ("audio/L16; rate=16000; channels=2; endianness=little-endian", stereo.tobytes()),
+            ("audio/pcm; rate=16000; channels=2", stereo.tobytes()),
+            ("audio/s16le; channels=2", stereo.tobytes()),
+        ):
+            with self.subTest(content_type=content_type):
+                upload = SimpleUploadedFile("chunk", data, content_type=content_type)
+                np.testing.assert_allclose(decode_audio(upload), pcm / 32768.0)
+
+    def test_l16_es_big_endian(self):
+        pcm = audio_store.to_pcm16(_tone(0.5))
+        upload = SimpleUploadedFile("chunk", pcm.astype(">i2").tobytes(), content_type="audio/L16")
+        np.testing.assert_allclose(decode_audio(upload), pcm / 32768.0)
+        # Los mismos bytes leídos como little-endian serían ruido
+        upload = SimpleUploadedFile("chunk", pcm.astype(">i2").tobytes(), content_type="audio/pcm")
+        self.assertFalse(np.allclose(decode_audio(upload), pcm / 32768.0, atol=1e-3))
+
+
+class _PcmDecoder:
+    """Reemplazo de :class:`stream_decoder.StreamDecoder` sin ffmpeg: el "stream" ya es PCM16."""
+
+    def __init__(self, wav_path, skip_samples=0, webm_path=None):
+        self.wav_path = wav_path
+        self.webm_path = webm_path
+        self.skip = skip_samples
+        self.fed_bytes = 0
+        self.alive = True
+        self.last_used = 0.0
+
+    def in_sync(self):
+        return self.fed_bytes == os.path.getsize(self.webm_path)
+
+    def feed(self, data):
+        self.fed_bytes += len(data)
+        samples = np.frombuffer(data, dtype="<i2")
+        skipped = min(self.skip, len(samples))
+        self.skip -= skipped
+        if len(samples) > skipped:
+            audio_store.append_samples(self.wav_path, samples[skipped:])
+
+    def close(self):
+        self.alive = False
+
+    discard = close
+
+
+class DecoderPoolTests(TestCase):
+    """Decodificador persistente con varios procesos alimentando la misma sesión."""
+
+    def test_varios_workers_resincronizan(self):
+        stream = (np.arange(6000) % 2000 - 1000).astype("<i2")
+        chunks = np.array_split(stream, 6)
+        # Dos pools = dos workers; los chunks llegan alternados
+        pools = [stream_decoder.DecoderPool(), stream_decoder.DecoderPool()]
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(stream_decoder, "StreamDecoder", _PcmDecoder), \
+                mock.patch.object(stream_decoder.shutil, "which", return_value="/usr/bin/ffmpeg"):
+            wav_path = os.path.join(directory, "combined.wav")
+            webm_path = os.path.join(directory, "combined.webm")
+            for index, chunk in enumerate(chunks):
+                data = chunk.tobytes()
+                with open(webm_path, "ab") as handle:
+                    handle.write(data)
+                pools[index % 2].feed("s", data, wav_path, webm_path)
+            np.testing.assert_array_equal(audio_store.read_view(wav_path), stream)
+        self.assertGreater(pools[0].stats()["resyncs"], 0)
+
+    def _fake_ffmpeg(self, directory):
+        # "ffmpeg" que copia stdin (ya PCM16) a stdout pero retiene los últimos bytes hasta el EOF,
+        # como el PCM pendiente que ffmpeg solo entrega al cerrarse
+        path = os.path.join(directory, "ffmpeg")
+        with open(path, "w") as handle:
+            handle.write(f"""#!{sys.executable}
+import sys
+held = b""
+while True:
+    data = sys.stdin.buffer.read1(65536)
+    if not data:
+        break
+    held += data
+    sys.stdout.buffer.write(held[:-64])
+    sys.stdout.buffer.flush()
+    held = held[-64:]
+sys.stdout.buffer.write(held)
+""")
+        os.chmod(path, 0o755)
+        return path
+
+    def test_proceso_real_y_costo_de_resincronizar(self):
+        stream = (np.arange(12000) % 2000 - 1000).astype("<i2")
+        chunks = np.array_split(stream, 6)
+        with tempfile.TemporaryDirectory() as directory:
+            config = {**settings.ASR_STREAM_DECODER, "FFMPEG": self._fake_ffmpeg(directory)}
+            wav_path = os.path.join(directory, "combined.wav")
+            webm_path = os.path.join(directory, "combined.webm")
+            with override_settings(ASR_STREAM_DECODER=config):
+                pools = [stream_decoder.DecoderPool(idle_timeout=0), stream_decoder.DecoderPool(idle_timeout=0)]
+                history = []
+                for index, chunk in enumerate(chunks):
+                    data = chunk.tobytes()
+                    with open(webm_path, "ab") as handle:
+                        handle.write(data)
+                    history.append(os.path.getsize(webm_path))
+                    pools[index % 2].feed("s", data, wav_path, webm_path)
+                # El decodificador desfasado se descarta: vaciarlo duplicaría su PCM retenido
+                for pool in pools:
+                    pool.reap()
+            np.testing.assert_array_equal(audio_store.read_view(wav_path), stream)
+        # Cada cambio de worker vuelve a decodificar todo el historial
+        resyncs = sum(pool.stats()["resyncs"] for pool in pools)
+        resync_bytes = sum(pool.stats()["resync_bytes"] for pool in pools)
+        self.assertEqual((resyncs, resync_bytes), (5, sum(history[1:])))
+
+
+class SessionStorageTests(_SessionTestCase):
+    """Expiración por TTL y cuotas de ``ASR_SESSIONS``."""
+
+    def _session(self, size, age=0.0):
+        session_id = uuid.uuid4().hex
+        directory = sessions.session_path(session_id)
+        os.makedirs(directory)
+        path = os.path.join(directory, "combined.webm")
+        with open(path, "wb") as handle:
+            handle.write(b"\x00" * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return session_id
+
+    def test_ttl_y_cuota_global(self):
+        expired = self._session(10, age=100)
+        protected = self._session(10, age=100)
+        old, new = self._session(600, age=20), self._session(600, age=10)
+        result = sessions.collect(ttl=50, max_total_bytes=1000, protect={protected})
+        # Expira la vieja (salvo la protegida) y se desaloja la menos reciente hasta bajar del 90 %
+        self.assertEqual(result["removed"], [expired, old])
+        remaining = {item["session_id"] for item in sessions.list_sessions()}
+        self.assertEqual(remaining, {protected, new, self.session_id})  # la de setUp está vacía
+        self.assertEqual(result["bytes"], 610)
+
+    def test_cuota_por_sesion_y_ids_invalidos(self):
+        session_id = self._session(100)
+        with override_settings(ASR_SESSIONS={**settings.ASR_SESSIONS, "MAX_SESSION_BYTES": 150}):
+            sessions.reserve(session_id, 50)
+            with self.assertRaises(sessions.QuotaExceeded):
+                sessions.reserve(session_id, 51)
+        for invalid in ("../x", "", "a" * 65, "a/b"):
+            with self.subTest(session_id=invalid), self.assertRaises(ValueError):
+                sessions.session_path(invalid)
+        self.assertEqual(sessions.release(session_id), 100)
+        self.assertFalse(os.path.exists(sessions.session_path(session_id)))
+
+
+class JobStatusViewTests(TestCase):
+    """``GET /asr/jobs/<id>/?wait=N``."""
+
+    def _get(self, wait):
+        return self.client.get(reverse("api-job", args=[uuid.uuid4()]), {"wait": wait})
+
+    def test_wait_no_finito_o_invalido(self):
+        for wait in ("nan", "inf", "-inf", "1e400", "abc"):
+            with self.subTest(wait=wait):
+                self.assertEqual(self._get(wait).status_code, 400)
+
+    def test_wait_negativo_no_espera(self):
+        # Se acota a 0: el trabajo inexistente responde enseguida
+        self.assertEqual(self._get("-5").status_code, 404)
+
+
+class JobQueueTests(TestCase):
+    """Timeouts, trabajos huérfanos y cantidad de hilos de :class:`jobs.JobQueue`."""
+
+    def test_timeout_libera_el_worker(self):
+        queue = jobs.JobQueue(workers=1, interactive_workers=0)
+        release = threading.Event()
+        with self.assertRaises(TimeoutError):
+            queue.run("final", release.wait, 5, timeout=0.05)
+        # El hilo trabado se reemplazó: el siguiente trabajo no espera a que termine
+        self.assertEqual(queue.run("final", lambda: "ok", timeout=2), "ok")
+        release.set()
+        stats = queue.stats()["classes"]["final"]
+        self.assertEqual(stats["timed_out"], 1)
+        deadline = time.monotonic() + 2
+        while queue.stats()["running"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(queue._threads), 1)
+
+    def test_timeout_en_cola_no_se_ejecuta(self):
+        queue = jobs.JobQueue(workers=1, interactive_workers=0)
+        release, calls = threading.Event(), []
+        queue.submit("batch", release.wait, 5, persist=False)
+        while not queue.stats()["running"]:
+            time.sleep(0.01)
+        with self.assertRaises(TimeoutError):
+            queue.run("final", calls.append, 1, timeout=0.05)
+        release.set()
+        self.assertEqual(queue.run("final", lambda: "ok", timeout=2), "ok")
+        self.assertEqual(calls, [])
+
+    def test_huerfanos_fallan_al_arrancar(self):
+        from .models import TranscriptionJob
+
+        host = jobs.socket.gethostname()
+        TranscriptionJob.objects.create(id=uuid.uuid4(), kind="final", priority=1, owner=f"{host}:999999999")
+        TranscriptionJob.objects.create(
+            id=uuid.uuid4(), kind="final", priority=1, status="running", owner=f"{host}:999999999"
+        )
+        alive = TranscriptionJob.objects.create(id=uuid.uuid4(), kind="final", priority=1, owner=f"{host}:1")
+        other = TranscriptionJob.objects.create(id=uuid.uuid4(), kind="final", priority=1, owner="otro:999999999")
+        self.assertEqual(jobs.JobQueue().recover_orphans(), 2)
+        self.assertEqual(TranscriptionJob.objects.filter(status="failed", status_code=500).count(), 2)
+        self.assertEqual(jobs.JobQueue().get(alive.id)["status"], "queued")
+        self.assertEqual(jobs.JobQueue().get(other.id)["status"], "queued")
+
+    def test_huerfano_falla_al_consultarlo(self):
+        from .models import TranscriptionJob
+
+        record = TranscriptionJob.objects.create(
+            id=uuid.uuid4(), kind="final", priority=1, owner=f"{jobs.socket.gethostname()}:999999999"
+        )
+        data = jobs.JobQueue().get(record.id)
+        self.assertEqual((data["status"], data["error"]), ("failed", jobs.ORPHAN_ERROR))
+
+    @override_settings(ASR_JOBS={"WORKERS": 0, "INTERACTIVE_WORKERS": 0}, ASR_SCHEDULER={"MAX_BATCH_SIZE": 6})
+    def test_hilos_segun_el_lote_del_planificador(self):
+        with mock.patch.object(jobs, "_queue", None):
+            queue = jobs.get_queue()
+            self.assertEqual((queue.workers, queue.interactive_workers), (6, 6))
+
+
+class ASRWhisperViewTests(TestCase):
+    """``POST /asr/whisper/`` con audio que no se puede decodificar."""
+
+    def test_audio_invalido_en_async_y_stream(self):
+        for flag in ("async", "stream"):
+            with self.subTest(flag=flag):
+                response = self.client.post(f"{reverse('api-whisper')}?{flag}=1", {
+                    "audio": SimpleUploadedFile("audio.wav", b"RIFF\x00\x00 no es audio"),
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.json()["error"].startswith("Error decodificando audio:"))
+
+
+class DecodingProfileTests(TestCase):
+    """Perfiles de decodificación con nombre y ajustes por petición."""
+
+    def test_perfil_por_endpoint_y_ajustes(self):
+        partial = decoding.from_request({}, "partial")
+        self.assertEqual((partial["NUM_BEAMS"], partial["TEMPERATURES"]), (1, (0.0,)))
+        self.assertTrue(decoding.is_greedy(partial))
+        self.assertFalse(decoding.is_greedy(decoding.from_request({}, "final")))
+        # Por defecto, la decodificación original (beam 5, sin fallback); el fallback es opcional
+        for endpoint in ("final", "upload"):
+            profile = decoding.from_request({}, endpoint)
+            self.assertEqual((profile["NUM_BEAMS"], profile["TEMPERATURES"]), (5, (0.0,)))
+        self.assertEqual(decoding.from_request({"profile": "final-fallback"}, "final")["TEMPERATURES"],
+                         (0.0, 0.2, 0.4, 0.6))
+
+        profile = decoding.from_request({"profile": "batch", "num_beams": "3", "temperature": "0,0.5"}, "upload")
+        self.assertEqual((profile["NUM_BEAMS"], profile["TEMPERATURES"]), (3, (0.0, 0.5)))
+        kwargs = decoding.generate_kwargs(profile)
+        self.assertEqual((kwargs["num_beams"], kwargs["temperature"]), (3, (0.0, 0.5)))
+        self.assertTrue(kwargs["early_stopping"])
+        # Un perfil ya resuelto se devuelve tal cual
+        self.assertIs(decoding.resolve(profile), profile)
+
+    def test_valores_no_permitidos(self):
+        for params in (
+            {"profile": "inexistente"},
+            {"num_beams": "99"},
+            {"max_length": "8"},
+            {"max_time": "0"},
+            {"temperature": "1.5"},
+            {"temperature": ",".join(["0"] * 7)},
+        ):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                decoding.from_request(params, "final")
+        with self.assertRaises(ValueError):
+            decoding.resolve("final", {"top_k": 5})
+
+    def test_vista_rechaza_perfil_invalido(self):
+        response = self.client.post(f"{reverse('api-whisper')}?num_beams=0", {
+            "audio": _wav_upload(_tone(0.5)),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("num_beams", response.json()["error"])
+
+
+class StreamingLogMelTests(TestCase):
+    """Las features incrementales coinciden con el cálculo directo de cada ventana."""
+
+    def test_coincide_con_referencia_al_agregar_audio(self):
+        rng = np.random.default_rng(0)
+        stream = (0.1 * rng.standard_normal(40 * features.SAMPLE_RATE)).astype(np.float32)
+        extractor = features.StreamingLogMel(lambda lo, hi: stream[lo:hi], capacity_frames=features.N_FRAMES)
+        total, start = 0, 0
+        # Chunks de tamaños irregulares (no múltiplos del hop) y ventanas que avanzan
+        for step in (4000, 12001, 7999, 160, 23457, 31, 48000, 96000, 150000, 250000):
+            total = min(len(stream), total + step)
+            if total - start > features.N_SAMPLES:
+                start = (total - features.N_SAMPLES // 2) // features.HOP * features.HOP
+            with self.subTest(start=start, stop=total):
+                np.testing.assert_allclose(
+                    extractor.window(start, total, total),
+                    features.reference_features(stream[start:total]),
+                    atol=1e-5,
+                )
+
+    # Salida de WhisperFeatureExtractor (transformers 4.56.2) para _fixture_audio(): filas = bandas
+    # mel 0, 10, 40 y 79; columnas = frames 0, 1, 2 (padding reflect), 25, 49-51 (fin del audio) y
+    # 100 (solo relleno, recortado a max - 8)
+    FIXTURE_MELS = [0, 10, 40, 79]
+    FIXTURE_FRAMES = [0, 1, 2, 25, 49, 50, 51, 100]
+    FIXTURE = [
+        [0.646627, 0.101301, -0.677479, -0.677479, 0.222687, 0.734823, 0.222791, -0.677479],
+        [0.873927, 0.906709, 0.919144, 1.126921, 1.235114, 1.156491, 0.250045, -0.677479],
+        [-0.013052, -0.521617, -0.677479, -0.677479, -0.275085, 0.219216, -0.27334, -0.677479],
+        [-0.511523, -0.677479, -0.677479, -0.677479, -0.631507, -0.121419, -0.631508, -0.677479],
+    ]
+
+    @staticmethod
+    def _fixture_audio():
+        t = np.arange(8000) / features.SAMPLE_RATE
+        tone = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.1 * np.sin(2 * np.pi * (200 + 2000 * t) * t)
+        return tone.astype(np.float32) * np.linspace(0.2, 1, 8000, dtype=np.float32)
+
+    def test_coincide_con_fixture_de_whisper(self):
+        samples = self._fixture_audio()
+        extractor = features.StreamingLogMel(lambda lo, hi: samples[lo:hi])
+        window = extractor.window(0, len(samples), len(samples))
+        self.assertEqual(window.shape, (80, features.N_FRAMES))
+        np.testing.assert_allclose(window[np.ix_(self.FIXTURE_MELS, self.FIXTURE_FRAMES)], self.FIXTURE, atol=1e-5)
+
+    @skipUnless(WhisperFeatureExtractor, "requiere transformers")
+    def test_coincide_con_whisper_feature_extractor(self):
+        rng = np.random.default_rng(1)
+        stream = (0.1 * rng.standard_normal(45 * features.SAMPLE_RATE)).astype(np.float32)
+        for n_mels in (80, 128):
+            extractor = features.StreamingLogMel(lambda lo, hi: stream[lo:hi], n_mels=n_mels)
+            whisper = WhisperFeatureExtractor(feature_size=n_mels)
+            for start, stop in ((0, 7 * 16000 + 123), (0, 30 * 16000), (4000 * features.HOP, 45 * 16000)):
+                with self.subTest(n_mels=n_mels, start=start, stop=stop):
+                    expected = whisper(stream[start:stop], sampling_rate=16000, return_tensors="np").input_features[0]
+                    np.testing.assert_allclose(extractor.window(start, stop, stop), expected, atol=1e-5)
+
+
+class BenchmarkTests(TestCase):
+    """El benchmark no mide etapas que fallan sin avisar."""
+
+    def test_save_chunk_sin_audio_se_omite(self):
+        # save_chunk_file que no agrega PCM al WAV (como sin ffmpeg)
+        bench = benchmark.Benchmark(stages=("decode_wav", "save_chunk"), repeat=1, warmup=0, log=lambda message: None)
+        with mock.patch.object(benchmark, "save_chunk_file"):
+            results = {item["stage"]: item for item in bench.run([("sintetico", benchmark.synthetic_audio(2.0), None)])}
+        self.assertIn("p50_ms", results["decode_wav"])
+        self.assertNotIn("p50_ms", results["save_chunk"])
+        self.assertIn("no agregó audio", results["save_chunk"]["error"])
+
+    def test_reconocedor_y_directorio_inyectados(self):
+        recognizer = benchmark.StubRecognizer()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        bench = benchmark.Benchmark(
+            stages=("save_chunk", "google"), repeat=2, warmup=0, log=lambda message: None,
+            recognizer=recognizer, session_dir=directory.name,
+        )
+        with mock.patch.object(benchmark, "save_chunk_file") as save:
+            save.side_effect = lambda session_id, *args: self.assertEqual(sessions.root(), directory.name)
+            results = bench.run([("sintetico", benchmark.synthetic_audio(2.0), None)])
+        self.assertTrue(save.called)
+        self.assertIn("p50_ms", results[1])
+        # Sin caché: cada ejecución medida (y la de tracemalloc) llama al reconocedor
+        self.assertEqual(recognizer.calls, 3)
+        self.assertNotEqual(sessions.root(), directory.name)
+
+    def test_raiz_aislada_sin_cuotas(self):
+        directory, configured = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(configured.cleanup)
+        quotas = {**settings.ASR_SESSIONS, "DIR": configured.name, "MAX_SESSION_BYTES": 1, "MAX_TOTAL_BYTES": 1}
+        with override_settings(ASR_SESSIONS=quotas), mock.patch.object(stream_decoder, "get_pool"):
+            with sessions.isolated_root(directory.name):
+                chunk_path, _webm = utils.save_chunk_file("bench", 0, io.BytesIO(b"chunk"))
+            self.assertEqual(os.path.dirname(chunk_path), os.path.join(directory.name, "bench"))
+            with self.assertRaises(sessions.QuotaExceeded):
+                utils.save_chunk_file(uuid.uuid4().hex, 0, io.BytesIO(b"chunk"))
+
+    def test_rss_no_disponible_no_se_compara(self):
+        bench = benchmark.Benchmark(stages=("decode_wav",), repeat=1, warmup=0, log=lambda message: None)
+        with mock.patch.object(benchmark, "_reset_peak_rss", return_value=False):
+            results = bench.run([("sintetico", benchmark.synthetic_audio(1.0), None)])
+        self.assertIsNone(results[0]["peak_rss_mb"])
+        baseline = {"results": [dict(results[0], peak_rss_mb=100.0)]}
+        rows = benchmark.compare({"results": results}, baseline)
+        self.assertEqual(len(rows), 1)
+        self.assertNotIn("peak_rss_change_mb", rows[0])
+
+
+class MetricsTests(TestCase):
+    """Registro de métricas, ``GET /asr/metrics/`` y cabecera ``X-Trace-Id``."""
+
+    def test_histograma_y_contador(self):
+        registry = metrics.Registry()
+        histogram = registry.register(metrics.Histogram("t_seconds", "Prueba.", labels=("stage",), buckets=(0.1, 1.0)))
+        counter = registry.register(metrics.Counter("t_total", "Prueba.", labels=("engine",)))
+        histogram.observe(0.05, stage="decode")
+        histogram.observe(0.5, stage="decode")
+        counter.inc(engine='a"b')
+        text = registry.render()
+        self.assertIn('t_seconds_bucket{stage="decode",le="0.1"} 1', text)
+        self.assertIn('t_seconds_bucket{stage="decode",le="+Inf"} 2', text)
+        self.assertIn('t_seconds_count{stage="decode"} 2', text)
+        self.assertIn('t_total{engine="a\\"b"} 1', text)
+        with self.assertRaises(ValueError):
+            counter.inc(stage="x")
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter("t_total", "Duplicada."))
+
+    def test_vista_y_trace_id(self):
+        with metrics.stage("decode"):
+            pass
+        response = self.client.get(reverse("api-metrics"), HTTP_X_REQUEST_ID="cliente-123")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Trace-Id"], "cliente-123")
+        self.assertIn('asr_stage_seconds_count{stage="decode"}', response.content.decode())
+        # Un id inválido se reemplaza por uno generado
+        response = self.client.get(reverse("api-metrics"), HTTP_X_REQUEST_ID="no válido")
+        self.assertRegex(response["X-Trace-Id"], r"^[0-9a-f]{32}$")
+        with override_settings(ASR_METRICS={"ENABLED": False, "TRACE_IDS": False}):
+            response = self.client.get(reverse("api-metrics"))
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn("X-Trace-Id", response)
+
+
+class BulkTranscriberTests(TestCase):
+    """``manage.py transcribe``: JSONL como checkpoint y reanudación."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for name in ("a.wav", "b.wav"):
+            sf.write(os.path.join(self.tmp.name, name), _tone(0.5), audio_store.SAMPLE_RATE)
+        with open(os.path.join(self.tmp.name, "roto.wav"), "wb") as handle:
+            handle.write(b"RIFF\x00\x00 no es audio")
+        with open(os.path.join(self.tmp.name, "notas.txt"), "w") as handle:
+            handle.write("no es audio")
+        self.output = os.path.join(self.tmp.name, "out.jsonl")
+
+    def _run(self, **kwargs):
+        transcriber = bulk.BulkTranscriber(engine="google", workers=1, concurrency=2, log=lambda message: None)
+        return transcriber.run(bulk.find_audio(self.tmp.name), self.output, **kwargs)
+
+    def _records(self):
+        with open(self.output, encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_checkpoint_y_reanudacion(self):
+        fake = mock.Mock(return_value=({"text": "hola", "segments": []}, 1.0))
+        with mock.patch("asr.bulk._transcribe", fake):
+            summary = self._run()
+            self.assertEqual((summary["ok"], summary["errors"], summary["skipped"]), (2, 1, 0))
+            self.assertAlmostEqual(summary["audio_seconds"], 1.0)
+            by_name = {os.path.basename(record["path"]): record for record in self._records()}
+            self.assertEqual(set(by_name), {"a.wav", "b.wav", "roto.wav"})
+            self.assertEqual(by_name["a.wav"]["text"], "hola")
+            self.assertEqual(by_name["roto.wav"]["status"], "error")
+
+            # Una línea cortada por una interrupción se ignora y se completa
+            with open(self.output, "a", encoding="utf-8") as handle:
+                handle.write('{"path": "cortada')
+            summary = self._run(resume=True)
+            self.assertEqual((summary["ok"], summary["errors"], summary["skipped"]), (0, 0, 3))
+            summary = self._run(resume=True, retry_errors=True)
+            self.assertEqual((summary["ok"], summary["errors"], summary["skipped"]), (0, 1, 2))
+        self.assertEqual(fake.call_count, 2)
+        self.assertEqual(len(bulk.completed_paths(self.output)), 3)
+        self.assertEqual(len(bulk.completed_paths(self.output, retry_errors=True)), 2)
+
+    def test_fallo_del_motor_se_reintenta(self):
+        # Un error de red no se guarda como transcripción vacía con status ok
+        with override_settings(ASR_CACHE={"ENABLED": False}), \
+                mock.patch.object(sr.Recognizer, "recognize_google", side_effect=sr.RequestError("sin red")):
+            summary = self._run()
+        self.assertEqual((summary["ok"], summary["errors"]), (0, 3))
+        self.assertTrue(all(record["status"] == "error" for record in self._records()))
+        self.assertEqual(bulk.completed_paths(self.output, retry_errors=True), set())
+
+    def test_tamano_de_lote_explicito(self):
+        scheduler = InferenceScheduler(lambda items, options: items, max_batch_size=8)
+        with mock.patch.object(utils, "_model_client", return_value=None), \
+                mock.patch.object(utils, "get_scheduler", return_value=scheduler):
+            self.assertTrue(utils.configure_scheduler(max_batch_size=3, batch_window_ms=50))
+        self.assertEqual(scheduler.stats()["max_batch_size"], 3)
+        with mock.patch.object(utils, "_model_client", return_value=mock.Mock()):
+            self.assertFalse(utils.configure_scheduler(max_batch_size=3))
+
+
+class _FakeGoogle(BaseHTTPRequestHandler):
+    """Responde como la API web de Google: la "transcripción" es la duración del FLAC recibido."""
+
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        samples, sample_rate = sf.read(io.BytesIO(body))
+        seconds = round(len(samples) / sample_rate, 1)
+        self.requests.append(seconds)
+        result = {"result": [{"alternative": [{"transcript": f"voz de {seconds} s", "confidence": 0.9}]}]}
+        payload = ("{\"result\":[]}\n" + json.dumps(result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class GoogleStreamTests(TestCase):
+    """Google incremental contra un servidor local en ``ASR_GOOGLE["URL"]``."""
+
+    def setUp(self):
+        _FakeGoogle.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeGoogle)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        google = {**settings.ASR_GOOGLE, "URL": f"http://127.0.0.1:{self.server.server_port}/recognize"}
+        session_config = {**settings.ASR_SESSIONS, "DIR": directory.name}
+        overrides = override_settings(ASR_GOOGLE=google, ASR_SESSIONS=session_config, ASR_CACHE={"ENABLED": False})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    @staticmethod
+    def _voice(seconds):
+        t = np.arange(int(seconds * audio_store.SAMPLE_RATE)) / audio_store.SAMPLE_RATE
+        return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+    @staticmethod
+    def _silence(seconds):
+        return np.zeros(int(seconds * audio_store.SAMPLE_RATE), dtype=np.float32)
+
+    def test_solo_envia_segmentos_terminados(self):
+        session_id = uuid.uuid4().hex
+        wav_path = combined_wav_path(session_id)
+        audio_store.write_samples(wav_path, np.concatenate((self._silence(0.5), self._voice(1.0), self._silence(1.0))))
+        audio_store.append_samples(wav_path, self._voice(2.0))
+
+        # El segundo segmento sigue abierto (no hay silencio después): solo se envía el primero
+        partial = google_stream.transcribir_sesion(session_id)
+        self.assertEqual(len(_FakeGoogle.requests), 1)
+        self.assertLess(_FakeGoogle.requests[0], 2.0)
+        # Sin audio nuevo no se repiten peticiones
+        self.assertEqual(google_stream.transcribir_sesion(session_id), partial)
+        self.assertEqual(len(_FakeGoogle.requests), 1)
+
+        final = google_stream.transcribir_sesion(session_id, final=True)
+        self.assertEqual(len(_FakeGoogle.requests), 2)
+        self.assertGreaterEqual(_FakeGoogle.requests[1], 2.0)
+        self.assertEqual(final, f"{partial} voz de {_FakeGoogle.requests[1]} s")
+        state = google_stream.load_state(session_id)
+        self.assertEqual(state["committed_samples"], audio_store.num_samples(wav_path))
+
+    def test_error_http_en_final(self):
+        session_id = uuid.uuid4().hex
+        audio_store.write_samples(combined_wav_path(session_id), self._voice(1.0))
+        with mock.patch.object(_FakeGoogle, "do_POST", lambda handler: handler.send_error(500)), \
+                self.assertLogs("asr.google_stream", "WARNING"):
+            with self.assertRaises(google_stream.GoogleError):
+                google_stream.transcribir_sesion(session_id, final=True)
+        # El segmento fallido queda pendiente y se envía en el siguiente intento
+        self.assertEqual(google_stream.load_state(session_id)["committed_samples"], 0)
+        self.assertEqual(google_stream.transcribir_sesion(session_id, final=True), "voz de 1.0 s")
+
+
+class _Tokenizer:
+    """Tokenizer de juguete: el token ``n`` es la palabra ``wn``."""
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return " ".join(f"w{token}" for token in tokens)
+
+    def encode(self, text, add_special_tokens=False):
+        return [int(word[1:]) for word in text.split()]
+
+
+class PrefixReuseTests(_SessionTestCase):
+    """Parciales con prefijo forzado y prompt (``ASR_STREAMING["PREFIX_REUSE"]``)."""
+
+    def test_segmentos_y_prompt(self):
+        ts = 1000  # <|0.00|>
+        tokens = [ts, 1, 2, ts + 50, ts + 50, 3, ts + 100, 4]
+        segments = prefix_decode.parse_segments(_Tokenizer(), tokens, ts, window_seconds=3.0)
+        self.assertEqual(
+            [(segment["start"], segment["end"], segment["text"], segment["closed"]) for segment in segments],
+            [(0.0, 1.0, "w1 w2", True), (1.0, 2.0, "w3", True), (2.0, 3.0, "w4", False)],
+        )
+        self.assertEqual(segments[0]["tokens"], [ts, 1, 2, ts + 50])
+        self.assertEqual(segments[2]["tokens"], [4])
+
+        processor = mock.Mock(tokenizer=_Tokenizer())
+        vocab = mock.Mock(startofprev=999)
+        self.assertEqual(prefix_decode.prompt_tokens(processor, vocab, "w1 w2 w3", max_tokens=2), [999, 2, 3])
+        self.assertEqual(prefix_decode.prompt_tokens(processor, vocab, "  "), [])
+
+    def fake_prefijo(self, samples, prompt="", prefix=(), model=None, decoding=None, features=None):
+        # Como fake_segmentos, pero el "modelo" continúa después del prefijo forzado (token k = bloque k)
+        self.calls.append((prompt, list(prefix)))
+        start = (audio_store.num_samples(self.wav_path) - len(samples)) / audio_store.SAMPLE_RATE
+        stop = start + len(samples) / audio_store.SAMPLE_RATE
+        segments = []
+        for block in range(int(start // BLOCK_SECONDS), int(np.ceil(stop / BLOCK_SECONDS))):
+            end = min(stop, (block + 1) * BLOCK_SECONDS)
+            if block not in prefix and end > start:
+                segments.append({
+                    "end": end - start, "text": f"bloque {block}", "tokens": [block],
+                    "closed": end == (block + 1) * BLOCK_SECONDS,
+                })
+        return {"segments": segments, "steps": len(segments) + 1, "prefix_tokens": len(prefix)}
+
+    def test_reutiliza_prefijo_y_reinicia_ventana(self):
+        self.calls = []
+        with mock.patch.object(streaming, "whisper_prefijo", self.fake_prefijo):
+            self.append_voice(6.0)
+            streaming.transcribir_parcial(self.session_id)
+            for _ in range(12):
+                self.append_voice(BLOCK_SECONDS)
+                text = streaming.transcribir_parcial(self.session_id)
+
+        blocks = int(audio_store.num_samples(self.wav_path) / audio_store.SAMPLE_RATE / BLOCK_SECONDS)
+        self.assertEqual(text, " ".join(f"bloque {block}" for block in range(blocks)))
+        # Lo confirmado dentro de la ventana se fuerza como prefijo en vez de volver a generarse
+        self.assertTrue(any(prefix for _prompt, prefix in self.calls))
+        # Al reiniciar la ventana lo confirmado pasa al prompt
+        self.assertTrue(any(prompt.startswith("bloque 0 bloque 1") for prompt, _prefix in self.calls))
+
+
+class _Decoder:
+    def __init__(self):
+        self.hooks = []
+
+    def register_forward_hook(self, hook):
+        self.hooks.append(hook)
+
+
+class _GenerativeModel:
+    """Modelo de juguete: ``generate`` corre ``steps`` veces su decoder y el del asistente."""
+
+    def __init__(self, steps=0, output=()):
+        self.decoder = _Decoder()
+        self.generation_config = mock.Mock()
+        self.steps, self.output = steps, output
+
+    def get_decoder(self):
+        return self.decoder
+
+    def generate(self, features, assistant_model=None, **kwargs):
+        for model in (self, assistant_model):
+            for _ in range(model.steps):
+                for hook in model.decoder.hooks:
+                    hook(None, None, None)
+        return [np.array(self.output)]
+
+
+class SpeculativeTests(TestCase):
+    """Decodificación especulativa: solo con perfiles voraces y tasa de aceptación."""
+
+    @override_settings(ASR_SPECULATIVE={"ENABLED": True, "DRAFT_MODEL": "tiny", "NUM_ASSISTANT_TOKENS": 4})
+    def test_habilitado_y_tasa_de_aceptacion(self):
+        greedy = decoding.resolve("final-greedy")
+        self.assertTrue(speculative.enabled("large", greedy))
+        self.assertFalse(speculative.enabled("large", decoding.resolve("final")))  # beam search
+        self.assertFalse(speculative.enabled("tiny", greedy))  # el borrador no se asiste a sí mismo
+
+        # 3 tokens iniciales + 8 generados en 2 pasadas del grande y 8 del borrador
+        model, draft = _GenerativeModel(steps=2, output=[1, 2, 3, *range(10, 18)]), _GenerativeModel(steps=8)
+        empty = {"requests": 0, "generated_tokens": 0, "target_steps": 0, "draft_steps": 0}
+        with mock.patch.dict(speculative._stats, empty):
+            sequences = speculative.generate(model, draft, np.zeros((2, 80, 10)), prompt_ids={1, 2, 3})
+            stats = speculative.stats()
+        self.assertEqual(len(sequences), 2)
+        self.assertEqual(draft.generation_config.num_assistant_tokens, 4)
+        self.assertEqual((stats["requests"], stats["generated_tokens"]), (2, 16))
+        self.assertEqual((stats["target_steps"], stats["draft_steps"]), (4, 16))
+        # Aceptados: cada pasada del grande agrega un token propio a los del borrador
+        self.assertEqual(stats["acceptance_rate"], 0.75)
+        self.assertEqual(stats["tokens_per_target_step"], 4.0)
+
+    @override_settings(ASR_SPECULATIVE={"ENABLED": True, "DRAFT_MODEL": "tiny"})
+    def test_perfiles_por_defecto_avisan_donde_no_se_aplica(self):
+        with self.assertLogs("asr.speculative", "WARNING") as logs:
+            speculative.check_configuration()
+        self.assertIn("final: beam search (NUM_BEAMS 5)", logs.output[0])
+        stats = speculative.stats()
+        self.assertEqual(stats["endpoints"], ["stream"])
+        self.assertIn("upload: beam search", stats["skipped_reason"])
+        self.assertIn("partial: decodifica con prefijo", stats["skipped_reason"])
+
+        profiles = {**settings.ASR_ENDPOINT_PROFILES, "final": "final-greedy", "upload": "final-greedy"}
+        with override_settings(ASR_ENDPOINT_PROFILES=profiles, ASR_STREAMING={"PREFIX_REUSE": False}):
+            self.assertIsNone(speculative.skipped_reason())
+            self.assertEqual(speculative.active_endpoints(), list(profiles))
+        with override_settings(ASR_SPECULATIVE={"ENABLED": False}):
+            self.assertEqual((speculative.stats()["endpoints"], speculative.skipped_reason()),
+                             ([], "deshabilitada (ASR_SPECULATIVE)"))
+
+
+class AdmissionControllerTests(TestCase):
+    """Admisión de parciales: uno por sesión (el más nuevo) y tope global."""
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+
+    def test_coalesce_y_descarte(self):
+        controller = admission.AdmissionController(max_inflight=1, queue_timeout=5)
+        release = threading.Event()
+        with ThreadPoolExecutor(4) as pool:
+            running = pool.submit(controller.run, "a", lambda: release.wait(5) and "primero")
+            self._wait_for(lambda: controller.stats()["inflight"] == 1)
+            stale = pool.submit(controller.run, "a", lambda: "obsoleto")
+            self._wait_for(lambda: controller.stats()["waiting"] == 1)
+            newest = pool.submit(controller.run, "a", lambda: "nuevo")
+            # El pedido que esperaba queda reemplazado por el más nuevo sin ejecutarse
+            self.assertEqual(stale.result(timeout=5), (None, admission.COALESCED))
+
+            # Sin lugar global dentro del plazo, otra sesión se descarta
+            controller.queue_timeout = 0.05
+            self.assertEqual(controller.run("b", lambda: "b"), (None, admission.SHED))
+
+            release.set()
+            self.assertEqual(running.result(timeout=5), ("primero", admission.ADMITTED))
+            self.assertEqual(newest.result(timeout=5), ("nuevo", admission.ADMITTED))
+
+        stats = controller.stats()
+        self.assertEqual((stats["admitted"], stats["coalesced"], stats["shed"]), (2, 1, 1))
+        self.assertEqual((stats["inflight"], stats["waiting"]), (0, 0))
+        self.assertEqual(controller._sessions, {})
+
+
+class BackendFallbackTests(TestCase):
+    """Un backend que no se puede construir o no da la misma salida vuelve a eager."""
+
+    def setUp(self):
+        self.encoder, self.decoder = object(), object()
+        self.model = mock.Mock()
+        self.model.model.encoder, self.model.model.decoder = self.encoder, self.decoder
+        for name, value in (("configure_threads", None), ("_reference", "referencia")):
+            patcher = mock.patch.object(backends, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _apply(self, backend, build=None, parity=None):
+        def replace_encoder(*args):
+            self.model.model.encoder = "compilado"
+
+        with mock.patch.object(backends, "_build", side_effect=build or replace_encoder), \
+                mock.patch.object(backends, "_parity", return_value=parity), \
+                self.assertLogs("asr.backends", "WARNING"):
+            backends.apply(self.model, None, "prueba", {"BACKEND": backend})
+        return backends.info("prueba")
+
+    def test_paridad_fallida_vuelve_a_eager(self):
+        info = self._apply("torchscript", parity={"encoder_max_abs_diff": 0.5, "tokens_match": True, "ok": False})
+        self.assertIs(self.model.model.encoder, self.encoder)
+        self.assertIs(self.model.model.decoder, self.decoder)
+        self.assertEqual((info["requested"], info["backend"]), ("torchscript", "eager"))
+        self.assertIn("no coincide", info["error"])
+        self.assertFalse(info["parity"]["ok"])
+
+    def test_error_al_construir_vuelve_a_eager(self):
+        info = self._apply("onnx", build=RuntimeError("el backend onnx necesita onnxruntime"))
+        self.assertIs(self.model.model.encoder, self.encoder)
+        self.assertEqual(info["backend"], "eager")
+        self.assertIn("onnxruntime", info["error"])
+
+    def test_paridad_correcta_conserva_el_backend(self):
+        with mock.patch.object(backends, "_build"), \
+                mock.patch.object(backends, "_parity", return_value={"ok": True, "tokens_match": True}):
+            backends.apply(self.model, None, "prueba", {"BACKEND": "compile"})
+        self.assertEqual(backends.info("prueba")["backend"], "compile")
+
+    def test_backend_desconocido(self):
+        with self.assertRaises(ValueError):
+            backends.apply(self.model, None, "prueba", {"BACKEND": "tensorrt"})
+
+
+class StreamingResponseTests(TestCase):
+    """``?stream=1``: el texto sale como server-sent events a medida que se genera."""
+
+    def fake_detallado(self, samples, model=None, decoding=None, on_event=None):
+        on_event({"type": "text", "text": "hola"})
+        on_event({"type": "segment", "start": 0.0, "end": 1.0, "text": "hola mundo"})
+        return {"text": "hola mundo", "segments": [{"start": 0.0, "end": 1.0, "text": "hola mundo"}]}
+
+    async def _events(self, response):
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split("\n\n"):
+            kind, data = block.split("\n")
+            events.append((kind.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events
+
+    async def test_eventos_y_resultado(self):
+        with mock.patch.object(views, "transcribir_whisper_detallado", self.fake_detallado):
+            response = await self.async_client.post(
+                f"{reverse('api-whisper')}?stream=1", {"audio": _wav_upload(_tone(0.5))}
+            )
+            events = await self._events(response)
+        self.assertEqual([kind for kind, _data in events], ["text", "segment", "result"])
+        self.assertEqual(events[0][1], {"text": "hola"})
+        self.assertEqual(events[-1][1]["text"], "hola mundo")
+        self.assertEqual(events[-1][1]["model"], "Whisper fine-tuned")
+
+    async def test_perfiles_por_defecto_emiten_texto(self):
+        def runner(items, options):
+            # Solo el camino voraz recibe on_text; con beam search no habría eventos de texto
+            for item in items:
+                for word in ("hola", " mundo"):
+                    item["on_text"](word)
+            return ["hola mundo"] * len(items)
+
+        scheduler = InferenceScheduler(runner, batch_window_ms=0)
+        with override_settings(ASR_CACHE={"ENABLED": False}), \
+                mock.patch.object(utils, "_model_client", return_value=None), \
+                mock.patch.object(utils, "get_scheduler", return_value=scheduler):
+            response = await self.async_client.post(
+                f"{reverse('api-whisper')}?stream=1", {"audio": _wav_upload(_tone(2.0))}
+            )
+            events = await self._events(response)
+        self.assertEqual([kind for kind, _data in events], ["text", "text", "result"])
+        self.assertEqual(events[-1][1]["text"], "hola mundo")
+
+    async def test_error_cierra_el_stream(self):
+        with mock.patch.object(views, "transcribir_whisper_detallado", side_effect=RuntimeError("sin modelo")):
+            response = await self.async_client.post(
+                f"{reverse('api-whisper')}?stream=1", {"audio": _wav_upload(_tone(0.5))}
+            )
+            events = await self._events(response)
+        self.assertEqual(events, [("error", {"error": "sin modelo"})])
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from asr.views import ASRSpeechRecognitionView, ASRWhisperView, CompareASRView, RecordView, UploadView, RealtimeChunkView, RealtimeFinalizeView
+from asr.views import ASRSpeechRecognitionView, ASRStatsView, ASRWhisperView, CompareASRView, JobStatusView, MetricsView, RecordView, UploadView, RealtimeChunkView, RealtimeFinalizeView
 
 urlpatterns = [
     # Templates
@@ -11,6 +11,9 @@ urlpatterns = [
     path("whisper/", ASRWhisperView.as_view(), name="api-whisper"),
     path("speechrec/", ASRSpeechRecognitionView.as_view(), name="api-speechrec"),
     path("compare/", CompareASRView.as_view(), name="api-compare"),
+    path("stats/", ASRStatsView.as_view(), name="api-stats"),
+    path("metrics/", MetricsView.as_view(), name="api-metrics"),
+    path("jobs/<str:job_id>/", JobStatusView.as_view(), name="api-job"),
     
     path("realtime_chunk/", RealtimeChunkView.as_view(), name="api-realtime-chunk"),
     path("realtime_finalize/", RealtimeFinalizeView.as_view(), name="api-realtime-finalize"),
@@ -1,96 +1,624 @@
+import contextvars
 import io
+import json
+import logging
 import os
+import shutil
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import speech_recognition as sr
-import torch
-from pydub import AudioSegment
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
+from django.conf import settings
 
-processor = WhisperProcessor.from_pretrained("openai/whisper-large")
-model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-large")
-BASE_DIR = "/tmp/asr_sessions"
-os.makedirs(BASE_DIR, exist_ok=True)
+from . import (
+    audio_store, backends, decoding as decoding_profiles, features, longform, metrics, prefix_decode, sessions, speculative, stream_decoder,
+    vad,
+)
+from .decode import decode_audio, decode_pcm16, write_wav
+from .cache import cached, get_cache
+from .model_server import ModelServerUnavailable
+from .scheduler import InferenceScheduler
+
+logger = logging.getLogger(__name__)
+
+# torch y transformers se importan solo al cargar el modelo, para que los workers
+# web y los comandos de manage.py arranquen sin pagar ese costo.
+
+# El extractor de Whisper solo usa 30 s de audio por pasada
+WHISPER_MAX_SAMPLES = 30 * 16000
+
+# Comunes a todos los perfiles; beams, longitud, temperatura y tiempo vienen del
+# perfil de decodificación (ver asr.decoding y ASR_DECODING_PROFILES)
+WHISPER_GENERATE_KWARGS = dict(
+    language="spanish",  # Forzar español
+    task="transcribe",   # Tarea específica
+    no_repeat_ngram_size=3,
+    repetition_penalty=1.1,
+)
 
 
 def load_audio(file_obj, target_sr=16000):
-    """Carga un archivo de audio con pydub y devuelve un tensor de PyTorch."""
-    audio = AudioSegment.from_file(file_obj)
-    audio = audio.set_frame_rate(target_sr).set_channels(1)
-    samples = np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-    return torch.tensor(samples).unsqueeze(0), target_sr
+    """Carga un archivo de audio y devuelve un tensor de PyTorch."""
+    samples = decode_audio(file_obj, target_sr)
+    import torch
+
+    return torch.from_numpy(np.ascontiguousarray(samples)).unsqueeze(0), target_sr
 
 
 def convert_to_wav(file_obj):
     """Convierte cualquier archivo de audio a WAV PCM temporal."""
-    audio = AudioSegment.from_file(file_obj)
     temp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-    audio.export(temp_wav.name, format="wav")
-    return temp_wav.name
+    temp_wav.close()
+    return write_wav(temp_wav.name, decode_audio(file_obj))
+
 
+def cargar_muestras(file_obj, target_sr=16000):
+    """Devuelve las muestras float32 a 16 kHz mono de una ruta o archivo subido."""
+    if isinstance(file_obj, np.ndarray):
+        # Ya decodificado (p. ej. una sola vez para varios motores)
+        return file_obj.astype(np.float32, copy=False)
+    if isinstance(file_obj, str) and audio_store.is_session_wav(file_obj):
+        # Audio de sesion: ya está normalizado, se lee sin decodificar
+        return audio_store.read_float(file_obj)
+    # WAV/FLAC/PCM se leen directo; ffmpeg solo para formatos comprimidos
+    return decode_audio(file_obj, target_sr)
 
-def transcribir_whisper(file_obj, target_sr=16000):
+
+def transcribir_whisper(file_obj, target_sr=16000, model=None, decoding=None):
     """Transcribe un archivo de audio usando Whisper fine-tuned."""
+    return transcribir_whisper_detallado(file_obj, target_sr, model, decoding)["text"]
+
+
+def transcribir_whisper_detallado(file_obj, target_sr=16000, model=None, decoding=None, on_event=None,
+                                  raise_errors=False):
+    """Transcribe audio de cualquier duración y devuelve ``{"text", "segments"}``.
+
+    Hasta 30 s se decodifica en una sola pasada; el audio más largo se divide en
+    ventanas solapadas (ver ``asr.longform``) que se envían juntas al planificador
+    para que se decodifiquen en lote, y sus segmentos se unen por marca de tiempo.
+    ``decoding`` es un perfil de decodificación (nombre o dict resuelto).
+
+    ``on_event`` recibe el resultado parcial mientras se decodifica:
+    ``{"type": "text", "text"}`` con cada fragmento (una pasada, perfil voraz) o
+    ``{"type": "segment", "start", "end", "text"}`` con los segmentos de cada
+    ventana, en orden, en cuanto ella y las anteriores terminan.
+
+    Los errores se registran y devuelven un resultado vacío, salvo con
+    ``raise_errors`` o si el servidor de modelo configurado no está disponible.
+    """
+    empty = {"text": "", "segments": []}
     try:
-        # Si es una ruta de archivo, abrir el archivo
-        if isinstance(file_obj, str):
-            with open(file_obj, 'rb') as f:
-                audio = AudioSegment.from_file(f)
-        else:
-            audio = AudioSegment.from_file(file_obj)
-        
-        # Validar que el audio tenga duración mínima (al menos 1 segundo)
-        if len(audio) < 1000:  # menos de 1 segundo
-            return ""
-            
-        audio = audio.set_frame_rate(target_sr).set_channels(1)
-        samples = np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-        
+        samples = cargar_muestras(file_obj, target_sr)
+
         # Validar que tenemos samples suficientes
         if len(samples) < target_sr:  # menos de 1 segundo de audio
-            return ""
-        
-        # Debug info
-        print(f"[DEBUG] Audio duration: {len(audio)}ms, samples: {len(samples)}")
-            
-        inputs = processor(samples, sampling_rate=target_sr, return_tensors="pt")
-        
-        with torch.no_grad():
-            # Configurar para español y mejorar parámetros
-            pred_ids = model.generate(
-                inputs.input_features,
-                language="spanish",  # Forzar español
-                task="transcribe",   # Tarea específica
-                no_repeat_ngram_size=3,
-                repetition_penalty=1.1,
-                max_length=448,
-                num_beams=5,  # Mejorar calidad
-                early_stopping=True,
-                forced_decoder_ids=processor.get_decoder_prompt_ids(language="spanish", task="transcribe")
-            )
-        
-        result = processor.batch_decode(pred_ids, skip_special_tokens=True)[0]
-        clean_result = result.strip()
-        
-        # Debug info
-        print(f"[DEBUG] Whisper result: '{clean_result}'")
-        
-        # Filtrar resultados muy cortos o que claramente no son válidos
-        if len(clean_result) < 2 or clean_result.lower() in ["you", ".", "", " "]:
-            return ""
-            
-        return clean_result
-        
-    except Exception as e:
-        print(f"Error en transcribir_whisper: {e}")
-        import traceback
-        traceback.print_exc()
+            return empty
+
+        logger.debug("Audio duration: %dms, samples: %d", len(samples) * 1000 // target_sr, len(samples))
+
+        # VAD: omitir audio sin voz y recortar el silencio inicial y final
+        regions = vad.detect_speech(samples, target_sr)
+        if not regions:
+            logger.debug("VAD: sin voz, se omite Whisper")
+            metrics.result("whisper", "no_speech")
+            return empty
+        samples, offset = vad.trim_silence(samples, regions)
+        regions = [(start - offset, end - offset) for start, end in regions]
+        offset_s = offset / target_sr
+        duration = len(samples) / target_sr
+
+        if len(samples) <= WHISPER_MAX_SAMPLES:
+            on_text = (lambda text: on_event({"type": "text", "text": text})) if on_event else None
+            clean_result = whisper_generar(samples, model=model, decoding=decoding, on_text=on_text).strip()
+            segments = [
+                {"start": round(offset_s, 2), "end": round(offset_s + duration, 2), "text": clean_result}
+            ] if clean_result else []
+        else:
+            # Cortar preferentemente en las pausas detectadas por el VAD
+            windows = longform.split_windows(samples, cut_points=vad.pause_points(regions))
+            segments = []
+            # Más hilos que el lote máximo del planificador no decodifican más rápido
+            max_batch = getattr(settings, "ASR_SCHEDULER", {}).get("MAX_BATCH_SIZE", 8)
+            with ThreadPoolExecutor(max_workers=max(1, min(len(windows), max_batch))) as pool:
+                # Cada ventana con el contexto de la petición (trace id, caché)
+                futures = [
+                    pool.submit(
+                        contextvars.copy_context().run, whisper_segmentos, samples[window[0]:window[1]], target_sr,
+                        model=model, decoding=decoding,
+                    )
+                    for window in windows
+                ]
+                # Cada ventana solo aporta los segmentos de su región: se pueden emitir en orden
+                for window, future in zip(windows, futures):
+                    for segment in longform.merge_segments([window], [future.result()]):
+                        segment = dict(
+                            segment, start=round(segment["start"] + offset_s, 2), end=round(segment["end"] + offset_s, 2)
+                        )
+                        segments.append(segment)
+                        if on_event:
+                            on_event({"type": "segment", **segment})
+            clean_result = " ".join(segment["text"] for segment in segments).strip()
+            logger.debug("Whisper long-form: %d ventanas, %d segmentos", len(windows), len(segments))
+
+        logger.debug("Whisper result: %r", clean_result)
+
+        text = filtrar_resultado(clean_result)
+        metrics.result("whisper", "ok" if text else "filtered" if clean_result else "empty")
+        return {"text": text, "segments": segments if text else []}
+
+    except Exception as exc:
+        metrics.error("whisper")
+        if raise_errors or isinstance(exc, ModelServerUnavailable):
+            raise
+        logger.exception("Error en transcribir_whisper")
+        return empty
+
+
+def filtrar_resultado(text):
+    """Descarta resultados muy cortos o que claramente no son válidos."""
+    clean = (text or "").strip()
+    if len(clean) < 2 or clean.lower() in ["you", "."]:
         return ""
+    return clean
+
+
+# =========================
+# Registro de modelos
+# =========================
+_models = {}
+_models_lock = threading.Lock()
+_model_usage = {}
+
+
+def default_model_name():
+    return getattr(settings, "ASR_DEFAULT_MODEL", "large")
+
+
+def feature_size(name=None):
+    """Bandas mel que espera el modelo (80; 128 en large-v3), según ``ASR_MODELS[name]["N_MELS"]``."""
+    return _model_config(name or default_model_name()).get("N_MELS", 80)
+
+
+def model_for_endpoint(endpoint):
+    """Modelo configurado para un endpoint (``partial``, ``final``, ``upload``)."""
+    return getattr(settings, "ASR_ENDPOINT_MODELS", {}).get(endpoint) or default_model_name()
+
+
+def _model_config(name):
+    registry = getattr(settings, "ASR_MODELS", {})
+    if name not in registry:
+        raise KeyError(f"modelo desconocido: {name}")
+    return registry[name]
+
+
+def _tensor_bytes(value):
+    import torch
+
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def _quantize(model, quantization):
+    import torch
+
+    if quantization == "int8":
+        # Cuantización dinámica: pesos int8 en las capas lineales, activaciones en float
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if quantization == "bf16":
+        return model.to(torch.bfloat16)
+    if quantization:
+        raise ValueError(f"cuantizacion no soportada: {quantization}")
+    return model
+
+
+def get_whisper(name=None):
+    """Carga perezosa de ``(processor, model)`` del registro, una sola vez por proceso.
+
+    Los pesos se cargan con ``low_cpu_mem_usage`` (safetensors con memoria mapeada
+    si el checkpoint los trae, si no ``pytorch_model.bin``), sin materializar una
+    copia intermedia del checkpoint.
+    """
+    name = name or default_model_name()
+    with _models_lock:
+        if name not in _models:
+            from transformers import WhisperForConditionalGeneration, WhisperProcessor
+
+            config = _model_config(name)
+            processor = WhisperProcessor.from_pretrained(config["PATH"])
+            model = WhisperForConditionalGeneration.from_pretrained(
+                config["PATH"], use_safetensors=config.get("SAFETENSORS"), low_cpu_mem_usage=True
+            )
+            model = _quantize(model.eval(), config.get("QUANTIZATION"))
+            model = backends.apply(model, processor, name, config)
+            _instrument_encoder(model)
+            _models[name] = (processor, model)
+            _model_usage[name] = {
+                "memory_bytes": _tensor_bytes(list(model.state_dict().values())),
+                "calls": 0,
+                "audio_seconds": 0.0,
+                "compute_seconds": 0.0,
+            }
+        return _models[name]
+
+
+def _instrument_encoder(model):
+    """Mide cada pasada del encoder (dentro de ``generate``) en la etapa ``encoder``."""
+    encoder = model.get_encoder()
+    local = threading.local()
+
+    def before(_module, _args):
+        local.started = time.perf_counter()
+
+    def after(_module, _args, _output):
+        started = getattr(local, "started", None)
+        if started is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="encoder")
+            local.started = None
+
+    encoder.register_forward_pre_hook(before)
+    encoder.register_forward_hook(after)
+
+
+def _record_usage(name, audio_seconds, compute_seconds):
+    with _models_lock:
+        usage = _model_usage[name]
+        usage["calls"] += 1
+        usage["audio_seconds"] += audio_seconds
+        usage["compute_seconds"] += compute_seconds
+
+
+def registry_stats():
+    """Memoria y factor de tiempo real (cómputo / duración del audio) de cada variante."""
+    stats = {}
+    with _models_lock:
+        for name, config in getattr(settings, "ASR_MODELS", {}).items():
+            usage = _model_usage.get(name)
+            entry = {"path": str(config["PATH"]), "quantization": config.get("QUANTIZATION"), "loaded": usage is not None}
+            if usage is not None:
+                entry.update(
+                    backend=backends.info(name),
+                    memory_mb=round(usage["memory_bytes"] / 2**20, 1),
+                    calls=usage["calls"],
+                    audio_seconds=round(usage["audio_seconds"], 2),
+                    real_time_factor=(
+                        round(usage["compute_seconds"] / usage["audio_seconds"], 3)
+                        if usage["audio_seconds"] else None
+                    ),
+                )
+            stats[name] = entry
+    return stats
+
+
+def preload_whisper(model=None):
+    """Carga el modelo antes de un lote (con servidor de modelo no hace nada); lanza si no se puede."""
+    if _model_client() is None:
+        get_whisper(model)
+
+
+def warmup():
+    """Carga los modelos usados por los endpoints y los ejecuta con las formas habituales.
+
+    Cada modelo decodifica lotes de 1 y de ``MAX_BATCH_SIZE`` audios, con y sin
+    marcas de tiempo y con los perfiles de los endpoints, así el backend
+    (``asr.backends``) compila o reserva memoria antes de la primera petición.
+    """
+    rng = np.random.default_rng(0)
+    # Ruido de fondo: el silencio puro termina la decodificación en el primer token
+    audio = (0.01 * rng.standard_normal(5 * 16000)).astype(np.float32)
+    max_batch = getattr(settings, "ASR_SCHEDULER", {}).get("MAX_BATCH_SIZE", 8)
+    batch_sizes = sorted({1, max(1, max_batch)})
+    endpoint_models = getattr(settings, "ASR_ENDPOINT_MODELS", {})
+    names = {default_model_name(), *endpoint_models.values()}
+    for name in sorted(filter(None, names)):
+        started = time.perf_counter()
+        endpoints = [endpoint for endpoint, model in endpoint_models.items() if model == name]
+        profiles = {decoding_profiles.DEFAULT_PROFILE, *map(decoding_profiles.profile_for_endpoint, endpoints)}
+        for profile in sorted(profiles):
+            decoding = decoding_profiles.resolve(profile)
+            for size in batch_sizes:
+                for timestamps in (False, True):
+                    _ejecutar_lote_whisper([audio] * size, {"timestamps": timestamps, "model": name, "decoding": decoding})
+        backends.record_warmup(name, time.perf_counter() - started)
+        logger.info("Modelo %s calentado en %.1f s", name, time.perf_counter() - started)
+
+
+def warmup_on_start():
+    """Calienta en segundo plano al arrancar el worker web (si infiere en este proceso)."""
+    if not getattr(settings, "ASR_BACKEND", {}).get("WARMUP_ON_START", False) or _model_client() is not None:
+        return
+
+    def run():
+        try:
+            warmup()
+        except Exception:
+            logger.exception("Error calentando el modelo")
+
+    threading.Thread(target=run, name="asr-warmup", daemon=True).start()
+
+
+def _ejecutar_lote_whisper(batch, options):
+    """Runner del planificador: un solo ``model.generate`` para todo el lote.
+
+    El procesador rellena cada audio a 30 s, así que los log-mel del lote tienen
+    la misma forma y se apilan en un único tensor.
+    """
+    import torch
+
+    name = options.get("model") or default_model_name()
+    processor, model = get_whisper(name)
+    timestamps = options.get("timestamps", False)
+    started = time.perf_counter()
+    if options.get("prefix"):
+        # Parciales con prompt y prefijo forzado (asr.prefix_decode): items dict, uno por uno
+        results = prefix_decode.ejecutar_lote(
+            processor, model, name, batch, decoding_profiles.resolve(options.get("decoding")),
+            repetition_penalty=WHISPER_GENERATE_KWARGS["repetition_penalty"],
+        )
+        _record_usage(name, sum(item["num_samples"] for item in batch) / 16000, time.perf_counter() - started)
+        return results
+    if options.get("features"):
+        # Log-mel ya calculado (asr.features): items ``(features, num_samples)``
+        input_features = torch.from_numpy(np.stack([item[0] for item in batch]))
+        if input_features.shape[1] != processor.feature_extractor.feature_size:
+            raise ValueError(
+                f"{name} espera {processor.feature_extractor.feature_size} bandas mel, "
+                f"se recibieron {input_features.shape[1]} (ver N_MELS en ASR_MODELS)"
+            )
+        audio_seconds = sum(item[1] for item in batch) / 16000
+    else:
+        # En streaming los items son ``{"samples", "on_text"}``
+        audios = [item["samples"] for item in batch] if options.get("stream") else batch
+        with metrics.stage("features"):
+            input_features = processor(audios, sampling_rate=16000, return_tensors="pt").input_features
+        audio_seconds = sum(len(samples) for samples in audios) / 16000
+    profile = decoding_profiles.resolve(options.get("decoding"))
+    generate_kwargs = dict(WHISPER_GENERATE_KWARGS)
+    generate_kwargs.update(decoding_profiles.generate_kwargs(profile))
+    if timestamps:
+        generate_kwargs["return_timestamps"] = True
+    else:
+        generate_kwargs["forced_decoder_ids"] = processor.get_decoder_prompt_ids(language="spanish", task="transcribe")
+
+    draft = _draft_model(name, processor, model) if speculative.enabled(name, profile) else None
+    # Streaming de tokens: transformers solo lo admite de a un audio (y sin beam search)
+    streamers = [_TextStreamer(processor.tokenizer, item["on_text"]) for item in batch] if options.get("stream") else None
+    with torch.no_grad(), metrics.stage("generate"):
+        if draft is not None:
+            prompt_ids = set(processor.tokenizer.convert_tokens_to_ids(
+                ["<|startoftranscript|>", "<|es|>", "<|transcribe|>", "<|notimestamps|>"]
+            ))
+            pred_ids = speculative.generate(
+                model, draft, input_features.to(model.dtype), prompt_ids, streamers=streamers, **generate_kwargs
+            )
+        elif streamers is not None:
+            pred_ids = [
+                model.generate(input_features[index:index + 1].to(model.dtype), streamer=streamer, **generate_kwargs)[0]
+                for index, streamer in enumerate(streamers)
+            ]
+        else:
+            pred_ids = model.generate(input_features.to(model.dtype), **generate_kwargs)
+    _record_usage(name, audio_seconds, time.perf_counter() - started)
+
+    if not timestamps:
+        return processor.batch_decode(pred_ids, skip_special_tokens=True)
+    return [
+        processor.tokenizer.decode(ids, skip_special_tokens=True, output_offsets=True)
+        for ids in pred_ids
+    ]
+
+
+class _TextStreamer:
+    """Streamer de ``generate``: llama a ``on_text`` con cada fragmento de texto nuevo.
+
+    Se decodifica todo lo generado y se envía la diferencia, así las palabras
+    partidas en varios tokens (o bytes UTF-8 incompletos) salen enteras.
+    """
+
+    def __init__(self, tokenizer, on_text):
+        self.tokenizer = tokenizer
+        self.on_text = on_text
+        self.tokens = []
+        self.text = ""
+
+    def put(self, value):
+        self.tokens.extend(value.reshape(-1).tolist())
+        self._emit(final=False)
+
+    def end(self):
+        self._emit(final=True)
+
+    def _emit(self, final):
+        text = self.tokenizer.decode(self.tokens, skip_special_tokens=True)
+        if not final and text.endswith("\ufffd"):
+            return  # carácter incompleto: esperar al siguiente token
+        if text.startswith(self.text) and len(text) > len(self.text):
+            self.on_text(text[len(self.text):])
+            self.text = text
+
+
+_incompatible_drafts = set()
+
+
+def _draft_model(name, processor, model):
+    """Modelo borrador para ``name`` (ver ``asr.speculative``), o ``None`` si no es compatible."""
+    draft_name = speculative.draft_model_name()
+    draft_processor, draft = get_whisper(draft_name)
+    if (
+        draft_processor.feature_extractor.feature_size != processor.feature_extractor.feature_size
+        or draft.config.vocab_size != model.config.vocab_size
+    ):
+        if (name, draft_name) not in _incompatible_drafts:
+            _incompatible_drafts.add((name, draft_name))
+            logger.warning("%s no sirve de borrador para %s: distinto vocabulario o bandas mel", draft_name, name)
+        return None
+    return draft
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Planificador compartido por todas las vistas del proceso."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = getattr(settings, "ASR_SCHEDULER", {})
+            _scheduler = InferenceScheduler(
+                _ejecutar_lote_whisper,
+                max_batch_size=config.get("MAX_BATCH_SIZE", 8),
+                batch_window_ms=config.get("BATCH_WINDOW_MS", 20),
+            )
+        return _scheduler
+
+
+def configure_scheduler(max_batch_size=None, batch_window_ms=None):
+    """Ajusta el planificador de este proceso (p. ej. ``manage.py transcribe --batch-size``).
+
+    Devuelve ``False`` si la inferencia va al servidor de modelo, cuyo lote
+    se configura con su propio ``ASR_SCHEDULER``.
+    """
+    if _model_client() is not None:
+        return False
+    get_scheduler().configure(max_batch_size=max_batch_size, batch_window_ms=batch_window_ms)
+    return True
+
+
+def _model_client():
+    """Cliente del servidor de modelo, o ``None`` si se infiere en este proceso."""
+    from .model_server import get_client
+
+    return get_client()
+
+
+def whisper_generar(samples, timestamps=False, model=None, decoding=None, features=None, on_text=None):
+    """Encola muestras 16 kHz (hasta 30 s) en el planificador y espera el resultado.
+
+    Si hay un servidor de modelo configurado (``ASR_MODEL_SERVER``) la petición se
+    envía a ese proceso; si no, se usa el planificador local. El resultado pasa
+    por la caché de transcripciones (mismo audio + misma configuración).
+    Devuelve el texto, o ``{"text", "offsets"}`` cuando ``timestamps`` es verdadero.
+    Solo se agrupan en un lote peticiones con el mismo perfil de decodificación.
+    ``features`` es el log-mel ya calculado de ``samples`` (ver ``asr.features``).
+    ``on_text`` recibe el texto a medida que se genera si el perfil es voraz (con
+    beam search o fallback de temperatura no hay streaming; si el resultado sale
+    de la caché tampoco).
+    """
+    options = {
+        "timestamps": timestamps,
+        "model": model or default_model_name(),
+        "decoding": decoding_profiles.resolve(decoding),
+    }
+    item = samples
+    if features is not None:
+        options["features"] = True
+        item = (features, len(samples))
+    elif on_text is not None and decoding_profiles.is_greedy(options["decoding"]):
+        options["stream"] = True
+
+    def generate():
+        client = _model_client()
+        if options.get("stream"):
+            if client is not None:
+                return client.generate_stream(samples, options, on_text)
+            return get_scheduler().submit({"samples": samples, "on_text": on_text}, options)
+        if client is not None:
+            return client.generate(item, options)
+        return get_scheduler().submit(item, options)
+
+    # El resultado no depende de quién calculó el log-mel ni de si se transmite: misma clave de caché
+    params = {key: value for key, value in options.items() if key not in ("features", "stream")}
+    return cached(samples, "whisper", generate, **params, **WHISPER_GENERATE_KWARGS)
+
+
+def whisper_prefijo(samples, prompt="", prefix=(), model=None, decoding=None, features=None):
+    """Decodifica una ventana de parcial reutilizando lo ya confirmado (ver ``asr.prefix_decode``).
+
+    ``prompt`` es el texto confirmado antes de la ventana y ``prefix`` los tokens
+    (con marcas de tiempo) de los segmentos confirmados dentro de ella; solo se
+    generan los tokens siguientes. Devuelve ``{"segments", "steps", "prefix_tokens"}``
+    con los segmentos nuevos en segundos desde el inicio de la ventana.
+    """
+    options = {
+        "prefix": True,
+        "model": model or default_model_name(),
+        "decoding": decoding_profiles.resolve(decoding),
+    }
+    item = {
+        "samples": samples if features is None else None,
+        "features": features,
+        "num_samples": len(samples),
+        "prompt": prompt,
+        "prefix": list(prefix),
+    }
+
+    def generate():
+        client = _model_client()
+        if client is not None:
+            return client.generate(item, options)
+        return get_scheduler().submit(item, options)
+
+    return cached(samples, "whisper_prefix", generate, prompt=prompt, prefix=tuple(prefix), **options)
+
+
+def local_inference_stats():
+    return {"scheduler": get_scheduler().stats(), "models": registry_stats(), "speculative": speculative.stats()}
+
+
+def cache_stats():
+    """Contadores de la caché de transcripciones de este proceso."""
+    return get_cache().stats()
+
+
+def decoder_stats():
+    """Contadores de los decodificadores por sesión de este proceso."""
+    return stream_decoder.get_pool().stats()
+
+
+def feature_stats():
+    """Frames log-mel calculados y reutilizados por los extractores de sesión."""
+    return features.get_pool().stats()
+
+
+def inference_stats():
+    """Estadísticas del planificador y de los modelos que atienden a este proceso (local o remoto)."""
+    client = _model_client()
+    if client is not None:
+        return client.stats()
+    return local_inference_stats()
+
+
+def _model_queue_depth():
+    return inference_stats().get("scheduler", {}).get("queue_depth", 0)
+
+
+metrics.register_gauge(
+    "asr_model_queue_depth", "Peticiones esperando lote en el planificador de inferencia.", _model_queue_depth
+)
+
+
+def whisper_segmentos(samples, target_sr=16000, model=None, decoding=None, features=None):
+    """Transcribe muestras (hasta 30 s) y devuelve segmentos ``{start, end, text}`` en segundos."""
+    decoded = whisper_generar(samples, timestamps=True, model=model, decoding=decoding, features=features)
+    segments = [
+        {"start": float(item["timestamp"][0]), "end": float(item["timestamp"][1]), "text": item["text"].strip()}
+        for item in decoded["offsets"]
+        if item["text"].strip()
+    ]
+    if not segments and decoded["text"].strip():
+        # Sin marcas de tiempo: un único segmento que cubre toda la ventana
+        segments = [{"start": 0.0, "end": len(samples) / target_sr, "text": decoded["text"].strip()}]
+    return segments
 
 
 def session_dir(session_id):
-    directory = os.path.join(BASE_DIR, session_id)
+    directory = sessions.session_path(session_id)
     os.makedirs(directory, exist_ok=True)
     return directory
 
@@ -104,12 +632,45 @@ def combined_wav_path(session_id):
     return os.path.join(session_dir(session_id), "combined.wav")
 
 
+def session_duration_ms(session_id):
+    """Duración del audio acumulado, leída del almacen sin decodificarlo."""
+    return audio_store.duration_ms(combined_wav_path(session_id))
+
+
+def session_num_samples(session_id):
+    return audio_store.num_samples(combined_wav_path(session_id))
+
+
+def session_samples(session_id, start=0, stop=None):
+    """Muestras float32 de la ventana ``[start:stop]`` del audio de la sesión."""
+    return audio_store.read_float(combined_wav_path(session_id), max(0, start), stop)
+
+
+def _last_partial_path(session_id):
+    return os.path.join(session_dir(session_id), "last_partial.json")
+
+
+def cargar_parcial(session_id):
+    """Último resultado parcial devuelto para la sesión."""
+    try:
+        with open(_last_partial_path(session_id), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {"whisper": "", "speech": ""}
+
+
+def guardar_parcial(session_id, partial):
+    with open(_last_partial_path(session_id), "w", encoding="utf-8") as handle:
+        json.dump(partial, handle, ensure_ascii=False)
+
+
 def save_chunk_file(session_id, part_index, file_obj):
     """Guarda el chunk recibido y acumula los bytes en combined.webm + crea WAV para Whisper."""
-    if hasattr(file_obj, "chunks"):
-        data = b"".join(file_obj.chunks())
-    else:
-        data = file_obj.read()
+    with metrics.stage("upload_read"):
+        if hasattr(file_obj, "chunks"):
+            data = b"".join(file_obj.chunks())
+        else:
+            data = file_obj.read()
     if hasattr(file_obj, "seek"):
         try:
             file_obj.seek(0)
@@ -119,34 +680,31 @@ def save_chunk_file(session_id, part_index, file_obj):
         raise ValueError("chunk vacio")
 
     directory = session_dir(session_id)
+    # Cuotas por sesión y global (lanza sessions.QuotaExceeded)
+    sessions.reserve(session_id, len(data))
     
-    # Guardar chunk individual
-    ext = ".webm"
-    filename = f"part_{int(part_index):04d}{ext}"
-    chunk_path = os.path.join(directory, filename)
-    with open(chunk_path, "wb") as handle:
-        handle.write(data)
-
-    # Mantener el archivo WebM combinado para SpeechRecognition (método original)
+    # Mantener el archivo WebM combinado (historial del stream para el decodificador)
     combined_webm_path = combined_audio_path(session_id)
     mode = "ab" if os.path.exists(combined_webm_path) else "wb"
-    with open(combined_webm_path, mode) as handle:
+    with metrics.stage("disk_write"), open(combined_webm_path, mode) as handle:
         handle.write(data)
 
-    # ADICIONALMENTE: Crear/actualizar archivo WAV para Whisper
+    # Guardar chunk individual solo si se pide (es una copia redundante de combined.webm)
+    chunk_path = combined_webm_path
+    if sessions.keep_parts():
+        ext = ".webm"
+        filename = f"part_{part_index:04d}{ext}"
+        chunk_path = os.path.join(directory, filename)
+        with metrics.stage("disk_write"), open(chunk_path, "wb") as handle:
+            handle.write(data)
+
+    # ADICIONALMENTE: Anexar el PCM del chunk al WAV de la sesion para Whisper,
+    # con el decodificador persistente de la sesión (solo se decodifican los bytes nuevos)
     try:
-        new_segment = AudioSegment.from_file(io.BytesIO(data))
-        wav_path = combined_wav_path(session_id)
-        
-        if os.path.exists(wav_path):
-            existing_audio = AudioSegment.from_wav(wav_path)
-            combined_audio = existing_audio + new_segment
-        else:
-            combined_audio = new_segment
-        
-        combined_audio.export(wav_path, format="wav")
+        stream_decoder.get_pool().feed(session_id, data, combined_wav_path(session_id), combined_webm_path)
     except Exception as e:
-        print(f"Error creando WAV combinado: {e}")
+        logger.warning("Error creando WAV combinado: %s", e)
+        metrics.error("wav_append")
 
     return chunk_path, combined_webm_path  # Devolver WebM para SpeechRecognition
 
@@ -157,12 +715,10 @@ def concat_session_to_wav(session_id, out_name=None, target_sr=16000):
     
     # Primero intentar usar el archivo WAV combinado existente
     wav_path = combined_wav_path(session_id)
-    if os.path.exists(wav_path) and os.path.getsize(wav_path) > 0:
+    if audio_store.num_samples(wav_path) > 0:
         if out_name and out_name != wav_path:
-            # Si se solicita un nombre específico, copiar
-            audio = AudioSegment.from_wav(wav_path)
-            audio = audio.set_frame_rate(target_sr).set_channels(1)
-            audio.export(out_name, format="wav")
+            # Si se solicita un nombre específico, copiar (ya está en 16 kHz mono)
+            shutil.copyfile(wav_path, out_name)
             return out_name
         return wav_path
     
@@ -170,9 +726,9 @@ def concat_session_to_wav(session_id, out_name=None, target_sr=16000):
     combined_webm = combined_audio_path(session_id)
     if os.path.exists(combined_webm) and os.path.getsize(combined_webm) > 0:
         try:
-            source = AudioSegment.from_file(combined_webm)
+            source = decode_pcm16(combined_webm, target_sr)
         except Exception as e:
-            print(f"Error leyendo combined.webm: {e}")
+            logger.warning("Error leyendo combined.webm: %s", e)
             source = None
     else:
         source = None
@@ -187,51 +743,64 @@ def concat_session_to_wav(session_id, out_name=None, target_sr=16000):
         if not files:
             raise FileNotFoundError("No hay partes para concatenar")
         
-        source = None
+        segments = []
         for path in files:
             try:
-                segment = AudioSegment.from_file(path)
-                source = segment if source is None else source + segment
+                segments.append(decode_pcm16(path, target_sr))
             except Exception as e:
-                print(f"Error leyendo chunk {path}: {e}")
+                logger.warning("Error leyendo chunk %s: %s", path, e)
                 continue
         
-        if source is None:
+        if not segments:
             raise FileNotFoundError("No se pudo crear audio desde los chunks")
+        source = np.concatenate(segments)
 
-    # Normalizar y exportar
-    source = source.set_frame_rate(target_sr).set_channels(1)
+    # Normalizar y exportar en el formato del almacen
     out_path = out_name or wav_path
-    source.export(out_path, format="wav")
+    audio_store.write_samples(out_path, source)
     return out_path
 
 
-def transcribir_google(file_obj, language="es-ES"):
-    """Transcribe audio usando la API de Google via SpeechRecognition."""
-    cleanup = False
-    wav_path = None
+def transcribir_google(file_obj, language="es-ES", raise_errors=False, recognizer=None):
+    """Transcribe audio usando la API de Google via SpeechRecognition.
+
+    Los errores devuelven ``""``; con ``raise_errors`` se propagan. ``recognizer``
+    reemplaza al ``sr.Recognizer`` de cada petición (p. ej. un stub sin red).
+    """
     try:
-        if isinstance(file_obj, str) and file_obj.lower().endswith(".wav"):
-            wav_path = file_obj
-        else:
-            wav_path = convert_to_wav(file_obj)
-            cleanup = True
-        
-        # Validar que el archivo existe y tiene contenido
-        if not os.path.exists(wav_path) or os.path.getsize(wav_path) == 0:
+        samples = cargar_muestras(file_obj)
+
+        # VAD: sin voz no se hace la petición de red
+        regions = vad.detect_speech(samples)
+        if not regions:
+            metrics.result("google", "no_speech")
             return ""
-            
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(wav_path) as source:
-            audio_data = recognizer.record(source)
-        return recognizer.recognize_google(audio_data, language=language)
-    except sr.UnknownValueError:
-        return ""
-    except sr.RequestError:
+        samples, _ = vad.trim_silence(samples, regions)
+
+        # El PCM se entrega directamente, sin escribir un WAV temporal
+        pcm = audio_store.to_pcm16(samples)
+
+        def recognize():
+            engine = recognizer or sr.Recognizer()
+            try:
+                with metrics.stage("google_request"):
+                    return engine.recognize_google(sr.AudioData(pcm.tobytes(), 16000, 2), language=language)
+            except sr.UnknownValueError:
+                return ""  # sin voz reconocible: también se cachea
+
+        # Los errores de red (RequestError) no se cachean
+        text = cached(pcm, "google", recognize, language=language)
+        metrics.result("google", "ok" if text else "empty")
+        return text
+    except sr.RequestError as e:
+        metrics.error("google")
+        if raise_errors:
+            raise
+        logger.warning("Google no respondió: %s", e)
         return ""
-    except Exception as e:
-        print(f"Error en transcribir_google: {e}")
+    except Exception:
+        metrics.error("google")
+        if raise_errors:
+            raise
+        logger.exception("Error en transcribir_google")
         return ""
-    finally:
-        if cleanup and wav_path and os.path.exists(wav_path):
-            os.remove(wav_path)
\ No newline at end of file
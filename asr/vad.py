@@ -0,0 +1,118 @@
+"""Detección de actividad de voz (VAD) vectorizada con NumPy.
+
+El detector por defecto usa energía por frame con un umbral adaptativo al piso
+de ruido, más la tasa de cruces por cero para aceptar fricativas de baja
+energía. Se puede reemplazar por otro (p. ej. un modelo pequeño) con
+``ASR_VAD["BACKEND"]``: cualquier callable ``(samples, sample_rate) -> [(start, end), ...]``.
+"""
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+# Umbral absoluto (dBFS) por debajo del cual nunca se considera voz
+MIN_ENERGY_DB = -50.0
+# Margen sobre el piso de ruido (percentil 10 de la energía) para marcar voz
+NOISE_MARGIN_DB = 10.0
+# Tope del piso de ruido estimado: si todo el audio es voz, el percentil 10 no es ruido
+MAX_NOISE_FLOOR_DB = -45.0
+# Frames con muchos cruces por cero y energía moderada (fricativas como "s", "f")
+ZCR_THRESHOLD = 0.25
+ZCR_MARGIN_DB = 5.0
+# Pausas más cortas que HANGOVER_MS no separan regiones; regiones más cortas que MIN_SPEECH_MS se descartan
+HANGOVER_MS = 300
+MIN_SPEECH_MS = 200
+# Margen que se agrega alrededor de cada región detectada
+PAD_MS = 150
+
+
+def _frames(samples, frame):
+    count = len(samples) // frame
+    return np.asarray(samples[:count * frame], dtype=np.float32).reshape(count, frame)
+
+
+def frame_features(samples, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+    """Energía (dBFS) y tasa de cruces por cero de cada frame, sin bucles de Python."""
+    frames = _frames(samples, int(sample_rate * frame_ms / 1000))
+    if not len(frames):
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    energy_db = 10.0 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+    return energy_db, zcr
+
+
+def _mask_to_regions(mask):
+    """Pares ``(inicio, fin)`` (en frames) de los tramos verdaderos de ``mask``."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def energy_vad(samples, sample_rate=SAMPLE_RATE):
+    """Regiones de voz ``[(start, end), ...]`` en muestras según energía y cruces por cero."""
+    frame = int(sample_rate * FRAME_MS / 1000)
+    energy_db, zcr = frame_features(samples, sample_rate)
+    if not len(energy_db):
+        return []
+
+    noise_floor = min(float(np.percentile(energy_db, 10)), MAX_NOISE_FLOOR_DB)
+    threshold = max(MIN_ENERGY_DB, noise_floor + NOISE_MARGIN_DB)
+    speech = (energy_db > threshold) | (
+        (zcr > ZCR_THRESHOLD) & (energy_db > max(MIN_ENERGY_DB, noise_floor + ZCR_MARGIN_DB))
+    )
+
+    hangover = max(1, HANGOVER_MS // FRAME_MS)
+    min_frames = max(1, MIN_SPEECH_MS // FRAME_MS)
+    pad = int(sample_rate * PAD_MS / 1000)
+
+    # Unir tramos separados por pausas cortas y descartar los demasiado breves
+    merged = []
+    for start, end in _mask_to_regions(speech):
+        if merged and start - merged[-1][1] < hangover:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    regions = []
+    for start, end in merged:
+        if end - start < min_frames:
+            continue
+        start = max(0, start * frame - pad)
+        end = min(len(samples), end * frame + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def _config():
+    return getattr(settings, "ASR_VAD", {})
+
+
+def detect_speech(samples, sample_rate=SAMPLE_RATE):
+    """Regiones de voz con el detector configurado; todo el audio si el VAD está desactivado."""
+    config = _config()
+    if not config.get("ENABLED", True):
+        return [(0, len(samples))] if len(samples) else []
+    backend = config.get("BACKEND")
+    detector = import_string(backend) if backend else energy_vad
+    return [(int(start), int(end)) for start, end in detector(samples, sample_rate)]
+
+
+def has_speech(samples, sample_rate=SAMPLE_RATE):
+    return bool(detect_speech(samples, sample_rate))
+
+
+def trim_silence(samples, regions):
+    """Recorta el silencio inicial y final. Devuelve ``(muestras, desplazamiento)``."""
+    if not regions:
+        return samples[:0], 0
+    start, end = regions[0][0], regions[-1][1]
+    return samples[start:end], start
+
+
+def pause_points(regions):
+    """Puntos medios de las pausas entre regiones de voz (buenos lugares para cortar)."""
+    return [(previous[1] + current[0]) // 2 for previous, current in zip(regions[:-1], regions[1:])]
@@ -1,24 +1,124 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-import os
-
+from django.urls import reverse
+import asyncio
+import json
+import math
+import time
+
+from . import admission, decoding as decoding_profiles, metrics
+from .fanout import run_blocking, run_parallel_async, run_request, short_error as _short_error
+from .jobs import get_queue
+from .model_server import ModelServerUnavailable
+from .realtime import finalizar_sesion, procesar_chunk
+from .sessions import is_valid_session_id
 from .utils import (
-    concat_session_to_wav,
-    save_chunk_file,
+    cache_stats,
+    cargar_muestras,
+    decoder_stats,
+    feature_stats,
     transcribir_google,
     transcribir_whisper,
-    combined_wav_path,
+    transcribir_whisper_detallado,
+    inference_stats,
+    model_for_endpoint,
 )
 
+# Tope del long-poll de GET /asr/jobs/<id>/?wait=N y pausa entre consultas
+JOB_MAX_WAIT = 30.0
+JOB_POLL_INTERVAL = 0.25
+
+
+def _decoding(request, endpoint):
+    """Perfil de decodificación del endpoint con los ajustes de la petición (``profile``, ``num_beams``...).
+
+    Lanza ``ValueError`` si el perfil o algún valor no están permitidos.
+    """
+    query = getattr(request, "query_params", request.GET)
+    body = getattr(request, "data", request.POST)
+    keys = ("profile", *decoding_profiles.OVERRIDES)
+    params = {key: query.get(key) or body.get(key) for key in keys}
+    return decoding_profiles.from_request(params, endpoint)
+
+
+async def _comparar_motores(audio_file, decoding=None):
+    """Decodifica el audio una sola vez y ejecuta Whisper y Google en paralelo."""
+    samples = await run_blocking(cargar_muestras, audio_file)
+    return await run_parallel_async({
+        "whisper": lambda: transcribir_whisper(samples, model=model_for_endpoint("upload"), decoding=decoding),
+        "speech": lambda: transcribir_google(samples),
+    })
+
+
+def _wants_async(request):
+    """``async=1`` (query o cuerpo) encola el trabajo y responde 202 con su id."""
+    value = request.query_params.get("async") or request.data.get("async") or ""
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _wants_stream(request):
+    """``stream=1`` (query o cuerpo) responde con server-sent events mientras se decodifica."""
+    value = request.query_params.get("stream") or request.data.get("stream") or ""
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _stream_response(func):
+    """Ejecuta ``func(on_event)`` en el pool de peticiones y transmite sus eventos como SSE.
+
+    Cada evento ``{"type", ...}`` sale como ``event: <type>``; al terminar se envía
+    ``result`` con lo que devolvió ``func`` (o ``error`` si lanzó una excepción).
+    El iterador es async: con ASGI la respuesta se envía a medida que se genera.
+    """
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def on_event(event):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        def run():
+            try:
+                on_event({"type": "result", **func(on_event)})
+            except Exception as exc:
+                metrics.error("stream")
+                on_event({"type": "error", "error": _short_error(exc)})
 
-def _short_error(exc):
-    message = str(exc).strip() or exc.__class__.__name__
-    return message.splitlines()[0][:200]
+        # run() no lanza: si el cliente se desconecta la decodificación termina sola
+        asyncio.ensure_future(run_request(run))
+        while True:
+            event = await queue.get()
+            kind = event.pop("type")
+            yield _sse(kind, event)
+            if kind in ("result", "error"):
+                break
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # sin buffer en nginx
+    return response
+
+
+def _job_accepted(request, job_id):
+    status_url = request.build_absolute_uri(reverse("api-job", args=[job_id]))
+    return Response({"job_id": job_id, "status": "queued", "status_url": status_url}, status=status.HTTP_202_ACCEPTED)
+
+
+def _transcribir_subida(audio, decoding, on_event=None):
+    result = transcribir_whisper_detallado(
+        audio, model=model_for_endpoint("upload"), decoding=decoding, on_event=on_event
+    )
+    return {"model": "Whisper fine-tuned", "text": result["text"], "segments": result["segments"]}
 
 
 class ASRWhisperView(APIView):
@@ -26,8 +126,28 @@ class ASRWhisperView(APIView):
 
     def post(self, request, *args, **kwargs):
         audio_file = request.FILES["audio"]
-        whisper_text = transcribir_whisper(audio_file)
-        return Response({"model": "Whisper fine-tuned", "text": whisper_text})
+        wants_async, wants_stream = _wants_async(request), _wants_stream(request)
+        try:
+            # Con stream=1 el perfil por defecto es el voraz de "stream" (beam search no emite texto parcial)
+            decoding = _decoding(request, "stream" if wants_stream and not wants_async else "upload")
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if not (wants_async or wants_stream):
+            try:
+                return Response(_transcribir_subida(audio_file, decoding))
+            except ModelServerUnavailable as exc:
+                return Response({"error": str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # El archivo subido no sobrevive a la petición: se decodifica antes de encolar o transmitir
+        try:
+            samples = cargar_muestras(audio_file)
+        except Exception as exc:
+            return Response(
+                {"error": f"Error decodificando audio: {_short_error(exc)}"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if wants_async:
+            return _job_accepted(request, get_queue().submit("batch", _transcribir_subida, samples, decoding))
+        return _stream_response(lambda on_event: _transcribir_subida(samples, decoding, on_event))
 
 
 class ASRSpeechRecognitionView(APIView):
@@ -39,33 +159,65 @@ class ASRSpeechRecognitionView(APIView):
         return Response({"model": "SpeechRecognition (Google API)", "text": sr_text})
 
 
-class CompareASRView(APIView):
+@method_decorator(csrf_exempt, name="dispatch")
+class CompareASRView(View):
     """Endpoint JSON que devuelve las transcripciones de Whisper y SpeechRecognition."""
 
-    def post(self, request, *args, **kwargs):
-        audio_file = request.FILES["audio"]
-        whisper_text = transcribir_whisper(audio_file)
+    async def post(self, request, *args, **kwargs):
+        audio_file = request.FILES.get("audio")
+        if not audio_file:
+            return JsonResponse({"error": "missing audio"}, status=400)
+        try:
+            decoding = _decoding(request, "upload")
+        except ValueError as exc:
+            return JsonResponse({"error": str(exc)}, status=400)
+        try:
+            results, errors = await _comparar_motores(audio_file, decoding)
+        except Exception as exc:
+            return JsonResponse({"error": f"Error decodificando audio: {_short_error(exc)}"}, status=400)
 
-        audio_file.seek(0)
-        sr_text = transcribir_google(audio_file)
+        payload = {"whisper": results.get("whisper", ""), "speechrecognition": results.get("speech", "")}
+        if errors:
+            payload["errors"] = errors
+        return JsonResponse(payload)
+
+
+class ASRStatsView(APIView):
+    """Endpoint JSON con estadísticas de inferencia, caché, decodificadores y cola de trabajos."""
+
+    def get(self, request, *args, **kwargs):
+        stats = inference_stats()
+        stats["cache"] = cache_stats()
+        stats["decoders"] = decoder_stats()
+        stats["features"] = feature_stats()
+        stats["jobs"] = get_queue().stats()
+        stats["admission"] = admission.get_controller().stats()
+        return Response(stats)
 
-        return Response({"whisper": whisper_text, "speechrecognition": sr_text})
+
+class MetricsView(View):
+    """Métricas del proceso en formato de texto de Prometheus."""
+
+    def get(self, request, *args, **kwargs):
+        if not metrics.enabled():
+            raise Http404("métricas desactivadas")
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 class UploadView(View):
     """Renderiza un formulario para subir audio y ver resultados de ambos modelos."""
 
-    def get(self, request):
+    async def get(self, request):
         return render(request, "asr/upload.html")
 
-    def post(self, request):
+    async def post(self, request):
         audio_file = request.FILES["audio"]
-        whisper_text = transcribir_whisper(audio_file)
-
-        audio_file.seek(0)
-        sr_text = transcribir_google(audio_file)
+        try:
+            results, errors = await _comparar_motores(audio_file)
+        except Exception as exc:
+            results, errors = {}, {"audio": f"Error decodificando audio: {_short_error(exc)}"}
 
-        results = {"whisper": whisper_text, "speech": sr_text}
+        results = {"whisper": results.get("whisper", ""), "speech": results.get("speech", ""), "errors": errors}
         return render(request, "asr/upload.html", {"results": results})
 
 
@@ -93,65 +245,17 @@ class RealtimeChunkView(APIView):
                 {"error": "missing session_id or audio"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-        try:
-            chunk_path, combined_webm_path = save_chunk_file(session_id, part_index, audio_file)
-        except Exception as exc:
-            return Response(
-                {"error": f"Error guardando chunk: {_short_error(exc)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        partial = {"whisper": "", "speech": ""}
-        errors = {}
-
-        # Transcribir con Google Speech Recognition usando el WebM combinado
+        if not is_valid_session_id(session_id):
+            return Response({"error": "invalid session_id"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            if os.path.exists(combined_webm_path) and os.path.getsize(combined_webm_path) > 0:
-                partial["speech"] = transcribir_google(combined_webm_path)
-        except Exception as exc:
-            errors["speech"] = _short_error(exc)
-
-        # Transcribir con Whisper usando el WAV combinado (SOLO después del chunk 4 para tener audio suficiente)
-        part_num = int(part_index)
-        if part_num >= 4:  # Esperar al menos 4 chunks (6+ segundos de audio)
-            try:
-                wav_path = combined_wav_path(session_id)
-                if os.path.exists(wav_path):
-                    file_size = os.path.getsize(wav_path)
-                    
-                    # Verificar duración mínima del archivo
-                    try:
-                        from pydub import AudioSegment
-                        audio_check = AudioSegment.from_wav(wav_path)
-                        duration_ms = len(audio_check)
-                        print(f"[DEBUG] Whisper chunk {part_num}: {file_size} bytes, {duration_ms}ms")
-                        
-                        # Solo procesar si tenemos al menos 3 segundos
-                        if duration_ms >= 3000:
-                            whisper_result = transcribir_whisper(wav_path)
-                            if whisper_result:
-                                partial["whisper"] = whisper_result
-                                print(f"[DEBUG] Whisper chunk result: '{whisper_result}'")
-                            else:
-                                print("[DEBUG] Whisper devolvió resultado vacío")
-                        else:
-                            print(f"[DEBUG] Audio muy corto para Whisper: {duration_ms}ms")
-                            
-                    except Exception as e:
-                        print(f"[DEBUG] Error verificando duración: {e}")
-                        
-                else:
-                    print(f"[DEBUG] Archivo WAV no existe: {wav_path}")
-            except Exception as exc:
-                print(f"[DEBUG] Error en Whisper chunk: {exc}")
-                errors["whisper"] = _short_error(exc)
-
-        payload = {"ok": True, "saved": chunk_path, "partial": partial}
-        if errors:
-            payload["errors"] = errors
+            part_index = int(part_index)
+        except (TypeError, ValueError):
+            part_index = -1
+        if part_index < 0:
+            return Response({"error": "invalid part_index"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(payload)
+        payload, status_code = procesar_chunk(session_id, part_index, audio_file)
+        return Response(payload, status=status_code)
 
 
 class RealtimeFinalizeView(APIView):
@@ -167,53 +271,43 @@ class RealtimeFinalizeView(APIView):
             return Response(
                 {"error": "missing session_id"}, status=status.HTTP_400_BAD_REQUEST
             )
-
-        # Crear/obtener archivo WAV final
+        if not is_valid_session_id(session_id):
+            return Response({"error": "invalid session_id"}, status=status.HTTP_400_BAD_REQUEST)
+        wants_async, wants_stream = _wants_async(request), _wants_stream(request)
         try:
-            wav_path = concat_session_to_wav(session_id)
-        except Exception as exc:
-            return Response(
-                {"error": f"Error creando archivo final: {_short_error(exc)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            decoding = _decoding(request, "stream" if wants_stream and not wants_async else "final")
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if wants_async:
+            job_id = get_queue().submit(
+                "final", finalizar_sesion, session_id, decoding, with_status=True, session_id=session_id
             )
+            return _job_accepted(request, job_id)
+        if wants_stream:
+            return _stream_response(lambda on_event: finalizar_sesion(session_id, decoding, on_event)[0])
 
-        final = {"whisper": "", "speech": ""}
-        errors = {}
+        payload, status_code = finalizar_sesion(session_id, decoding)
+        return Response(payload, status=status_code)
 
-        # Transcribir con Whisper
-        try:
-            if os.path.exists(wav_path) and os.path.getsize(wav_path) > 0:
-                file_size = os.path.getsize(wav_path)
-                print(f"[DEBUG] Procesando Whisper final, archivo: {file_size} bytes")
-                
-                whisper_result = transcribir_whisper(wav_path)
-                if not whisper_result:
-                    print("[DEBUG] Resultado Whisper final vacío, intentando fallback...")
-                    from .utils import transcribir_whisper_fallback
-                    whisper_result = transcribir_whisper_fallback(wav_path)
-                
-                final["whisper"] = whisper_result
-                print(f"[DEBUG] Whisper final result: '{whisper_result}'")
-            else:
-                errors["whisper"] = "Archivo de audio vacío o no encontrado"
-        except Exception as exc:
-            print(f"[DEBUG] Error en Whisper final: {exc}")
-            errors["whisper"] = _short_error(exc)
 
-        # Transcribir con Google Speech Recognition
-        try:
-            if os.path.exists(wav_path) and os.path.getsize(wav_path) > 0:
-                final["speech"] = transcribir_google(wav_path)
-            else:
-                errors["speech"] = "Archivo de audio vacío o no encontrado"
-        except Exception as exc:
-            errors["speech"] = _short_error(exc)
+class JobStatusView(View):
+    """Estado y resultado de un trabajo asíncrono; ``?wait=N`` espera hasta N s a que termine."""
 
-        payload = {"session_id": session_id, "final": final}
-        if errors:
-            payload["ok"] = False
-            payload["errors"] = errors
-        else:
-            payload["ok"] = True
-
-        return Response(payload)
\ No newline at end of file
+    async def get(self, request, job_id, *args, **kwargs):
+        try:
+            wait = float(request.GET.get("wait", 0))
+        except ValueError:
+            wait = math.nan
+        if not math.isfinite(wait):
+            return JsonResponse({"error": "invalid wait"}, status=400)
+        wait = min(max(wait, 0.0), JOB_MAX_WAIT)
+        queue = get_queue()
+        deadline = time.monotonic() + wait
+        while True:
+            job = await run_blocking(queue.get, job_id)
+            if job is None:
+                return JsonResponse({"error": "job not found"}, status=404)
+            if job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+                return JsonResponse(job)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
@@ -0,0 +1,86 @@
+"""Endpoint WebSocket (ASGI) para sesiones en tiempo real.
+
+Una conexión dura toda la sesión: el cliente envía los chunks de audio como
+frames binarios y recibe los parciales por el mismo socket. Para terminar envía
+``{"type": "finalize"}`` y recibe ``{"type": "final", ...}`` antes del cierre.
+Evita el costo de una petición HTTP multipart por chunk.
+"""
+import io
+import json
+import uuid
+from urllib.parse import parse_qs
+
+from .fanout import run_request, short_error
+from .jobs import get_queue
+from .realtime import finalizar_sesion, procesar_chunk
+from .sessions import is_valid_session_id
+
+REALTIME_PATH = "/asr/ws/realtime/"
+
+
+async def _send_json(send, payload):
+    await send({"type": "websocket.send", "text": json.dumps(payload, ensure_ascii=False)})
+
+
+async def realtime_socket(scope, receive, send):
+    """Recibe chunks binarios y responde con parciales; ``finalize`` cierra la sesión."""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    session_id = (query.get("session_id") or [""])[0] or uuid.uuid4().hex
+    part_index = 0
+
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if not is_valid_session_id(session_id):
+        await send({"type": "websocket.close", "code": 4400})
+        return
+    await send({"type": "websocket.accept"})
+    await _send_json(send, {"type": "ready", "session_id": session_id})
+
+    while True:
+        message = await receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+        if message.get("bytes"):
+            # Los chunks se procesan en orden: el siguiente frame espera al anterior. Como
+            # en HTTP, el primero es el 0 (mismos archivos y mismo arranque de Whisper)
+            try:
+                payload, status_code = await run_request(
+                    procesar_chunk, session_id, part_index, io.BytesIO(message["bytes"])
+                )
+            except Exception as exc:
+                payload, status_code = {"error": short_error(exc)}, 500
+            await _send_json(send, {"type": "partial", "part_index": part_index, "status": status_code, **payload})
+            part_index += 1
+            continue
+
+        try:
+            command = json.loads(message.get("text") or "{}")
+        except ValueError:
+            command = {}
+        if command.get("type") == "finalize":
+            try:
+                # En la cola de trabajos con prioridad de resultado final
+                payload, status_code = await run_request(get_queue().run, "final", finalizar_sesion, session_id)
+            except Exception as exc:
+                payload, status_code = {"error": short_error(exc)}, 500
+            await _send_json(send, {"type": "final", "status": status_code, **payload})
+            await send({"type": "websocket.close", "code": 1000})
+            return
+        await _send_json(send, {"type": "error", "error": "mensaje no soportado"})
+
+
+WEBSOCKET_ROUTES = {
+    REALTIME_PATH: realtime_socket,
+}
+
+
+async def websocket_application(scope, receive, send):
+    """Despacha las conexiones WebSocket según la ruta; las desconocidas se rechazan."""
+    handler = WEBSOCKET_ROUTES.get(scope["path"])
+    if handler is None:
+        await receive()
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    await handler(scope, receive, send)
@@ -13,4 +13,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importar después de configurar Django (los módulos de asr leen settings)
+from asr.utils import warmup_on_start  # noqa: E402
+from asr.websocket import websocket_application  # noqa: E402
+
+# Calentar el modelo al arrancar el worker (ASR_BACKEND["WARMUP_ON_START"])
+warmup_on_start()
+
+
+async def application(scope, receive, send):
+    """HTTP va a Django; las conexiones WebSocket al router de ``asr.websocket``."""
+    if scope["type"] == "websocket":
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -36,6 +36,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "asr.middleware.TraceMiddleware",  # trace id por petición y duración en /asr/metrics/
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -100,3 +101,218 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# =========================
+# ASR
+# =========================
+# Micro-batching del modelo Whisper: se esperan hasta BATCH_WINDOW_MS para
+# juntar peticiones concurrentes en un solo lote de hasta MAX_BATCH_SIZE.
+ASR_SCHEDULER = {
+    "MAX_BATCH_SIZE": int(os.environ.get("ASR_MAX_BATCH_SIZE", "8")),
+    "BATCH_WINDOW_MS": float(os.environ.get("ASR_BATCH_WINDOW_MS", "20")),
+}
+
+# Registro de modelos Whisper. Cada variante se carga de forma perezosa desde
+# safetensors y opcionalmente se convierte a int8 (cuantización dinámica) o bf16.
+# El modelo fine-tuned se descarga aparte (ver README) en la raíz del proyecto.
+ASR_FINETUNED_MODEL_DIR = BASE_DIR / "whisper-asr-model-V2"
+ASR_MODELS = {
+    "finetuned": {"PATH": str(ASR_FINETUNED_MODEL_DIR)},
+    "finetuned-int8": {"PATH": str(ASR_FINETUNED_MODEL_DIR), "QUANTIZATION": "int8"},
+    "large": {"PATH": "openai/whisper-large"},
+    "small": {"PATH": "openai/whisper-small"},
+    "small-int8": {"PATH": "openai/whisper-small", "QUANTIZATION": "int8"},
+    "base-int8": {"PATH": "openai/whisper-base", "QUANTIZATION": "int8"},
+    "tiny": {"PATH": "openai/whisper-tiny"},
+}
+ASR_DEFAULT_MODEL = os.environ.get(
+    "ASR_DEFAULT_MODEL", "finetuned" if ASR_FINETUNED_MODEL_DIR.exists() else "large"
+)
+# Modelo por endpoint: parciales en tiempo real, resultado final y subida/comparación
+ASR_ENDPOINT_MODELS = {
+    "partial": os.environ.get("ASR_PARTIAL_MODEL", ASR_DEFAULT_MODEL),
+    "final": os.environ.get("ASR_FINAL_MODEL", ASR_DEFAULT_MODEL),
+    "upload": os.environ.get("ASR_UPLOAD_MODEL", ASR_DEFAULT_MODEL),
+}
+
+# Perfiles de decodificación de Whisper. TEMPERATURES con más de un valor activa
+# el fallback de temperatura; MAX_TIME es el presupuesto (s) de cada pasada.
+# final y batch mantienen la decodificación original (beam 5, temperatura 0); el
+# fallback es opcional: ASR_FINAL_PROFILE=final-fallback o profile=final-fallback.
+ASR_DECODING_PROFILES = {
+    "partial": {"NUM_BEAMS": 1, "MAX_LENGTH": 224, "TEMPERATURES": [0.0], "MAX_TIME": 3.0},
+    "final": {"NUM_BEAMS": 5, "MAX_LENGTH": 448, "TEMPERATURES": [0.0], "MAX_TIME": 30.0},
+    "batch": {"NUM_BEAMS": 5, "MAX_LENGTH": 448, "TEMPERATURES": [0.0], "MAX_TIME": 60.0},
+    "final-fallback": {"NUM_BEAMS": 5, "MAX_LENGTH": 448, "TEMPERATURES": [0.0, 0.2, 0.4, 0.6], "MAX_TIME": 30.0},
+    # Voraz: admite decodificación especulativa (ASR_SPECULATIVE)
+    "final-greedy": {"NUM_BEAMS": 1, "MAX_LENGTH": 448, "TEMPERATURES": [0.0], "MAX_TIME": 30.0},
+    # Respuestas con ``stream=1``: solo la búsqueda voraz emite el texto a medida que se genera
+    "stream": {"NUM_BEAMS": 1, "MAX_LENGTH": 448, "TEMPERATURES": [0.0], "MAX_TIME": 30.0},
+}
+# Perfil por endpoint y límites de los ajustes que puede pedir un cliente
+ASR_ENDPOINT_PROFILES = {
+    "partial": os.environ.get("ASR_PARTIAL_PROFILE", "partial"),
+    "final": os.environ.get("ASR_FINAL_PROFILE", "final"),
+    "upload": os.environ.get("ASR_UPLOAD_PROFILE", "batch"),
+    "stream": os.environ.get("ASR_STREAM_PROFILE", "stream"),
+}
+ASR_REQUEST_PROFILES = ["partial", "final", "batch", "final-fallback", "final-greedy", "stream"]
+ASR_DECODING_LIMITS = {
+    "NUM_BEAMS": (1, 8),
+    "MAX_LENGTH": (16, 448),
+    "MAX_TIME": (0.5, 120.0),
+    "MAX_TEMPERATURES": 6,
+}
+
+# Backend de inferencia de Whisper: eager, compile (torch.compile), torchscript u
+# onnx (necesita onnxruntime); se puede fijar por modelo con ASR_MODELS[...]["BACKEND"].
+# INTRA_OP_THREADS 0 reparte los núcleos entre WEB_CONCURRENCY workers (todos en
+# el servidor de modelo). Si la salida no coincide con eager se usa eager.
+ASR_BACKEND = {
+    "BACKEND": os.environ.get("ASR_BACKEND", "eager"),
+    "INTRA_OP_THREADS": int(os.environ.get("ASR_INTRA_OP_THREADS", "0")),
+    "INTER_OP_THREADS": int(os.environ.get("ASR_INTER_OP_THREADS", "1")),
+    "PARITY_CHECK": os.environ.get("ASR_BACKEND_PARITY_CHECK", "True") == "True",
+    "PARITY_TOLERANCE": float(os.environ.get("ASR_BACKEND_PARITY_TOLERANCE", "1e-3")),
+    "EXPORT_DIR": os.environ.get("ASR_BACKEND_EXPORT_DIR", str(BASE_DIR / "exported")),
+    "WARMUP_ON_START": os.environ.get("ASR_WARMUP_ON_START", "False") == "True",
+}
+
+# Decodificación especulativa: DRAFT_MODEL (del registro, mismo tokenizer) propone
+# NUM_ASSISTANT_TOKENS tokens y el modelo grande los verifica. Solo con perfiles
+# voraces: por defecto solo ``stream``; para los finales, ASR_FINAL_PROFILE=final-greedy.
+# La salida no cambia; al arrancar se avisa de los endpoints donde no se aplica.
+ASR_SPECULATIVE = {
+    "ENABLED": os.environ.get("ASR_SPECULATIVE", "False") == "True",
+    "DRAFT_MODEL": os.environ.get("ASR_DRAFT_MODEL", "tiny"),
+    "NUM_ASSISTANT_TOKENS": int(os.environ.get("ASR_NUM_ASSISTANT_TOKENS", "5")),
+}
+
+# Servidor de modelo compartido (``manage.py runmodelserver``), solo en el mismo
+# host que los workers web: en Heroku cada tipo de proceso corre en su propio
+# dyno. Si ADDRESS está vacío (por defecto), cada proceso carga el modelo la
+# primera vez que lo necesita. AUTHKEY es obligatoria cuando se usa el servidor.
+ASR_MODEL_SERVER = {
+    "ADDRESS": os.environ.get("ASR_MODEL_SERVER_ADDRESS", ""),
+    "AUTHKEY": os.environ.get("ASR_MODEL_SERVER_AUTHKEY", ""),
+    "TIMEOUT": float(os.environ.get("ASR_MODEL_SERVER_TIMEOUT", "300")),
+}
+
+# Detección de voz antes de ambos reconocedores. BACKEND es la ruta a un callable
+# ``(samples, sample_rate) -> [(start, end), ...]``; vacío usa el detector por energía.
+ASR_VAD = {
+    "ENABLED": os.environ.get("ASR_VAD_ENABLED", "True") == "True",
+    "BACKEND": os.environ.get("ASR_VAD_BACKEND", ""),
+}
+
+# Caché de transcripciones (hash del PCM + motor + modelo + parámetros).
+# DISK_DIR vacío desactiva el nivel en disco.
+ASR_CACHE = {
+    "ENABLED": os.environ.get("ASR_CACHE_ENABLED", "True") == "True",
+    "MAX_ENTRIES": int(os.environ.get("ASR_CACHE_MAX_ENTRIES", "256")),
+    "DISK_DIR": os.environ.get("ASR_CACHE_DIR", ""),
+    "DISK_MAX_BYTES": int(os.environ.get("ASR_CACHE_DISK_MAX_BYTES", str(256 * 2**20))),
+}
+
+# Ejecución concurrente de los motores: hilos del pool y timeout (s) por motor
+ASR_ENGINE_WORKERS = int(os.environ.get("ASR_ENGINE_WORKERS", "8"))
+# Hilos para las llamadas de WebSocket/SSE que reparten trabajo en el pool de motores
+ASR_REQUEST_WORKERS = int(os.environ.get("ASR_REQUEST_WORKERS", "16"))
+ASR_ENGINE_TIMEOUTS = {
+    "whisper": float(os.environ.get("ASR_WHISPER_TIMEOUT", "300")),
+    "speech": float(os.environ.get("ASR_GOOGLE_TIMEOUT", "30")),
+}
+
+# Decodificador ffmpeg persistente por sesión de tiempo real. Se cierra tras
+# IDLE_TIMEOUT s sin chunks; como máximo MAX_DECODERS procesos por worker.
+ASR_STREAM_DECODER = {
+    "FFMPEG": os.environ.get("ASR_FFMPEG", "ffmpeg"),
+    "IDLE_TIMEOUT": float(os.environ.get("ASR_DECODER_IDLE_TIMEOUT", "60")),
+    "MAX_DECODERS": int(os.environ.get("ASR_MAX_DECODERS", "64")),
+    "SETTLE_MS": float(os.environ.get("ASR_DECODER_SETTLE_MS", "40")),
+    "MAX_WAIT_MS": float(os.environ.get("ASR_DECODER_MAX_WAIT_MS", "500")),
+}
+
+# Almacenamiento de sesiones en tiempo real. Las sesiones sin actividad por TTL
+# segundos se borran (revisión cada GC_INTERVAL s); al superar MAX_TOTAL_BYTES se
+# borran las más antiguas. KEEP_PARTS guarda además cada chunk por separado.
+ASR_SESSIONS = {
+    "DIR": os.environ.get("ASR_SESSIONS_DIR", "/tmp/asr_sessions"),
+    "TTL": float(os.environ.get("ASR_SESSION_TTL", "3600")),
+    "GC_INTERVAL": float(os.environ.get("ASR_SESSION_GC_INTERVAL", "60")),
+    "MAX_SESSION_BYTES": int(os.environ.get("ASR_MAX_SESSION_BYTES", str(200 * 2**20))),
+    "MAX_TOTAL_BYTES": int(os.environ.get("ASR_MAX_SESSIONS_BYTES", str(2 * 2**30))),
+    "KEEP_PARTS": os.environ.get("ASR_KEEP_PARTS", "False") == "True",
+    "RELEASE_ON_FINALIZE": os.environ.get("ASR_RELEASE_ON_FINALIZE", "True") == "True",
+}
+
+# Cola de trabajos asíncronos (``?async=1`` en whisper/ y realtime_finalize/).
+# WORKERS atienden todas las clases; INTERACTIVE_WORKERS solo los parciales. En 0
+# cada uno usa ASR_SCHEDULER["MAX_BATCH_SIZE"] hilos, así los trabajos concurrentes
+# pueden llenar un lote del planificador.
+ASR_JOBS = {
+    "WORKERS": int(os.environ.get("ASR_JOB_WORKERS", "0")),
+    "INTERACTIVE_WORKERS": int(os.environ.get("ASR_INTERACTIVE_WORKERS", "0")),
+}
+
+# Control de admisión de los parciales de Whisper: como máximo MAX_INFLIGHT en
+# curso por proceso y uno por sesión (el más nuevo reemplaza a los que esperan).
+# Sin lugar tras QUEUE_TIMEOUT_MS se devuelve el último parcial conocido.
+ASR_ADMISSION = {
+    "ENABLED": os.environ.get("ASR_ADMISSION_ENABLED", "True") == "True",
+    "MAX_INFLIGHT": int(os.environ.get("ASR_MAX_INFLIGHT_PARTIALS", "2")),
+    "QUEUE_TIMEOUT_MS": float(os.environ.get("ASR_ADMISSION_TIMEOUT_MS", "1500")),
+}
+
+# Log-mel incremental por sesión en tiempo real: buffer de CAPACITY_SECONDS de
+# frames por sesión, como máximo MAX_SESSIONS sesiones por proceso.
+ASR_FEATURES = {
+    "ENABLED": os.environ.get("ASR_INCREMENTAL_FEATURES", "True") == "True",
+    "MAX_SESSIONS": int(os.environ.get("ASR_FEATURE_SESSIONS", "32")),
+    "CAPACITY_SECONDS": float(os.environ.get("ASR_FEATURE_CAPACITY_SECONDS", "40")),
+}
+
+# Parciales en tiempo real con prefijo forzado (solo con perfil voraz): los
+# segmentos confirmados dentro de la ventana se reutilizan hasta que suman
+# WINDOW_TRIM_SECONDS; el texto anterior va como prompt (PROMPT_TOKENS tokens).
+ASR_STREAMING = {
+    "PREFIX_REUSE": os.environ.get("ASR_PREFIX_REUSE", "True") == "True",
+    "WINDOW_TRIM_SECONDS": float(os.environ.get("ASR_WINDOW_TRIM_SECONDS", "10")),
+    "PROMPT_TOKENS": int(os.environ.get("ASR_PROMPT_TOKENS", "128")),
+}
+
+# Métricas Prometheus en /asr/metrics/ y trace id por petición (cabecera X-Trace-Id)
+ASR_METRICS = {
+    "ENABLED": os.environ.get("ASR_METRICS_ENABLED", "True") == "True",
+    "TRACE_IDS": os.environ.get("ASR_TRACE_IDS", "True") == "True",
+}
+
+# Logs del paquete asr con el trace id de la petición (nivel con ASR_LOG_LEVEL)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {"trace_id": {"()": "asr.metrics.TraceIdFilter"}},
+    "formatters": {
+        "asr": {"format": "%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"},
+    },
+    "handlers": {
+        "asr_console": {"class": "logging.StreamHandler", "filters": ["trace_id"], "formatter": "asr"},
+    },
+    "loggers": {
+        "asr": {"handlers": ["asr_console"], "level": os.environ.get("ASR_LOG_LEVEL", "INFO"), "propagate": False},
+    },
+}
+
+# Google incremental en tiempo real: solo se envían los segmentos de voz terminados
+# (END_SILENCE_MS de silencio después), en paralelo y por conexiones reutilizadas.
+# URL permite apuntar a un servidor local de prueba.
+ASR_GOOGLE = {
+    "INCREMENTAL": os.environ.get("ASR_GOOGLE_INCREMENTAL", "True") == "True",
+    "URL": os.environ.get("ASR_GOOGLE_URL", "http://www.google.com/speech-api/v2/recognize"),
+    "KEY": os.environ.get("ASR_GOOGLE_KEY", ""),
+    "LANGUAGE": os.environ.get("ASR_GOOGLE_LANGUAGE", "es-ES"),
+    "WORKERS": int(os.environ.get("ASR_GOOGLE_WORKERS", "4")),
+    "TIMEOUT": float(os.environ.get("ASR_GOOGLE_REQUEST_TIMEOUT", "10")),
+    "END_SILENCE_MS": int(os.environ.get("ASR_GOOGLE_END_SILENCE_MS", "500")),
+    "MAX_SEGMENT_SECONDS": float(os.environ.get("ASR_GOOGLE_MAX_SEGMENT_SECONDS", "15")),
+}